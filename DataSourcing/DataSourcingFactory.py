@@ -1,6 +1,55 @@
 from FileStorage import FileStorage
-from household_surveys.HouseholdSurveys import HouseholdSurveysApi
-from household_surveys.HouseholdSurveysProcessor import HouseholdSurveysProcessor
+import importlib
+import subprocess
+import sys
+import time
+
+# Constants
+# Each command names the module and class it runs, so the module is only imported when the command is chosen.
+# The budget is the number of seconds importing the module may take from a cold start.
+COMMANDS = {
+    '2': {
+        'description': 'Retrieving raw household food security survey data for the United States.',
+        'module': 'household_surveys.HouseholdSurveys',
+        'class': 'HouseholdSurveysApi',
+        'method': 'retrieve_survey_data',
+        'uses_s3': True,
+        'import_time_budget': 1.0
+    },
+    '3': {
+        'description': 'Processing raw household food security survey data for the United States.',
+        'module': 'household_surveys.HouseholdSurveysProcessor',
+        'class': 'HouseholdSurveysProcessor',
+        'method': 'process_survey_data',
+        'uses_s3': True,
+        'import_time_budget': 1.5
+    },
+    '4': {
+        'description': 'Retrieving raw household food security survey data for the global countries.',
+        'module': 'GlobalHouseholdSurveyData',
+        'class': 'GlobalHouseholdSurveys',
+        'method': 'retrieve_survey_data',
+        'uses_s3': False,
+        'import_time_budget': 1.0
+    },
+    '6': {
+        'description': 'Retrieving raw world development indicator data.',
+        'module': 'wdi_indicators.WDIIndicators',
+        'class': 'WDIIndicators',
+        'method': 'retrieve_wdi_indicator_data',
+        'uses_s3': True,
+        'import_time_budget': 1.0
+    },
+    '7': {
+        'description': 'Retrieving raw global covid lockdown data.',
+        'module': 'lockdown_data.GlobalCovidLockdownData',
+        'class': 'GlobalCovidLockdownData',
+        'method': 'retrieve_lockdown_data',
+        'uses_s3': True,
+        'import_time_budget': 1.0
+    }
+}
+
 
 class DataSourcingFactory:
     def __init__(self):
@@ -10,16 +59,67 @@ class DataSourcingFactory:
         if user_input == '1':
             print('Retrieving raw covid data for the United States.')
             print('Fix later')
-        elif user_input == '2':
-            print('Retrieving raw household food security survey data for the United States.')
-            household_survey_api = HouseholdSurveysApi(self._file_storage)
-            household_survey_api.retrieve_survey_data()
-        elif user_input == '3':
-            print('Processing raw household food security survey data for the United States.')
-            household_survey_processor = HouseholdSurveysProcessor(self._file_storage)
-            household_survey_processor.process_survey_data()
+        elif user_input == '5':
+            print('Processing raw household food security survey data for the global countries.')
+            print('Fix later')
+        elif user_input in COMMANDS:
+            command = COMMANDS[user_input]
+            print(command['description'])
+            data_sourcing_class = self.__import_command(command)
+            if command['uses_s3']:
+                import S3Api
+                instance = data_sourcing_class(self._file_storage, S3Api.S3Api())
+            else:
+                instance = data_sourcing_class(self._file_storage)
+            getattr(instance, command['method'])()
         elif user_input == 'q':
             print('Quitting the program...')
             return -1
         else:
-            print('Invalid input. Please enter a number from the data or q to quit the program.\n')
\ No newline at end of file
+            print('Invalid input. Please enter a number from the data or q to quit the program.\n')
+
+    def __import_command(self, command):
+        """Imports the class run by a command, reporting the import time against the command's budget
+
+        Parameters
+        ----------
+        :param command: Dictionary, Required
+            The command
+
+        ----------
+        """
+        start = time.perf_counter()
+        module = importlib.import_module(command['module'])
+        import_time = time.perf_counter() - start
+        print(f'Imported {command["module"]} in {import_time:.2f}s (budget {command["import_time_budget"]:.2f}s)')
+        if import_time > command['import_time_budget']:
+            print('Warning: the import time of', command['module'], 'is over its budget')
+        return getattr(module, command['class'])
+
+    def report_import_times(self):
+        """Measures the cold import time of every command in a fresh interpreter and compares it to the budget
+
+        Returns
+        -------
+        :return: Boolean
+            Whether every command is within its budget
+
+        -------
+        """
+        within_budget = True
+        for user_input, command in COMMANDS.items():
+            measurement = ('import importlib, time; start = time.perf_counter(); '
+                           f'importlib.import_module("{command["module"]}"); print(time.perf_counter() - start)')
+            result = subprocess.run([sys.executable, '-c', measurement], capture_output=True, text=True)
+            if result.returncode != 0:
+                print(f'[{user_input}] {command["module"]} failed to import')
+                print(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else '')
+                within_budget = False
+                continue
+
+            import_time = float(result.stdout.strip().splitlines()[-1])
+            status = 'ok' if import_time <= command['import_time_budget'] else 'OVER BUDGET'
+            within_budget = within_budget and status == 'ok'
+            print(f'[{user_input}] {command["module"]}: {import_time:.2f}s '
+                  f'(budget {command["import_time_budget"]:.2f}s) {status}')
+        return within_budget
@@ -1,4 +1,3 @@
-import boto3
 import json
 import os
 from io import StringIO
@@ -18,6 +17,7 @@ class S3Location(Enum):
     NAIVE_BAYES_DATA_VISUALIZATIONS = 'naive_bayes_data_visualizations'
     SVM_DATA = 'svm_data'
     SVM_DATA_VISUALIZATIONS = 'svm_data_visualizations'
+    TOPIC_MODEL_DATA = 'topic_model_data'
 
 
 class S3Api:
@@ -35,6 +35,8 @@ class S3Api:
 
     def __init__(self):
         """ Create a new instance of the S3Api class"""
+        # boto3 is slow to import, so it is only loaded by the commands that upload to S3
+        import boto3
         self._s3_bucket = os.environ.get('S3_BUCKET')
         self._s3 = boto3.resource('s3')
 
@@ -89,7 +91,25 @@ class S3Api:
         ----------
         """
         s3_object = self._s3.Object(self._s3_bucket, f'{location.value}/{file_name}')
-        s3_object.put(Body=bytes(json.dumps(json_data).encode('utf-8')))
+        s3_object.put(Body=bytes(json.dumps(json_data, separators=(',', ':')).encode('utf-8')),
+                      ContentType='application/json')
+
+    def upload_javascript(self, javascript, file_name, location):
+        """Uploads a javascript file to S3
+
+        Parameters
+        ----------
+        :param javascript: String, Required
+            A javascript file, usually a library shared by the visualizations
+        :param file_name: String, Required
+            The name of the file used in S3
+        :param location: S3Location, Required
+            The directory where the file will be stored
+
+        ----------
+        """
+        s3_object = self._s3.Object(self._s3_bucket, f'{location.value}/{file_name}')
+        s3_object.put(Body=javascript, ContentType='application/javascript')
 
     def upload_svg(self, svg, file_name, location):
         """Uploads an svg to S3
@@ -1,24 +1,40 @@
 import pandas as pd
 import S3Api
-from sklearn.feature_extraction.text import CountVectorizer, ENGLISH_STOP_WORDS, TfidfVectorizer
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer, HashingVectorizer
 from sklearn.model_selection import train_test_split
 from sklearn.naive_bayes import MultinomialNB
 from sklearn.svm import LinearSVC, SVC
-from nltk.stem import WordNetLemmatizer
-import nltk
 from sklearn.metrics import ConfusionMatrixDisplay
 import matplotlib.pyplot as plt
 import glob
-from wordcloud import WordCloud, STOPWORDS
 import numpy as np
-
-words = set(nltk.corpus.words.words())
-lemmatizer = WordNetLemmatizer()
+import os
+from datetime import datetime
+from CustomSearchTextNormalizer import CustomSearchTextNormalizer
+from CustomSearchModelStore import CustomSearchModelStore
+from CustomSearchWordCloudGenerator import CustomSearchWordCloudGenerator
+from CustomSearchFeatureSelector import CustomSearchFeatureSelector
+from CustomSearchSampler import CustomSearchSampler
+from CustomSearchPdfIngestion import CustomSearchPdfIngestion
+
+# Constants
+# Whether to update the hashed naive bayes model with newly scraped documents instead of running the full analysis
+ONLINE_UPDATE = False
+# The size of the fixed, hashed feature space used by the online naive bayes model
+ONLINE_NB_FEATURES = 2 ** 18
+ONLINE_NB_PIPELINE = 'naive_bayes_online'
+# Whether to train the classifiers on the terms most associated with the topics instead of the full vocabulary
+FEATURE_SELECTION = True
+NUMBER_OF_SELECTED_FEATURES = 2000
+# How the terms are scored, either 'chi2' or 'mutual_info'
+FEATURE_SCORE_FUNCTION = 'chi2'
+# The number of documents in a fast, stratified sample run of the analysis, or None to use every document
+SAMPLE_SIZE = None
 
 
 class CustomSearchNB_SVM:
 
-    def __init__(self, file_storage, s3_api):
+    def __init__(self, file_storage, s3_api, sampler=None):
         """ Create a new instance of the CustomSearchNB_SVM class
 
         Parameters
@@ -27,18 +43,21 @@ class CustomSearchNB_SVM:
             The file storage class used to store raw/processed data
         :param s3_api: S3_API, Required
             The S3 api wrapper class used to store data in AWS S3
+        :param sampler: CustomSearchSampler, Optional
+            Runs the analysis on a stratified sample of the search data, writing to a separate output prefix
 
         ----------
         """
         self._file_storage = file_storage
         self._s3_api = s3_api
+        self._sampler = sampler
+        output_prefix = sampler.get_output_prefix() if sampler is not None else ''
         self.__processed_data_location = 'processed_data/search_results/cleaned_search_data.csv'
-        self.__processed_pdf_data_location = '/Users/sampastoriza/Documents/Programming/DataScienceDevelopment/DataSciencePortfolioCode/PandemicComparison/processed_data/corpus_data/cleaned_corpus_data.csv'
 
-        self.__naive_bayes_data_location = 'naive_bayes_data/search_results/'
-        self.__naive_bayes_data_visualizations_location = 'naive_bayes_data_visualizations/search_results/'
-        self.__svm_data_location = 'svm_data/search_results/'
-        self.__svm_data_visualizations_location = 'svm_data_visualizations/search_results/'
+        self.__naive_bayes_data_location = f'{output_prefix}naive_bayes_data/search_results/'
+        self.__naive_bayes_data_visualizations_location = f'{output_prefix}naive_bayes_data_visualizations/search_results/'
+        self.__svm_data_location = f'{output_prefix}svm_data/search_results/'
+        self.__svm_data_visualizations_location = f'{output_prefix}svm_data_visualizations/search_results/'
         self._file_storage.create_directory_if_not_exists(self.__naive_bayes_data_location)
         self._file_storage.create_directory_if_not_exists(self.__naive_bayes_data_visualizations_location)
         self._file_storage.create_directory_if_not_exists(self.__svm_data_location)
@@ -46,7 +65,12 @@ class CustomSearchNB_SVM:
         self._additional_stop_words = ['title', 'journal', 'volume', 'author', 'scholar', 'article', 'issue', 'food',
                                        'hunger', 'people', 'million', 'world', 'security', 'insecurity', 'covid',
                                        'locust', 'drought', 'ebola']
-        self._defined_stop_words = set(ENGLISH_STOP_WORDS.union(self._additional_stop_words))
+        self._normalizer = CustomSearchTextNormalizer(self._additional_stop_words)
+        self._model_store = CustomSearchModelStore(file_storage, f'{output_prefix}model_data/search_results/')
+        self._wordcloud_generator = CustomSearchWordCloudGenerator()
+        self._feature_selector = CustomSearchFeatureSelector(
+            file_storage, NUMBER_OF_SELECTED_FEATURES, FEATURE_SCORE_FUNCTION,
+            f'{output_prefix}model_data/search_results/selected_vocabulary/') if FEATURE_SELECTION else None
 
     def filter_non_english_words(self, corpus):
         """ Filters, lowercases, and lemmatizes non english words using the nltk word list.
@@ -69,22 +93,27 @@ class CustomSearchNB_SVM:
         -------
         """
 
-        filtered_vocabulary = [lemmatizer.lemmatize(w.lower()) for w in nltk.wordpunct_tokenize(corpus) if
-                               w.lower() in words]
-        filtered_vocabulary = [w for w in filtered_vocabulary if len(w) > 2 and w not in self._defined_stop_words]
-        return " ".join(filtered_vocabulary)
+        return self._normalizer.filter_non_english_words(corpus)
 
     def run_analysis(self):
         processed_df = pd.read_csv(self.__processed_data_location, index_col=False)
-        processed_pdf_df = pd.read_csv(self.__processed_pdf_data_location, index_col=False)
-        df = pd.concat([processed_df, processed_pdf_df], ignore_index=True)
+        df = CustomSearchPdfIngestion.combine_with_pdf_corpus(self._file_storage, processed_df)
+        if self._sampler is not None:
+            df = self._sampler.sample(df)
         df['text'] = df['text'].apply(self.filter_non_english_words)
         self.visualize_processed_search_data(df)
 
         labels = list(set(df['topic']))
         print('Labels', labels)
 
-        vectorizer = CountVectorizer()
+        # The split is made before vectorizing so the terms are only selected using the training documents
+        train_rows, test_rows = train_test_split(np.arange(df.shape[0]), test_size=0.3, random_state=123)
+        vocabulary = None
+        if self._feature_selector is not None:
+            vocabulary = self._feature_selector.select_vocabulary(df['text'].iloc[train_rows],
+                                                                  df['topic'].iloc[train_rows])
+
+        vectorizer = CountVectorizer(vocabulary=vocabulary)
         v = vectorizer.fit_transform(df['text'])
         vocab = vectorizer.get_feature_names_out()
         values = v.toarray()
@@ -96,13 +125,13 @@ class CustomSearchNB_SVM:
         v_df.to_csv(file_path, index=False)
         print('Wrote labeled dataframe to csv')
 
-        train_df, test_df = train_test_split(v_df, test_size=0.3)
+        train_df, test_df = v_df.iloc[train_rows], v_df.iloc[test_rows]
         train_df.to_csv(f'{self.__naive_bayes_data_location}training_set_count.csv', index=False)
         train_df.to_csv(f'{self.__naive_bayes_data_location}testing_set_count.csv', index=False)
         print('Split data into training and testing sets')
         self.__run_naive_bayes_analysis(train_df, test_df, vectorizer)
 
-        vectorizer = TfidfVectorizer()
+        vectorizer = TfidfVectorizer(vocabulary=vocabulary)
         v = vectorizer.fit_transform(df['text'])
         vocab = vectorizer.get_feature_names_out()
         values = v.toarray()
@@ -114,10 +143,10 @@ class CustomSearchNB_SVM:
         v_df.to_csv(file_path, index=False)
         print('Wrote labeled dataframe to csv')
 
-        train_df, test_df = train_test_split(v_df, test_size=0.3)
+        train_df, test_df = v_df.iloc[train_rows], v_df.iloc[test_rows]
         train_df.to_csv(f'{self.__svm_data_location}training_set_tfidf.csv', index=False)
         train_df.to_csv(f'{self.__svm_data_location}testing_set_tfidf.csv', index=False)
-        self.__run_svm_analysis(train_df, test_df)
+        self.__run_svm_analysis(train_df, test_df, vectorizer)
 
     def __run_naive_bayes_analysis(self, train_df, test_df, vectorizer):
         print('Running Naive Bayes Analysis')
@@ -129,6 +158,7 @@ class CustomSearchNB_SVM:
 
         nb_model = MultinomialNB()
         nb_model.fit(train_df, train_labels)
+        self._model_store.save_pipeline('naive_bayes_count', self._normalizer, vectorizer, nb_model)
         nb_prediction = nb_model.predict(test_df)
 
         nb_confusion = pd.crosstab(test_labels, nb_prediction, rownames=['Actual'], colnames=['Predicted'], margins=True)
@@ -172,6 +202,85 @@ class CustomSearchNB_SVM:
         print('Model', nb_model.classes_)
 
 
+    def run_online_naive_bayes_update(self):
+        """
+        Updates the online naive bayes model with only the documents it has not been trained on yet.
+
+        The model uses a hashed feature space, so new documents never change the shape of the model and
+        partial_fit gives exactly the model that a full retrain on every document would.
+        """
+        processed_df = pd.read_csv(self.__processed_data_location, index_col=False)
+        df = CustomSearchPdfIngestion.combine_with_pdf_corpus(self._file_storage, processed_df)
+
+        if self._model_store.contains_pipeline(ONLINE_NB_PIPELINE):
+            # The model is updated in place, so it is loaded as a writable copy rather than memory mapped
+            pipeline = self._model_store.load_pipeline(ONLINE_NB_PIPELINE, mmap_mode=None)
+            vectorizer = pipeline['vectorizer']
+            nb_model = pipeline['model']
+            trained_links = pipeline['metadata']['trained_links']
+        else:
+            vectorizer = HashingVectorizer(n_features=ONLINE_NB_FEATURES, alternate_sign=False, norm=None)
+            nb_model = MultinomialNB()
+            trained_links = []
+
+        new_df = df[~df['link'].isin(set(trained_links))].drop_duplicates(subset=['link'])
+        if new_df.shape[0] == 0:
+            print('No new documents to train the online naive bayes model on')
+            return
+        print('Updating the online naive bayes model with', new_df.shape[0], 'new documents')
+
+        new_text = self._normalizer.normalize_documents(new_df['text'])
+        new_features = vectorizer.transform(new_text)
+        new_labels = new_df['topic']
+
+        if hasattr(nb_model, 'classes_'):
+            unknown_topics = set(new_labels) - set(nb_model.classes_)
+            if len(unknown_topics) > 0:
+                raise ValueError(f'The online naive bayes model cannot learn new topics {unknown_topics}, '
+                                 f'run the full analysis to retrain it')
+            previous_probabilities = np.exp(nb_model.feature_log_prob_)
+            nb_model.partial_fit(new_features, new_labels)
+        else:
+            previous_probabilities = None
+            nb_model.partial_fit(new_features, new_labels, classes=sorted(set(df['topic'])))
+
+        trained_links = trained_links + new_df['link'].to_list()
+        self._model_store.save_pipeline(ONLINE_NB_PIPELINE, self._normalizer, vectorizer, nb_model,
+                                        dense_input=False, metadata={'trained_links': trained_links})
+
+        if previous_probabilities is not None:
+            self.__report_online_naive_bayes_drift(previous_probabilities, nb_model, new_labels)
+
+    def __report_online_naive_bayes_drift(self, previous_probabilities, nb_model, new_labels):
+        """Reports how far each class's feature probabilities moved after an online update
+
+        Parameters
+        ----------
+        :param previous_probabilities: np.array, Required
+            The per class feature probabilities before the update
+        :param nb_model: MultinomialNB, Required
+            The updated naive bayes model
+        :param new_labels: pd.Series, Required
+            The topics of the documents used in the update
+
+        ----------
+        """
+        current_probabilities = np.exp(nb_model.feature_log_prob_)
+        absolute_change = np.abs(current_probabilities - previous_probabilities)
+        drift_df = pd.DataFrame({
+            'Date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'Class': nb_model.classes_,
+            'NewDocuments': [int((new_labels == label).sum()) for label in nb_model.classes_],
+            # Total variation distance between the old and new feature distributions of each class
+            'TotalVariation': 0.5 * absolute_change.sum(axis=1),
+            'MaxFeatureChange': absolute_change.max(axis=1)
+        })
+        print('Drift in per class feature probabilities')
+        print(drift_df)
+
+        file_path = f'{self.__naive_bayes_data_location}online_nb_drift.csv'
+        drift_df.to_csv(file_path, mode='a', header=not os.path.exists(file_path), index=False)
+
     def __plot_variable_importance(self, x, y, label):
         plt.figure()
         plt.barh(x, y)
@@ -181,7 +290,7 @@ class CustomSearchNB_SVM:
         plt.tight_layout()
         plt.savefig(f'{self.__naive_bayes_data_visualizations_location}feature_importance_nb_{label}.png')
 
-    def __run_svm_analysis(self, train_df, test_df):
+    def __run_svm_analysis(self, train_df, test_df, vectorizer):
         print('Running SVM Analysis')
         train_labels = train_df['LABEL']
         train_df = train_df.drop(['LABEL'], axis=1)
@@ -192,6 +301,7 @@ class CustomSearchNB_SVM:
         print('Running Linear Kernel')
         svm_model_optimal = SVC(C=10, kernel='linear')
         svm_model_optimal.fit(train_df, train_labels)
+        self._model_store.save_pipeline('svm_linear_tfidf', self._normalizer, vectorizer, svm_model_optimal)
         svm_prediction = svm_model_optimal.predict(test_df)
 
         svm_confusion = pd.crosstab(test_labels, svm_prediction, rownames=['Actual'], colnames=['Predicted'], margins=True)
@@ -205,6 +315,7 @@ class CustomSearchNB_SVM:
         print('Running Radial Basis Kernel')
         svm_model = SVC(C=10, kernel='rbf', gamma="auto")
         svm_model.fit(train_df, train_labels)
+        self._model_store.save_pipeline('svm_rbf_tfidf', self._normalizer, vectorizer, svm_model)
         svm_prediction = svm_model.predict(test_df)
 
         svm_confusion = pd.crosstab(test_labels, svm_prediction, rownames=['Actual'], colnames=['Predicted'], margins=True)
@@ -218,6 +329,7 @@ class CustomSearchNB_SVM:
         print('Running Polynomial Kernel')
         svm_model = SVC(C=20000, kernel='poly', degree=3)
         svm_model.fit(train_df, train_labels)
+        self._model_store.save_pipeline('svm_poly_tfidf', self._normalizer, vectorizer, svm_model)
         svm_prediction = svm_model.predict(test_df)
 
         svm_confusion = pd.crosstab(test_labels, svm_prediction, rownames=['Actual'], colnames=['Predicted'], margins=True)
@@ -231,6 +343,7 @@ class CustomSearchNB_SVM:
         print('Running Sigmoid Kernel')
         svm_model = SVC(C=5, kernel='sigmoid')
         svm_model.fit(train_df, train_labels)
+        self._model_store.save_pipeline('svm_sigmoid_tfidf', self._normalizer, vectorizer, svm_model)
         svm_prediction = svm_model.predict(test_df)
 
         svm_confusion = pd.crosstab(test_labels, svm_prediction, rownames=['Actual'], colnames=['Predicted'], margins=True)
@@ -245,26 +358,7 @@ class CustomSearchNB_SVM:
     def visualize_processed_search_data(self, processed_df):
         """ Visualizes the processed search data"""
         print('Visualizing processed and combined search data')
-        for group in processed_df.groupby(by=['topic']):
-            text_data = " ".join(group[1]['text'].to_list())
-            topic = group[0]
-            print('Generating wordcloud for topic', topic)
-            wordcloud = WordCloud(stopwords=STOPWORDS, background_color="white", collocations=False).generate(text_data)
-            print('Saving image to file')
-            # Save as an svg for scaling purposes
-            wordcloud_svg = wordcloud.to_svg(embed_font=True)
-            f = open(f'{self.__naive_bayes_data_visualizations_location}{topic}_wordcloud.svg', "w+")
-            f.write(wordcloud_svg)
-            f.close()
-
-            vectorizer = CountVectorizer(stop_words="english")
-            matrix = vectorizer.fit_transform(group[1]['text'])
-            feature_names = vectorizer.get_feature_names_out()
-            values = matrix.toarray()
-            v_df = pd.DataFrame(values, columns=feature_names)
-            sums = matrix.sum(axis=0).tolist()[0]
-            sorted_frequencies = sorted(zip(feature_names, sums), key=lambda x: -x[1])
-            v_df.to_csv(f'{self.__naive_bayes_data_location}{topic}_vectorized.csv')
+        self._wordcloud_generator.generate(processed_df, self.__naive_bayes_data_visualizations_location, self.__naive_bayes_data_location)
 
     def store_in_s3(self):
         png_visualizations = list(glob.iglob(f'{self.__naive_bayes_data_visualizations_location}/**/*.png', recursive=True))
@@ -325,6 +419,11 @@ if __name__ == '__main__':
     load_dotenv()
     fs = FileStorage()
 
-    search_nb_svm = CustomSearchNB_SVM(fs, S3Api.S3Api())
-    search_nb_svm.run_analysis()
-    search_nb_svm.store_in_s3()
\ No newline at end of file
+    sampler = CustomSearchSampler(SAMPLE_SIZE) if SAMPLE_SIZE is not None else None
+    search_nb_svm = CustomSearchNB_SVM(fs, S3Api.S3Api(), sampler)
+    if ONLINE_UPDATE:
+        search_nb_svm.run_online_naive_bayes_update()
+    else:
+        search_nb_svm.run_analysis()
+        if sampler is None:
+            search_nb_svm.store_in_s3()
\ No newline at end of file
@@ -14,13 +14,18 @@ from sklearn.cluster import DBSCAN
 import os
 import glob
 import codecs
+from CustomSearchConsensusClustering import CustomSearchConsensusClustering
+from CustomSearchSampler import CustomSearchSampler
+from CustomSearchPdfIngestion import CustomSearchPdfIngestion
 
 STORE_DATA = True
+# The number of documents in a fast, stratified sample run of the clustering, or None to use every document
+SAMPLE_SIZE = None
 
 
 class CustomSearchClustering:
 
-    def __init__(self, file_storage, s3_api):
+    def __init__(self, file_storage, s3_api, sampler=None):
         """ Create a new instance of the CustomSearchData class
 
         Parameters
@@ -29,25 +34,36 @@ class CustomSearchClustering:
             The file storage class used to store raw/processed data
         :param s3_api: S3_API, Required
             The S3 api wrapper class used to store data in AWS S3
+        :param sampler: CustomSearchSampler, Optional
+            Runs the clustering on a stratified sample of the search data, writing to a separate output prefix
 
         ----------
         """
         self._file_storage = file_storage
         self._s3_api = s3_api
+        self._sampler = sampler
+        output_prefix = sampler.get_output_prefix() if sampler is not None else ''
         self.__processed_data_location = 'processed_data/search_results/cleaned_search_data.csv'
-        self.__processed_pdf_data_location = '/Users/sampastoriza/Documents/Programming/DataScienceDevelopment/DataSciencePortfolioCode/PandemicComparison/processed_data/corpus_data/cleaned_corpus_data.csv'
 
-        self.__clustered_visualizations_location = 'clustered_data_visualizations/search_results'
-        self.__clustered_data_location = 'clustered_data/search_results'
+        self.__combined_data_location = f'{output_prefix}processed_data/search_results/combined_search_data.csv'
+        self.__clustered_visualizations_location = f'{output_prefix}clustered_data_visualizations/search_results'
+        self.__clustered_data_location = f'{output_prefix}clustered_data/search_results'
+        for directory in ['elbow_method', 'silhouette_method', 'clustered_2d', 'clustered_3d', 'silhouette',
+                          'dendrogram']:
+            self._file_storage.create_directory_if_not_exists(f'{self.__clustered_visualizations_location}/{directory}/')
+        for directory in ['clustering_statistics', 'elbow_method', 'silhouette_method']:
+            self._file_storage.create_directory_if_not_exists(f'{self.__clustered_data_location}/{directory}/')
         self._additional_stop_words = ['title', 'journal', 'volume', 'author', 'scholar', 'article', 'issue']
         self._other_k_values = [3, 4, 6, 8, 10]
 
     def cluster_search_data(self):
         self.__clean_clustered_visualizations()
         processed_df = pd.read_csv(self.__processed_data_location, index_col=False)
-        processed_pdf_df = pd.read_csv(self.__processed_pdf_data_location, index_col=False)
-        processed_df = pd.concat([processed_df, processed_pdf_df], ignore_index=True)
-        processed_df.to_csv('processed_data/search_results/combined_search_data.csv', index=False)
+        processed_df = CustomSearchPdfIngestion.combine_with_pdf_corpus(self._file_storage, processed_df)
+        if self._sampler is not None:
+            processed_df = self._sampler.sample(processed_df)
+        self._file_storage.create_directory_if_not_exists(self.__combined_data_location)
+        processed_df.to_csv(self.__combined_data_location, index=False)
         print(processed_df.head())
 
         stop_words = ENGLISH_STOP_WORDS.union(self._additional_stop_words)
@@ -95,6 +111,7 @@ class CustomSearchClustering:
         self.__cluster(df_normalized, df, normalized_label, 'Normalized', vectorizer_type)
         pca_analysis_results_n = self.__run_pca_analysis(df_normalized, df)
         self.__run_density_clustering(df_normalized, df, normalized_label)
+        self.__run_consensus_clustering(df_normalized, df, normalized_label)
         df['PC0_N'] = pca_analysis_results_n['PC0']
         df['PC1_N'] = pca_analysis_results_n['PC1']
         df['PC2_N'] = pca_analysis_results_n['PC2']
@@ -113,6 +130,7 @@ class CustomSearchClustering:
         self.__plot_clusters(df, f'{normalized_label}_8_hierarchical', 'PC0_N', 'PC1_N', 'PC2_N', f'Plot of normalized clusters using Hiearchical Clustering ({vectorizer_type}) (k=8)')
         self.__plot_clusters(df, f'{normalized_label}_10_hierarchical', 'PC0_N', 'PC1_N', 'PC2_N', f'Plot of normalized clusters using Hiearchical Clustering ({vectorizer_type}) (k=10)')
         self.__plot_clusters(df, f'{normalized_label}_density', 'PC0_N', 'PC1_N', 'PC2_N', f'Plot of normalized clusters using Density Scan ({vectorizer_type})')
+        self.__plot_clusters(df, f'{normalized_label}_consensus', 'PC0_N', 'PC1_N', 'PC2_N', f'Plot of normalized clusters using Consensus Clustering ({vectorizer_type})')
 
         df = df.drop(columns=['text'])
         df.to_csv(f'{self.__clustered_data_location}/clustered_search_data.csv', index=False)
@@ -288,6 +306,15 @@ class CustomSearchClustering:
         input_df[f'{clustering_type}_density_label'] = associated_labels
         print('Number of clusters for density', len(set(associated_labels)))
 
+    def __run_consensus_clustering(self, df, input_df, clustering_type):
+        print('Running consensus clustering')
+        label_columns = [column for column in input_df.columns
+                         if column.startswith(f'{clustering_type}_') and column.endswith('_label')]
+        print('Reconciling labelings', label_columns)
+        consensus_labels = CustomSearchConsensusClustering().cluster(
+            df, [input_df[column].to_numpy() for column in label_columns])
+        input_df[f'{clustering_type}_consensus_label'] = consensus_labels
+
     def store_clustered_search_data(self):
         print('Store processed survey data in S3')
 
@@ -326,18 +353,10 @@ if __name__ == '__main__':
     from FileStorage import FileStorage
     load_dotenv()
     fs = FileStorage()
-    fs.create_directory_if_not_exists('clustered_data_visualizations/search_results/elbow_method/')
-    fs.create_directory_if_not_exists('clustered_data_visualizations/search_results/silhouette_method/')
-    fs.create_directory_if_not_exists('clustered_data_visualizations/search_results/clustered_2d/')
-    fs.create_directory_if_not_exists('clustered_data_visualizations/search_results/clustered_3d/')
-    fs.create_directory_if_not_exists('clustered_data_visualizations/search_results/silhouette/')
-    fs.create_directory_if_not_exists('clustered_data_visualizations/search_results/dendrogram/')
-    fs.create_directory_if_not_exists('clustered_data/search_results/clustering_statistics/')
-    fs.create_directory_if_not_exists('clustered_data/search_results/elbow_method/')
-    fs.create_directory_if_not_exists('clustered_data/search_results/silhouette_method/')
-
-    search_clustering = CustomSearchClustering(fs, S3Api.S3Api())
+
+    sampler = CustomSearchSampler(SAMPLE_SIZE) if SAMPLE_SIZE is not None else None
+    search_clustering = CustomSearchClustering(fs, S3Api.S3Api(), sampler)
     search_clustering.cluster_search_data()
 
-    if STORE_DATA:
-        search_clustering.store_clustered_search_data()
\ No newline at end of file
+    if STORE_DATA and sampler is None:
+        search_clustering.store_clustered_search_data()
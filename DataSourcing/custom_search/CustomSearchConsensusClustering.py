@@ -0,0 +1,285 @@
+from sklearn.cluster import MiniBatchKMeans
+from scipy.sparse.csgraph import connected_components
+from scipy import sparse
+import numpy as np
+
+
+class CustomSearchConsensusClustering:
+    """
+    Reconciles many clusterings of the same documents into one consensus partition using evidence accumulation.
+
+    Each labeling votes for every pair of documents it places in the same cluster. Documents that every labeling
+    treats alike are first collapsed into atoms, and the co-association matrix (the fraction of votes for each pair)
+    is accumulated between atoms one block at a time, keeping only the pairs with at least one vote. Average linkage
+    is run on that sparse matrix, where a missing pair has a co-association of zero, so a cluster is only joined
+    by the documents it agrees with on average rather than by a chain of single strong pairs. The dendrogram is cut
+    at the number of clusters that lasts over the widest range of co-association thresholds (the lifetime
+    criterion). Clusters too small to count are labeled as noise (-1), like the noise of DBSCAN.
+    """
+
+    def __init__(self, min_cluster_fraction=0.01, number_of_restarts=10, k_range=range(2, 11), block_size=1000):
+        """ Create a new instance of the CustomSearchConsensusClustering class
+
+        Parameters
+        ----------
+        :param min_cluster_fraction: Number, Optional
+            The fraction of the documents a cluster needs (and at least two), smaller clusters are noise
+        :param number_of_restarts: Number, Optional
+            The number of randomly seeded k-means runs added to the given labelings
+        :param k_range: Range, Optional
+            The values of k the random restarts choose from
+        :param block_size: Number, Optional
+            The number of rows of the co-association matrix computed at once
+
+        ----------
+        """
+        self._min_cluster_fraction = min_cluster_fraction
+        self._number_of_restarts = number_of_restarts
+        self._k_range = list(k_range)
+        self._block_size = block_size
+
+    def cluster(self, df, labelings):
+        """Computes the consensus partition of the given labelings and the random restarts
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The vectorized documents, used for the random restarts
+        :param labelings: List, Required
+            The cluster labels of every document from each clustering. Noise (-1) never votes for a pair
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            The consensus cluster label of every document, where noise is -1
+
+        -------
+        """
+        labelings = [np.asarray(labels) for labels in labelings]
+        random_state = np.random.RandomState(123)
+        for restart in range(self._number_of_restarts):
+            k_value = random_state.choice(self._k_range)
+            print('Running random restart', restart + 1, 'with k =', k_value)
+            k_means = MiniBatchKMeans(n_clusters=k_value, n_init=1, random_state=random_state.randint(2 ** 31 - 1))
+            labelings.append(k_means.fit_predict(df))
+
+        atom_labels, atom_sizes, co_associations = self.__co_associate_atoms(labelings)
+        heights, merged_atoms = self.__average_linkage(atom_sizes, co_associations, len(labelings))
+        min_cluster_size = max(2, int(np.ceil(self._min_cluster_fraction * atom_labels.shape[0])))
+        number_of_merges, number_of_clusters = self.__longest_lived_cut(atom_sizes, heights, merged_atoms,
+                                                                        min_cluster_size)
+        print('Number of consensus clusters', number_of_clusters)
+
+        clusters = self.__replay_merges(atom_sizes.shape[0], merged_atoms[:number_of_merges])
+        _, clusters = np.unique(clusters, return_inverse=True)
+        cluster_sizes = np.bincount(clusters, weights=atom_sizes)
+        # Only the clusters large enough to count are numbered, the others are noise
+        kept = cluster_sizes >= min_cluster_size
+        cluster_labels = np.where(kept, np.cumsum(kept) - 1, -1)
+        return cluster_labels[clusters][atom_labels]
+
+    def __co_associate_atoms(self, labelings):
+        """Collapses the documents with the same labels into atoms and counts the votes for every pair of atoms
+
+        Parameters
+        ----------
+        :param labelings: List, Required
+            The cluster labels of every document from each clustering
+
+        ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The atom of every document, the number of documents in each atom, and a sparse atoms x atoms matrix of
+            the votes summed over the document pairs of each pair of atoms
+
+        -------
+        """
+        _, first_documents, atom_labels = np.unique(np.column_stack(labelings), axis=0, return_index=True,
+                                                    return_inverse=True)
+        atom_labels = atom_labels.ravel()
+        atom_sizes = np.bincount(atom_labels)
+        number_of_atoms = atom_sizes.shape[0]
+        indicator_columns = []
+        for labels in labelings:
+            labels = labels[first_documents]
+            clustered = labels >= 0
+            _, cluster_ids = np.unique(labels[clustered], return_inverse=True)
+            # Every document of an atom is in the same clusters, so each atom votes with its size
+            indicator_columns.append(sparse.csr_matrix(
+                (atom_sizes[clustered].astype(np.float64), (np.flatnonzero(clustered), cluster_ids)),
+                shape=(number_of_atoms, cluster_ids.max() + 1 if cluster_ids.size > 0 else 0)))
+        # One column per cluster of every labeling, so H @ H.T sums the votes of the document pairs of two atoms
+        indicators = sparse.hstack(indicator_columns).tocsr()
+        indicators_transposed = indicators.T.tocsc()
+        blocks = [indicators[start:start + self._block_size] @ indicators_transposed
+                  for start in range(0, number_of_atoms, self._block_size)]
+        co_associations = sparse.vstack(blocks).tocsr()
+        co_associations.setdiag(0)
+        co_associations.eliminate_zeros()
+        return atom_labels, atom_sizes, co_associations
+
+    @staticmethod
+    def __average_linkage(atom_sizes, co_associations, number_of_labelings):
+        """Runs average linkage on the sparse co-association matrix of the atoms with the nearest neighbor chain
+
+        Parameters
+        ----------
+        :param atom_sizes: np.array, Required
+            The number of documents in each atom
+        :param co_associations: sparse.csr_matrix, Required
+            The votes summed over the document pairs of each pair of atoms
+        :param number_of_labelings: Number, Required
+            The number of labelings that voted
+
+        ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The co-association of every merge from the highest to the lowest, and the atom of each side of the merge
+
+        -------
+        """
+        number_of_atoms = atom_sizes.shape[0]
+        # A cluster keeps the id of one of its atoms, and its row holds the votes summed towards atoms, which are
+        # mapped to their current cluster whenever the row is read
+        cluster_of_atom = np.arange(number_of_atoms)
+        members = {atom: np.array([atom]) for atom in range(number_of_atoms)}
+        sizes = atom_sizes.astype(np.float64)
+        rows = {atom: (co_associations.indices[co_associations.indptr[atom]:co_associations.indptr[atom + 1]],
+                       co_associations.data[co_associations.indptr[atom]:co_associations.indptr[atom + 1]])
+                for atom in range(number_of_atoms)}
+        active = set(range(number_of_atoms))
+        heights = []
+        merged_atoms = []
+        chain = []
+        while len(active) > 1:
+            if len(chain) == 0:
+                chain.append(next(iter(active)))
+            cluster = chain[-1]
+            neighbors, votes = rows[cluster]
+            neighbors = cluster_of_atom[neighbors]
+            outside = neighbors != cluster
+            neighbors, inverse = np.unique(neighbors[outside], return_inverse=True)
+            votes = np.bincount(inverse, weights=votes[outside], minlength=neighbors.shape[0])
+            rows[cluster] = (neighbors, votes)
+            if neighbors.shape[0] == 0:
+                # Nothing votes with the cluster anymore, so it is only merged at a co-association of zero
+                active.discard(cluster)
+                chain.pop()
+                continue
+
+            average_votes = votes / (sizes[cluster] * sizes[neighbors] * number_of_labelings)
+            nearest = neighbors[np.argmax(average_votes)]
+            if len(chain) > 1:
+                previous = np.searchsorted(neighbors, chain[-2])
+                # Ties go to the previous cluster of the chain, so the chain always ends in a reciprocal pair
+                if previous < neighbors.shape[0] and neighbors[previous] == chain[-2] and \
+                        average_votes[previous] >= average_votes.max():
+                    nearest = chain[-2]
+            if len(chain) > 1 and nearest == chain[-2]:
+                chain.pop()
+                chain.pop()
+                heights.append(average_votes.max())
+                merged_atoms.append((cluster, nearest))
+                # The smaller cluster is folded into the larger one, keeping the id of the larger one
+                kept, folded = (cluster, nearest) if members[cluster].shape[0] >= members[nearest].shape[0] \
+                    else (nearest, cluster)
+                cluster_of_atom[members[folded]] = kept
+                members[kept] = np.concatenate([members[kept], members.pop(folded)])
+                sizes[kept] += sizes[folded]
+                rows[kept] = tuple(np.concatenate(parts) for parts in zip(rows[kept], rows.pop(folded)))
+                active.discard(folded)
+            else:
+                chain.append(nearest)
+
+        heights = np.array(heights)
+        order = np.argsort(-heights, kind='stable')
+        return heights[order], np.array(merged_atoms, dtype=np.int64).reshape(-1, 2)[order]
+
+    @staticmethod
+    def __longest_lived_cut(atom_sizes, heights, merged_atoms, min_cluster_size):
+        """Finds the cut of the dendrogram whose number of clusters lasts over the widest range of thresholds
+
+        Parameters
+        ----------
+        :param atom_sizes: np.array, Required
+            The number of documents in each atom
+        :param heights: np.array, Required
+            The co-association of every merge from the highest to the lowest
+        :param merged_atoms: np.array, Required
+            The atom of each side of every merge
+        :param min_cluster_size: Number, Required
+            The number of documents a cluster needs to count
+
+        ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The number of merges to apply and the number of clusters they leave
+
+        -------
+        """
+        parents = np.arange(atom_sizes.shape[0])
+        sizes = atom_sizes.copy()
+
+        def find(atom):
+            while parents[atom] != atom:
+                parents[atom] = parents[parents[atom]]
+                atom = parents[atom]
+            return atom
+
+        # The partition after j merges holds for every threshold between the jth and the next merge
+        bounds = np.concatenate([[1.0], heights, [0.0]])
+        counts = np.zeros(heights.shape[0] + 1, dtype=np.int64)
+        counts[0] = np.count_nonzero(sizes >= min_cluster_size)
+        for merge, (first, second) in enumerate(merged_atoms):
+            first, second = find(first), find(second)
+            counts[merge + 1] = counts[merge] - (sizes[first] >= min_cluster_size) - \
+                (sizes[second] >= min_cluster_size) + (sizes[first] + sizes[second] >= min_cluster_size)
+            parents[second] = first
+            sizes[first] += sizes[second]
+        widths = bounds[:-1] - bounds[1:]
+
+        lifetimes = {}
+        for number_of_clusters, width in zip(counts, widths):
+            if number_of_clusters > 0:
+                lifetimes[number_of_clusters] = lifetimes.get(number_of_clusters, 0) + width
+        if len(lifetimes) == 0:
+            return 0, 0
+        # A single cluster is only the consensus when no threshold splits the documents
+        if len(lifetimes) > 1:
+            lifetimes.pop(1, None)
+        best_number_of_clusters = max(lifetimes, key=lambda k: (lifetimes[k], -k))
+        candidates = np.flatnonzero(counts == best_number_of_clusters)
+        return candidates[np.argmax(widths[candidates])], best_number_of_clusters
+
+    @staticmethod
+    def __replay_merges(number_of_atoms, merged_atoms):
+        """Applies merges to the atoms
+
+        Parameters
+        ----------
+        :param number_of_atoms: Number, Required
+            The number of atoms
+        :param merged_atoms: np.array, Required
+            The atom of each side of every merge to apply
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            The cluster of every atom
+
+        -------
+        """
+        links = sparse.csr_matrix((np.ones(merged_atoms.shape[0], dtype=np.int8),
+                                   (merged_atoms[:, 0], merged_atoms[:, 1])),
+                                  shape=(number_of_atoms, number_of_atoms))
+        return connected_components(links, directed=False)[1]
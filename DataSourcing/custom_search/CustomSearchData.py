@@ -1,6 +1,10 @@
-from googleapiclient.discovery import build
+import multiprocessing
+import threading
+import socket
 import json
+import time
 import requests
+import lxml.html
 from readability import Document
 import html2text
 import S3Api
@@ -8,12 +12,51 @@ import pandas as pd
 
 # Constants
 STORE_DATA = False
+# Whether to extract the text of pdf search results instead of skipping them
+INGEST_PDFS = True
+# The number of scraped articles classified together when a predictor is provided
+PREDICTION_BATCH_SIZE = 10
+# Limits on each scraped website, so a single link cannot stall the scraper or exhaust memory
+MAX_RESPONSE_BYTES = 5 * 1024 * 1024
+DOWNLOAD_DEADLINE = 30
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Pages longer than this, or that readability cannot parse within the timeout, use the paragraph extractor
+READABILITY_MAX_HTML_LENGTH = 1024 * 1024
+READABILITY_TIMEOUT = 10
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain')
+# The leading bytes of pdf, zip (docx/xlsx), png, gif and jpeg files
+BINARY_SIGNATURES = (b'%PDF', b'PK\x03\x04', b'\x89PNG', b'GIF8', b'\xff\xd8\xff')
+
+# The helper process running readability, started when first needed and killed when it runs out of time
+_readability_process = None
+_readability_connection = None
+_readability_lock = threading.Lock()
+
+
+def serve_readability(connection):
+    """Extracts the articles of the html received on the connection with readability. Runs in a helper process
+
+    Parameters
+    ----------
+    :param connection: multiprocessing.connection.Connection, Required
+        The connection the html is received on and the title and text, or the error, are sent back on
+
+    ----------
+    """
+    while True:
+        html = connection.recv()
+        try:
+            connection.send((CustomSearchData.extract_article_with_readability(html), None))
+        except Exception as error:
+            connection.send((None, error))
 
 
 class CustomSearchData:
     """Retrieves search data information from the Google Search API"""
 
-    def __init__(self, file_storage, s3_api):
+    def __init__(self, file_storage, s3_api, predictor=None, pipeline=None, pdf_ingestion=None):
         """ Create a new instance of the CustomSearchData class
 
         Parameters
@@ -22,11 +65,20 @@ class CustomSearchData:
             The file storage class used to store raw/processed data
         :param s3_api: S3_API, Required
             The S3 api wrapper class used to store data in AWS S3
+        :param predictor: CustomSearchPredictor, Optional
+            Classifies the scraped articles in batches while the results are being collected
+        :param pipeline: CustomSearchPipeline, Optional
+            Streams the search results through scraping, normalization and feature hashing concurrently
+        :param pdf_ingestion: CustomSearchPdfIngestion, Optional
+            Extracts the text of the pdf search results, which are otherwise skipped
 
         ----------
         """
         self._file_storage = file_storage
         self._s3_api = s3_api
+        self._predictor = predictor
+        self._pipeline = pipeline
+        self._pdf_ingestion = pdf_ingestion
 
     def search(self, number_of_queries, query, file_path, topic):
         """Utilizes the Google Search API to search for data given a query
@@ -42,8 +94,31 @@ class CustomSearchData:
 
         ----------
         """
-        results = []
         print(f'Retrieving {number_of_queries} items from google search')
+        if self._pipeline is not None:
+            # Each page of results is scraped and processed while the next page is being retrieved
+            print('Streaming websites through the pipeline')
+            self._pipeline.run(self.iterate_search_results(number_of_queries, query), file_path, topic)
+            return
+
+        results = list(self.iterate_search_results(number_of_queries, query))
+        print('Scraping websites for data')
+        self.scrape_google_results(results, file_path, topic)
+
+    def iterate_search_results(self, number_of_queries, query):
+        """Yields the search results from the Google Search API one page at a time
+
+        Parameters
+        ----------
+        :param number_of_queries: Number, Required
+            The number of queries to run against the Google Search API
+        :param query: String, Required
+            The query to run against the Google Search API
+
+        ----------
+        """
+        # The google api client is slow to import, and is not needed by the processes that only scrape
+        from googleapiclient.discovery import build
         for i in range(0, number_of_queries, 10):
             print('Searching for the next page of results', i)
             service = build("customsearch", "v1",
@@ -54,10 +129,7 @@ class CustomSearchData:
                 start=i
             ).execute()
             print('Retrieved the results from the current page')
-            results += res['items']
-
-        print('Scraping websites for data')
-        self.scrape_google_results(results, file_path, topic)
+            yield from res['items']
 
     def scrape_google_results(self, search_results, file_path, topic):
         """Scrapes the websites that are returned from the Google Search API for text data
@@ -72,21 +144,24 @@ class CustomSearchData:
         ----------
         """
         text_results = []
+        unclassified_results = []
+        pdf_results = []
         for result in search_results:
             if 'mime' in result and 'application/pdf' in result['mime']:
+                pdf_results.append(result)
                 continue
             print('Scraping results from this link', result['link'])
             try:
-                response = requests.get(result['link'], timeout=15)
-                doc = Document(response.text)
-                summary_of_article = doc.summary()
-                print(doc.title())
-                text_results.append({
+                title, text = self.scrape_article(result['link'])
+                print(title)
+                text_result = {
                     'link': result['link'],
-                    'title': doc.title(),
+                    'title': title,
                     'topic': topic,
-                    'text': html2text.html2text(summary_of_article)
-                })
+                    'text': text
+                }
+                text_results.append(text_result)
+                unclassified_results.append(text_result)
                 print('Appended information to results')
             except Exception as error:
                 print('&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&')
@@ -95,11 +170,263 @@ class CustomSearchData:
                 print('&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&')
                 continue
 
+            if self._predictor is not None and len(unclassified_results) >= PREDICTION_BATCH_SIZE:
+                self.__classify_results(unclassified_results)
+                unclassified_results = []
+
+        if self._predictor is not None:
+            self.__classify_results(unclassified_results)
+
         print('Scraped together', len(text_results), 'websites for information.')
 
         df = pd.DataFrame(text_results)
         self._file_storage.store_df_as_file(file_path, df)
 
+        if self._pdf_ingestion is not None and len(pdf_results) > 0:
+            self._pdf_ingestion.ingest(pdf_results, self._pdf_ingestion.get_pdf_file_path(file_path, topic), topic)
+
+    @staticmethod
+    def scrape_article(link):
+        """Scrapes the main article text from a website
+
+        Parameters
+        ----------
+        :param link: String, Required
+            The link to the website
+
+        ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The title of the article and its text as markdown
+
+        -------
+        """
+        return CustomSearchData.extract_article(CustomSearchData.fetch_article_html(link))
+
+    @staticmethod
+    def fetch_article_html(link, max_bytes=MAX_RESPONSE_BYTES, deadline=DOWNLOAD_DEADLINE):
+        """Downloads the html of a website, streaming the body so oversized, slow or binary responses are abandoned early
+
+        Parameters
+        ----------
+        :param link: String, Required
+            The link to the website
+        :param max_bytes: Number, Optional
+            The largest response body that is downloaded
+        :param deadline: Number, Optional
+            The number of seconds the whole download may take
+
+        ----------
+
+        Returns
+        -------
+        :return: String
+            The html of the website
+
+        -------
+        """
+        start = time.monotonic()
+        with requests.get(link, timeout=(CONNECT_TIMEOUT, min(READ_TIMEOUT, deadline)), stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if content_type and content_type not in HTML_CONTENT_TYPES:
+                raise ValueError(f'Unsupported content type {content_type}')
+            if int(response.headers.get('Content-Length') or 0) > max_bytes:
+                raise ValueError(f'The response is larger than {max_bytes} bytes')
+
+            # The read timeout applies to each read, so a server sending a few bytes at a time could keep a single
+            # chunk waiting far past the deadline. The watchdog cuts the connection off at the deadline instead
+            timed_out = threading.Event()
+            watchdog = threading.Timer(max(deadline - (time.monotonic() - start), 0),
+                                       CustomSearchData.__abort_download, args=(response, timed_out))
+            watchdog.daemon = True
+            watchdog.start()
+            chunks = []
+            number_of_bytes = 0
+            try:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if number_of_bytes == 0 and chunk.lstrip().startswith(BINARY_SIGNATURES):
+                        # Servers often label binary files as html, so the first bytes are checked as well
+                        raise ValueError('The response is a binary file')
+                    chunks.append(chunk)
+                    number_of_bytes += len(chunk)
+                    if number_of_bytes > max_bytes:
+                        raise ValueError(f'The response is larger than {max_bytes} bytes')
+                    if timed_out.is_set():
+                        break
+            except Exception as error:
+                if timed_out.is_set():
+                    raise TimeoutError(f'The download took longer than {deadline} seconds') from error
+                raise
+            finally:
+                watchdog.cancel()
+            if timed_out.is_set():
+                raise TimeoutError(f'The download took longer than {deadline} seconds')
+
+            return b''.join(chunks).decode(response.encoding or 'utf-8', errors='replace')
+
+    @staticmethod
+    def __abort_download(response, timed_out):
+        """Cuts off a download that has run out of time. Runs on the watchdog thread
+
+        Parameters
+        ----------
+        :param response: requests.Response, Required
+            The response being downloaded
+        :param timed_out: threading.Event, Required
+            Set to tell the download it ran out of time
+
+        ----------
+        """
+        timed_out.set()
+        sock = getattr(getattr(response.raw, 'connection', None), 'sock', None)
+        if sock is None:
+            # A connection closed after the response (HTTP/1.0) has let go of its socket, which the file the body
+            # is read from still holds
+            body_file = getattr(getattr(response.raw, '_fp', None), 'fp', None)
+            sock = getattr(getattr(body_file, 'raw', None), '_sock', None)
+        if sock is None:
+            return
+        try:
+            # Shutting the socket down wakes the read blocked on it. The plain socket is shut down, since the ssl
+            # wrapper would also tear down the tls state the blocked read is still using
+            socket.socket.shutdown(sock, socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    @staticmethod
+    def extract_article(html):
+        """Extracts the main article from the html of a website
+
+        Readability is only run on pages small enough to parse quickly, and is given a time limit. Otherwise the
+        faster paragraph density extractor is used.
+
+        Parameters
+        ----------
+        :param html: String, Required
+            The html of the website
+
+        ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The title of the article and its text as markdown
+
+        -------
+        """
+        if len(html) <= READABILITY_MAX_HTML_LENGTH:
+            try:
+                return CustomSearchData.__extract_article_in_helper_process(html)
+            except TimeoutError:
+                print('Readability timed out, falling back to the paragraph extractor')
+        return CustomSearchData.extract_article_with_lxml(html)
+
+    @staticmethod
+    def __extract_article_in_helper_process(html):
+        """Runs readability in the helper process, killing the process if it runs out of time
+
+        A thread running readability cannot be interrupted, so a page readability cannot parse would keep its
+        thread busy. A process can be killed, and the next page starts a new one.
+
+        Parameters
+        ----------
+        :param html: String, Required
+            The html of the website
+
+        ----------
+        """
+        global _readability_process, _readability_connection
+        with _readability_lock:
+            if _readability_process is None:
+                # Spawned rather than forked, since the calling process may be running download threads
+                context = multiprocessing.get_context('spawn')
+                _readability_connection, helper_connection = context.Pipe()
+                _readability_process = context.Process(target=serve_readability, args=(helper_connection,),
+                                                       daemon=True)
+                _readability_process.start()
+                helper_connection.close()
+
+            try:
+                _readability_connection.send(html)
+                if not _readability_connection.poll(READABILITY_TIMEOUT):
+                    raise TimeoutError(f'Readability took longer than {READABILITY_TIMEOUT} seconds')
+                article, error = _readability_connection.recv()
+            except (TimeoutError, EOFError, OSError):
+                # The helper is stuck or has died, so it is replaced on the next page
+                _readability_process.kill()
+                _readability_process.join()
+                _readability_connection.close()
+                _readability_process = None
+                _readability_connection = None
+                raise
+        if error is not None:
+            raise error
+        return article
+
+    @staticmethod
+    def extract_article_with_readability(html):
+        """Extracts the main article from the html of a website using readability
+
+        Parameters
+        ----------
+        :param html: String, Required
+            The html of the website
+
+        ----------
+        """
+        doc = Document(html)
+        summary_of_article = doc.summary()
+        return doc.title(), html2text.html2text(summary_of_article)
+
+    @staticmethod
+    def extract_article_with_lxml(html):
+        """Extracts the main article from the html of a website as the element holding the most paragraph text
+
+        Parameters
+        ----------
+        :param html: String, Required
+            The html of the website
+
+        ----------
+        """
+        root = lxml.html.fromstring(html)
+        for element in root.xpath('//script|//style|//noscript|//nav|//header|//footer|//aside|//form'):
+            element.drop_tree()
+        title = root.findtext('.//title') or ''
+
+        scores = {}
+        for paragraph in root.iter('p'):
+            parent = paragraph.getparent()
+            if parent is not None:
+                scores[parent] = scores.get(parent, 0) + len(paragraph.text_content().strip())
+        if len(scores) == 0:
+            return title.strip(), root.text_content().strip()
+
+        article = max(scores, key=scores.get)
+        paragraphs = [paragraph.text_content().strip() for paragraph in article.iter('p')]
+        return title.strip(), '\n\n'.join(paragraph for paragraph in paragraphs if paragraph)
+
+    def __classify_results(self, text_results):
+        """Classifies a batch of scraped articles, adding the predicted topics to each result
+
+        Parameters
+        ----------
+        :param text_results: List, Required
+            The scraped articles that have not been classified yet
+
+        ----------
+        """
+        if len(text_results) == 0:
+            return
+        predictions = self._predictor.predict([result['text'] for result in text_results])
+        for result, (_, prediction) in zip(text_results, predictions.iterrows()):
+            for pipeline_name, predicted_topic in prediction.items():
+                result[f'predicted_{pipeline_name}'] = predicted_topic
+        print('Classified', len(text_results), 'scraped articles')
+
     def store_raw_data(self, file_path):
         """Stores the raw data in S3
 
@@ -122,8 +449,11 @@ class CustomSearchData:
 if __name__ == '__main__':
     from dotenv import load_dotenv
     from FileStorage import FileStorage
+    from CustomSearchPdfIngestion import CustomSearchPdfIngestion
     load_dotenv()
-    search_data_instance = CustomSearchData(FileStorage(), S3Api.S3Api())
+    fs = FileStorage()
+    search_data_instance = CustomSearchData(fs, S3Api.S3Api(),
+                                            pdf_ingestion=CustomSearchPdfIngestion(fs) if INGEST_PDFS else None)
     print('Scraping the google search api for covid 19 articles relating to food security')
     search_data_instance.search(40, 'covid covid19 affect food security hunger', 'search_results/covid-search-results.csv', 'covid')
 
@@ -1,15 +1,62 @@
-from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
-from nltk.stem import WordNetLemmatizer
-import nltk
 import pandas as pd
 import S3Api
 import glob
-import statistics
+import numpy as np
+import os
+from CustomSearchTextNormalizer import CustomSearchTextNormalizer
+from CustomSearchNearDuplicateDetector import CustomSearchNearDuplicateDetector
 
 # Constants
 STORE_DATA = True
-words = set(nltk.corpus.words.words())
-lemmatizer = WordNetLemmatizer()
+# The estimated jaccard similarity at which two articles are considered near duplicates
+NEAR_DUPLICATE_THRESHOLD = 0.8
+# Articles shorter than this many characters after normalization are dropped
+MIN_ARTICLE_LENGTH = 1000
+# Whether to process the raw search results in chunks, keeping memory flat as the raw corpus grows
+STREAM_PROCESSING = False
+# The number of raw search results read at once when streaming
+CHUNK_SIZE = 500
+
+
+class RunningStatistics:
+    """Keeps the count, mean, variance, min and max of a stream of values in a single pass (Welford's algorithm)"""
+
+    def __init__(self):
+        """Create a new instance of the RunningStatistics class"""
+        self.count = 0
+        self.mean = 0.0
+        self._sum_of_squares = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        """Adds a batch of values, combining its statistics with the running ones
+
+        Parameters
+        ----------
+        :param values: np.array, Required
+            The batch of values
+
+        ----------
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.size == 0:
+            return
+        batch_count = values.size
+        batch_mean = values.mean()
+        batch_sum_of_squares = ((values - batch_mean) ** 2).sum()
+
+        total = self.count + batch_count
+        delta = batch_mean - self.mean
+        self.mean += delta * batch_count / total
+        self._sum_of_squares += batch_sum_of_squares + delta ** 2 * self.count * batch_count / total
+        self.count = total
+        self.min = values.min() if self.min is None else min(self.min, values.min())
+        self.max = values.max() if self.max is None else max(self.max, values.max())
+
+    def stdev(self):
+        """Gets the sample standard deviation of the values"""
+        return (self._sum_of_squares / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
 
 
 class CustomSearchDataProcessor:
@@ -20,7 +67,11 @@ class CustomSearchDataProcessor:
         self._s3_api = s3_api
         self._additional_stop_words = ['title', 'journal', 'volume', 'author', 'scholar', 'article', 'issue', 'food',
                                        'hunger', 'people', 'million', 'world', 'security', 'insecurity']
-        self._defined_stop_words = set(ENGLISH_STOP_WORDS.union(self._additional_stop_words))
+        self._normalizer = CustomSearchTextNormalizer(self._additional_stop_words)
+
+    def get_normalizer(self):
+        """Gets the normalizer used to filter, lowercase, and lemmatize the search data"""
+        return self._normalizer
 
     def filter_non_english_words(self, corpus):
         """ Filters, lowercases, and lemmatizes non english words using the nltk word list.
@@ -43,9 +94,7 @@ class CustomSearchDataProcessor:
         -------
         """
 
-        filtered_vocabulary = [lemmatizer.lemmatize(w.lower()) for w in nltk.wordpunct_tokenize(corpus) if w.lower() in words]
-        filtered_vocabulary = [w for w in filtered_vocabulary if len(w) > 2 and w not in self._defined_stop_words]
-        return " ".join(filtered_vocabulary)
+        return self._normalizer.filter_non_english_words(corpus)
 
     def parse_text_data(self, input_file_path, output_file_path):
         """ Parses the text data and saves the output as a dataframe in a csv
@@ -68,15 +117,23 @@ class CustomSearchDataProcessor:
         print(search_df.columns)
 
         search_df['text'] = search_df['text'].apply(self.filter_non_english_words)
+
+        # Syndicated and mirrored articles only differ slightly, so they survive the exact link deduplication
+        near_duplicate_detector = CustomSearchNearDuplicateDetector(threshold=NEAR_DUPLICATE_THRESHOLD)
+        search_df, duplicate_groups = near_duplicate_detector.deduplicate(search_df)
+        print('Removed', duplicate_groups.shape[0], 'near duplicate articles')
+        duplicate_groups.to_csv(f'{output_file_path}/near_duplicate_groups.csv', index=False)
+
+        lengths = search_df['text'].str.len()
         print('Stats')
-        print('Max length of article', max(search_df['text']))
-        print('Min length of article', min(search_df['text'].str.len()))
-        print('Mean length of article', statistics.mean(search_df['text'].str.len()))
-        print('Median length of article', statistics.median(search_df['text'].str.len()))
-        print('Standard Deviation length of article', statistics.stdev(search_df['text'].str.len()))
-        lower_bound = 1000
-        upper_bound = statistics.mean(search_df['text'].str.len()) + statistics.stdev(search_df['text'].str.len())
-        search_df = search_df.loc[(search_df['text'].str.len() > lower_bound) & (search_df['text'].str.len() < upper_bound)]
+        print('Max length of article', lengths.max())
+        print('Min length of article', lengths.min())
+        print('Mean length of article', lengths.mean())
+        print('Median length of article', lengths.median())
+        print('Standard Deviation length of article', lengths.std())
+        lower_bound = MIN_ARTICLE_LENGTH
+        upper_bound = lengths.mean() + lengths.std()
+        search_df = search_df.loc[(lengths > lower_bound) & (lengths < upper_bound)]
 
         print(search_df.head())
         print(search_df.shape[0])
@@ -84,6 +141,72 @@ class CustomSearchDataProcessor:
 
         search_df.to_csv(f'{output_file_path}/cleaned_search_data.csv', index=False)
 
+    def parse_text_data_streaming(self, input_file_path, output_file_path, chunk_size=CHUNK_SIZE):
+        """ Parses the text data in chunks and saves the output as a csv, without holding the corpus in memory.
+
+        The first pass normalizes and deduplicates each chunk into a spool file while accumulating the length
+        statistics. The second pass applies the length filter to the spool file.
+
+        Parameters
+        ----------
+        :param input_file_path: String, Required
+            The path to the input file containing a corpus of text
+        :param output_file_path: String, Required
+            The path to the output file to write the processed data
+        :param chunk_size: Number, Optional
+            The number of raw search results read at once
+
+        ----------
+        """
+        all_files = list(glob.iglob(f'{input_file_path}/*.csv', recursive=True))
+        spool_file = f'{output_file_path}/normalized_search_data.spool'
+        duplicate_groups_file = f'{output_file_path}/near_duplicate_groups.csv'
+        output_file = f'{output_file_path}/cleaned_search_data.csv'
+        for file in [spool_file, duplicate_groups_file, output_file]:
+            if os.path.exists(file):
+                os.remove(file)
+
+        seen_links = set()
+        near_duplicate_detector = CustomSearchNearDuplicateDetector(threshold=NEAR_DUPLICATE_THRESHOLD)
+        length_statistics = RunningStatistics()
+        number_of_raw_results = 0
+        for file in all_files:
+            print('Streaming search results from', file)
+            for chunk in pd.read_csv(file, chunksize=chunk_size):
+                number_of_raw_results += chunk.shape[0]
+                chunk = chunk.drop_duplicates(subset=['link'])
+                chunk = chunk.loc[~chunk['link'].isin(seen_links)].copy()
+                seen_links.update(chunk['link'])
+
+                chunk['text'] = chunk['text'].apply(self.filter_non_english_words)
+                chunk, duplicate_groups = near_duplicate_detector.deduplicate(chunk)
+                duplicate_groups.to_csv(duplicate_groups_file, mode='a', index=False,
+                                        header=not os.path.exists(duplicate_groups_file))
+
+                length_statistics.update(chunk['text'].str.len())
+                chunk.to_csv(spool_file, mode='a', index=False, header=not os.path.exists(spool_file))
+
+        print(number_of_raw_results)
+        print(length_statistics.count)
+        print('Stats')
+        print('Max length of article', length_statistics.max)
+        print('Min length of article', length_statistics.min)
+        print('Mean length of article', length_statistics.mean)
+        print('Standard Deviation length of article', length_statistics.stdev())
+        lower_bound = MIN_ARTICLE_LENGTH
+        upper_bound = length_statistics.mean + length_statistics.stdev()
+
+        number_of_articles = 0
+        if os.path.exists(spool_file):
+            for chunk in pd.read_csv(spool_file, chunksize=chunk_size):
+                lengths = chunk['text'].str.len()
+                chunk = chunk.loc[(lengths > lower_bound) & (lengths < upper_bound)]
+                number_of_articles += chunk.shape[0]
+                chunk.to_csv(output_file, mode='a', index=False, header=not os.path.exists(output_file))
+            os.remove(spool_file)
+
+        print('Length of text', number_of_articles)
+
     def store_processed_data(self, file_path):
         """Stores the processed data in S3
 
@@ -109,9 +232,14 @@ if __name__ == '__main__':
     search_data = CustomSearchDataProcessor(FileStorage(), S3Api.S3Api())
 
     print('Processing covid search result data')
-    search_data.parse_text_data(
-        input_file_path='raw_data/search_results',
-        output_file_path='processed_data/search_results')
+    if STREAM_PROCESSING:
+        search_data.parse_text_data_streaming(
+            input_file_path='raw_data/search_results',
+            output_file_path='processed_data/search_results')
+    else:
+        search_data.parse_text_data(
+            input_file_path='raw_data/search_results',
+            output_file_path='processed_data/search_results')
 
     if STORE_DATA:
         print('Storing covid search results in S3')
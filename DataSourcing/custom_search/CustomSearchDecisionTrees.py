@@ -1,24 +1,37 @@
 import pandas as pd
 import S3Api
-from sklearn.feature_extraction.text import CountVectorizer, ENGLISH_STOP_WORDS
+from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.model_selection import train_test_split
 from sklearn.tree import DecisionTreeClassifier
-from sklearn import tree
-from nltk.stem import WordNetLemmatizer
-import nltk
 from sklearn.metrics import ConfusionMatrixDisplay
 import matplotlib.pyplot as plt
-from subprocess import call
 import glob
-from wordcloud import WordCloud, STOPWORDS
-
-words = set(nltk.corpus.words.words())
-lemmatizer = WordNetLemmatizer()
+import numpy as np
+from CustomSearchTreeRenderer import CustomSearchTreeRenderer
+from CustomSearchTextNormalizer import CustomSearchTextNormalizer
+from CustomSearchModelStore import CustomSearchModelStore
+from CustomSearchWordCloudGenerator import CustomSearchWordCloudGenerator
+from CustomSearchFeatureSelector import CustomSearchFeatureSelector
+from CustomSearchSampler import CustomSearchSampler
+from CustomSearchPdfIngestion import CustomSearchPdfIngestion
+
+# Constants
+# Graphviz render options. 'svg' and a max depth are much cheaper alternatives for the overfit trees
+TREE_RENDER_FORMAT = 'png'
+TREE_RENDER_DPI = 600
+TREE_RENDER_MAX_DEPTH = None
+# Whether to train the trees on the terms most associated with the topics instead of the full vocabulary
+FEATURE_SELECTION = True
+NUMBER_OF_SELECTED_FEATURES = 2000
+# How the terms are scored, either 'chi2' or 'mutual_info'
+FEATURE_SCORE_FUNCTION = 'chi2'
+# The number of documents in a fast, stratified sample run of the analysis, or None to use every document
+SAMPLE_SIZE = None
 
 
 class CustomSearchDecisionTrees:
 
-    def __init__(self, file_storage, s3_api):
+    def __init__(self, file_storage, s3_api, sampler=None):
         """ Create a new instance of the CustomSearchDecisionTrees class
 
         Parameters
@@ -27,22 +40,31 @@ class CustomSearchDecisionTrees:
             The file storage class used to store raw/processed data
         :param s3_api: S3_API, Required
             The S3 api wrapper class used to store data in AWS S3
+        :param sampler: CustomSearchSampler, Optional
+            Runs the analysis on a stratified sample of the search data, writing to a separate output prefix
 
         ----------
         """
         self._file_storage = file_storage
         self._s3_api = s3_api
+        self._sampler = sampler
+        output_prefix = sampler.get_output_prefix() if sampler is not None else ''
         self.__processed_data_location = 'processed_data/search_results/cleaned_search_data.csv'
-        self.__processed_pdf_data_location = '/Users/sampastoriza/Documents/Programming/DataScienceDevelopment/DataSciencePortfolioCode/PandemicComparison/processed_data/corpus_data/cleaned_corpus_data.csv'
 
-        self.__decision_tree_data_location = 'decision_tree_data/search_results/'
-        self.__decision_tree_data_visualizations_location = 'decision_tree_data_visualizations/search_results/'
+        self.__decision_tree_data_location = f'{output_prefix}decision_tree_data/search_results/'
+        self.__decision_tree_data_visualizations_location = f'{output_prefix}decision_tree_data_visualizations/search_results/'
         self._file_storage.create_directory_if_not_exists(self.__decision_tree_data_location)
         self._file_storage.create_directory_if_not_exists(self.__decision_tree_data_visualizations_location)
+        self._tree_renderer = CustomSearchTreeRenderer(self.__decision_tree_data_visualizations_location)
         self._additional_stop_words = ['title', 'journal', 'volume', 'author', 'scholar', 'article', 'issue', 'food',
                                        'hunger', 'people', 'million', 'world', 'security', 'insecurity', 'covid',
                                        'locust', 'drought', 'ebola']
-        self._defined_stop_words = set(ENGLISH_STOP_WORDS.union(self._additional_stop_words))
+        self._normalizer = CustomSearchTextNormalizer(self._additional_stop_words)
+        self._model_store = CustomSearchModelStore(file_storage, f'{output_prefix}model_data/search_results/')
+        self._wordcloud_generator = CustomSearchWordCloudGenerator()
+        self._feature_selector = CustomSearchFeatureSelector(
+            file_storage, NUMBER_OF_SELECTED_FEATURES, FEATURE_SCORE_FUNCTION,
+            f'{output_prefix}model_data/search_results/selected_vocabulary/') if FEATURE_SELECTION else None
 
     def filter_non_english_words(self, corpus):
         """ Filters, lowercases, and lemmatizes non english words using the nltk word list.
@@ -65,22 +87,27 @@ class CustomSearchDecisionTrees:
         -------
         """
 
-        filtered_vocabulary = [lemmatizer.lemmatize(w.lower()) for w in nltk.wordpunct_tokenize(corpus) if
-                               w.lower() in words]
-        filtered_vocabulary = [w for w in filtered_vocabulary if len(w) > 2 and w not in self._defined_stop_words]
-        return " ".join(filtered_vocabulary)
+        return self._normalizer.filter_non_english_words(corpus)
 
     def run_decision_tree_analysis(self):
         processed_df = pd.read_csv(self.__processed_data_location, index_col=False)
-        processed_pdf_df = pd.read_csv(self.__processed_pdf_data_location, index_col=False)
-        df = pd.concat([processed_df, processed_pdf_df], ignore_index=True)
+        df = CustomSearchPdfIngestion.combine_with_pdf_corpus(self._file_storage, processed_df)
+        if self._sampler is not None:
+            df = self._sampler.sample(df)
         df['text'] = df['text'].apply(self.filter_non_english_words)
         self.visualize_processed_search_data(df)
 
         labels = list(set(df['topic']))
         print('Labels', labels)
 
-        vectorizer = CountVectorizer()
+        # The split is made before vectorizing so the terms are only selected using the training documents
+        train_rows, test_rows = train_test_split(np.arange(df.shape[0]), test_size=0.3, random_state=123)
+        vocabulary = None
+        if self._feature_selector is not None:
+            vocabulary = self._feature_selector.select_vocabulary(df['text'].iloc[train_rows],
+                                                                  df['topic'].iloc[train_rows])
+
+        vectorizer = CountVectorizer(vocabulary=vocabulary)
         v = vectorizer.fit_transform(df['text'])
         vocab = vectorizer.get_feature_names_out()
         values = v.toarray()
@@ -92,22 +119,25 @@ class CustomSearchDecisionTrees:
         v_df.to_csv(file_path, index=False)
         print('Wrote labeled dataframe to csv')
 
-        train_df, test_df = train_test_split(v_df, test_size=0.3)
+        train_df, test_df = v_df.iloc[train_rows], v_df.iloc[test_rows]
         train_df.to_csv(f'{self.__decision_tree_data_location}training_set.csv', index=False)
         train_df.to_csv(f'{self.__decision_tree_data_location}testing_set.csv', index=False)
         print('Split data into training and testing sets')
 
         print('Trying decision trees using best splitter')
-        self.__run_decision_tree(train_df, test_df, labels, 'entropy', 'best', 4, 'entropy-4-best')
-        self.__run_decision_tree(train_df, test_df, labels, 'gini', 'best', 4, 'gini-4-best')
-        self.__run_decision_tree(train_df, test_df, labels, 'entropy', 'best', 5, 'entropy-5-best')
-        self.__run_decision_tree(train_df, test_df, labels, 'gini', 'best', 5, 'gini-5-best')
-        self.__run_decision_tree(train_df, test_df, labels, 'entropy', 'best', 3, 'entropy-3-best')
-        self.__run_decision_tree(train_df, test_df, labels, 'gini', 'best', 3, 'gini-3-best')
-        self.__run_decision_tree(train_df, test_df, labels, 'entropy', 'best', 100, 'entropy-overfit-best')
-        self.__run_decision_tree(train_df, test_df, labels, 'gini', 'best', 100, 'gini-overfit-best')
-
-    def __run_decision_tree(self, train_df, test_df, labels, criterion, splitter, depth, file_description):
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'entropy', 'best', 4, 'entropy-4-best')
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'gini', 'best', 4, 'gini-4-best')
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'entropy', 'best', 5, 'entropy-5-best')
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'gini', 'best', 5, 'gini-5-best')
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'entropy', 'best', 3, 'entropy-3-best')
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'gini', 'best', 3, 'gini-3-best')
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'entropy', 'best', 100, 'entropy-overfit-best')
+        self.__run_decision_tree(train_df, test_df, vectorizer, labels, 'gini', 'best', 100, 'gini-overfit-best')
+
+        print('Waiting for the decision tree renders to finish')
+        self._tree_renderer.wait()
+
+    def __run_decision_tree(self, train_df, test_df, vectorizer, labels, criterion, splitter, depth, file_description):
         # Split labels from df
         train_labels = train_df['LABEL']
         train_df = train_df.drop(['LABEL'], axis=1)
@@ -121,20 +151,16 @@ class CustomSearchDecisionTrees:
                                     max_depth=depth)
 
         dt.fit(train_df, train_labels)
+        self._model_store.save_pipeline(f'decision_tree_{file_description}', self._normalizer, vectorizer, dt)
         features = train_df.columns
         print('Fit training data using decision tree')
 
-        tree.export_graphviz(dt,
-                             out_file=f'{self.__decision_tree_data_visualizations_location}decision_tree_{file_description}.dot',
-                             feature_names=features,
-                             class_names=labels,
-                             filled=True,
-                             rounded=True,
-                             proportion=False,
-                             precision=2)
-
-        call(['dot', '-Tpng', f'{self.__decision_tree_data_visualizations_location}decision_tree_{file_description}.dot', '-o', f'{self.__decision_tree_data_visualizations_location}decision_tree_{file_description}.png', '-Gdpi=600'])
-        print('Saved decision tree to image using graphviz')
+        # Rendering happens on a background worker pool, so training continues while graphviz runs
+        self._tree_renderer.submit(dt, features, labels, file_description,
+                                   image_format=TREE_RENDER_FORMAT,
+                                   dpi=TREE_RENDER_DPI,
+                                   max_depth=TREE_RENDER_MAX_DEPTH)
+        print('Queued decision tree to be rendered using graphviz')
 
         dt_pred = dt.predict(test_df)
         df_confusion = pd.crosstab(test_labels, dt_pred, rownames=['Actual'], colnames=['Predicted'], margins=True)
@@ -157,26 +183,7 @@ class CustomSearchDecisionTrees:
     def visualize_processed_search_data(self, processed_df):
         """ Visualizes the processed search data"""
         print('Visualizing processed and combined search data')
-        for group in processed_df.groupby(by=['topic']):
-            text_data = " ".join(group[1]['text'].to_list())
-            topic = group[0]
-            print('Generating wordcloud for topic', topic)
-            wordcloud = WordCloud(stopwords=STOPWORDS, background_color="white", collocations=False).generate(text_data)
-            print('Saving image to file')
-            # Save as an svg for scaling purposes
-            wordcloud_svg = wordcloud.to_svg(embed_font=True)
-            f = open(f'{self.__decision_tree_data_visualizations_location}{topic}_wordcloud.svg', "w+")
-            f.write(wordcloud_svg)
-            f.close()
-
-            vectorizer = CountVectorizer(stop_words="english")
-            matrix = vectorizer.fit_transform(group[1]['text'])
-            feature_names = vectorizer.get_feature_names_out()
-            values = matrix.toarray()
-            v_df = pd.DataFrame(values, columns=feature_names)
-            sums = matrix.sum(axis=0).tolist()[0]
-            sorted_frequencies = sorted(zip(feature_names, sums), key=lambda x: -x[1])
-            v_df.to_csv(f'{self.__decision_tree_data_location}{topic}_vectorized.csv')
+        self._wordcloud_generator.generate(processed_df, self.__decision_tree_data_visualizations_location, self.__decision_tree_data_location)
 
     def store_in_s3(self):
         png_visualizations = list(glob.iglob(f'{self.__decision_tree_data_visualizations_location}/**/*.png', recursive=True))
@@ -218,6 +225,8 @@ if __name__ == '__main__':
     load_dotenv()
     fs = FileStorage()
 
-    search_decision_trees = CustomSearchDecisionTrees(fs, S3Api.S3Api())
+    sampler = CustomSearchSampler(SAMPLE_SIZE) if SAMPLE_SIZE is not None else None
+    search_decision_trees = CustomSearchDecisionTrees(fs, S3Api.S3Api(), sampler)
     search_decision_trees.run_decision_tree_analysis()
-    search_decision_trees.store_in_s3()
+    if sampler is None:
+        search_decision_trees.store_in_s3()
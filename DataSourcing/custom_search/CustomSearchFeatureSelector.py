@@ -0,0 +1,105 @@
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.feature_selection import SelectKBest, chi2, mutual_info_classif
+import hashlib
+import json
+import os
+
+# Constants
+SCORE_FUNCTIONS = {
+    'chi2': chi2,
+    'mutual_info': lambda x, y: mutual_info_classif(x, y, discrete_features=True, random_state=123)
+}
+
+
+class CustomSearchFeatureSelector:
+    """
+    Selects the terms most associated with the topic labels, so the classifiers train on a reduced vocabulary.
+
+    Terms are scored by chi squared or mutual information on the sparse count matrix. The selected vocabulary
+    is cached by a hash of the documents, labels and selection options, so it is only recomputed when the corpus
+    changes.
+    """
+
+    def __init__(self, file_storage, number_of_features=2000, score_function='chi2',
+                 cache_location='model_data/search_results/selected_vocabulary/'):
+        """ Create a new instance of the CustomSearchFeatureSelector class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param number_of_features: Number, Optional
+            The number of terms kept
+        :param score_function: String, Optional
+            How the terms are scored, either 'chi2' or 'mutual_info'
+        :param cache_location: String, Optional
+            The directory where the selected vocabularies are cached
+
+        ----------
+        """
+        if score_function not in SCORE_FUNCTIONS:
+            raise ValueError(f'Unknown score function {score_function}, expected one of {list(SCORE_FUNCTIONS)}')
+        self._number_of_features = number_of_features
+        self._score_function = score_function
+        self._cache_location = cache_location
+        file_storage.create_directory_if_not_exists(self._cache_location)
+
+    def select_vocabulary(self, texts, labels):
+        """Selects the terms most associated with the labels
+
+        Parameters
+        ----------
+        :param texts: pd.Series, Required
+            The processed text of the documents the classifiers are trained on
+        :param labels: pd.Series, Required
+            The topic of each document
+
+        ----------
+
+        Returns
+        -------
+        :return: List
+            The selected terms, to be passed as the vocabulary of a CountVectorizer or TfidfVectorizer
+
+        -------
+        """
+        cache_file = f'{self._cache_location}{self.__corpus_key(texts, labels)}.json'
+        if os.path.exists(cache_file):
+            print('Corpus is unchanged, reusing the cached vocabulary', cache_file)
+            with open(cache_file, 'r') as f:
+                return json.load(f)['vocabulary']
+
+        vectorizer = CountVectorizer()
+        matrix = vectorizer.fit_transform(texts)
+        feature_names = vectorizer.get_feature_names_out()
+        selector = SelectKBest(SCORE_FUNCTIONS[self._score_function],
+                               k=min(self._number_of_features, feature_names.shape[0]))
+        selector.fit(matrix, labels)
+        vocabulary = feature_names[selector.get_support()].tolist()
+        print('Selected', len(vocabulary), 'of', feature_names.shape[0], 'terms using', self._score_function)
+
+        with open(cache_file, 'w') as f:
+            json.dump({
+                'score_function': self._score_function,
+                'number_of_documents': matrix.shape[0],
+                'number_of_terms': int(feature_names.shape[0]),
+                'vocabulary': vocabulary
+            }, f)
+        return vocabulary
+
+    def __corpus_key(self, texts, labels):
+        """Hashes the documents, labels and selection options into a cache key
+
+        Parameters
+        ----------
+        :param texts: pd.Series, Required
+            The processed text of the documents
+        :param labels: pd.Series, Required
+            The topic of each document
+
+        ----------
+        """
+        corpus_hash = hashlib.sha256(f'{self._score_function}:{self._number_of_features}'.encode('utf-8'))
+        for text, label in zip(texts, labels):
+            corpus_hash.update(f'{label}\0{text}\0'.encode('utf-8'))
+        return corpus_hash.hexdigest()
@@ -0,0 +1,171 @@
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+import numpy as np
+import tempfile
+import fcntl
+import os
+
+# Constants
+LEXICON_LOCATION = 'model_data/lexicon/'
+
+
+class CustomSearchLexicon:
+    """
+    A precompiled lexicon of the nltk english words, their lemmas and the stop words, shared between processes.
+
+    The lexicon is kept as sorted, fixed width byte arrays in .npy files that are memory mapped when first used, so
+    every process reads the same pages from the page cache instead of building its own set of python strings.
+    Tokens are looked up all at once with a binary search over the sorted words.
+
+    Only the lowercase words are kept, since the normalizer looks up lowercased tokens, which can never match
+    the capitalized entries of the word list.
+    """
+
+    def __init__(self, lexicon_location=LEXICON_LOCATION):
+        """ Create a new instance of the CustomSearchLexicon class
+
+        Parameters
+        ----------
+        :param lexicon_location: String, Optional
+            The directory where the lexicon arrays are stored
+
+        ----------
+        """
+        self._lexicon_location = lexicon_location
+        self._words = None
+        self._lemmas = None
+        self._keep = None
+
+    def build(self):
+        """Builds the lexicon arrays from the nltk word list and wordnet lemmatizer"""
+        from nltk.corpus import words
+        from nltk.stem import WordNetLemmatizer
+        lemmatizer = WordNetLemmatizer()
+
+        english_words = sorted({word.encode('utf-8') for word in words.words() if word == word.lower()})
+        lemmas = [lemmatizer.lemmatize(word.decode('utf-8')) for word in english_words]
+        # Whether the lemma survives the length and english stop word filters of the normalizer
+        keep = [len(lemma) > 2 and lemma not in ENGLISH_STOP_WORDS for lemma in lemmas]
+
+        os.makedirs(self._lexicon_location, exist_ok=True)
+        self.__save_array('words', np.array(english_words, dtype=np.bytes_))
+        self.__save_array('lemmas', np.array([lemma.encode('utf-8') for lemma in lemmas], dtype=np.bytes_))
+        self.__save_array('keep', np.array(keep, dtype=bool))
+        self.__save_array('stop_words', np.array(sorted(word.encode('utf-8') for word in ENGLISH_STOP_WORDS),
+                                                 dtype=np.bytes_))
+        print('Built the lexicon with', len(english_words), 'words in', self._lexicon_location)
+
+    def __save_array(self, name, array):
+        """Saves a lexicon array, replacing the previous one atomically so readers never see a partial file
+
+        Parameters
+        ----------
+        :param name: String, Required
+            The name of the array
+        :param array: np.array, Required
+            The array
+
+        ----------
+        """
+        # Each process writes its own temporary file, so concurrent builds never rename a partial file
+        file_descriptor, temporary_file = tempfile.mkstemp(prefix=f'{name}.', suffix='.tmp.npy',
+                                                           dir=self._lexicon_location)
+        try:
+            with os.fdopen(file_descriptor, 'wb') as f:
+                np.save(f, array)
+            os.replace(temporary_file, f'{self._lexicon_location}{name}.npy')
+        except BaseException:
+            os.remove(temporary_file)
+            raise
+
+    def ensure_built(self):
+        """Builds the lexicon unless it exists, holding a lock file so concurrent processes only build it once
+
+        Call this before starting a process pool, so the workers find the lexicon already built.
+        """
+        # The stop words are saved last, so they mark a complete lexicon
+        if os.path.exists(f'{self._lexicon_location}stop_words.npy'):
+            return
+        os.makedirs(self._lexicon_location, exist_ok=True)
+        with open(f'{self._lexicon_location}build.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(f'{self._lexicon_location}stop_words.npy'):
+                    self.build()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __load(self):
+        """Memory maps the lexicon arrays, building them first if they do not exist"""
+        if self._words is not None:
+            return
+        self.ensure_built()
+        self._words = np.load(f'{self._lexicon_location}words.npy', mmap_mode='r')
+        self._lemmas = np.load(f'{self._lexicon_location}lemmas.npy', mmap_mode='r')
+        self._keep = np.load(f'{self._lexicon_location}keep.npy', mmap_mode='r')
+
+    def lookup(self, tokens):
+        """Finds the lexicon entry of each token
+
+        Parameters
+        ----------
+        :param tokens: List, Required
+            The lowercased tokens
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            The index of each token in the lexicon, or -1 if the token is not an english word
+
+        -------
+        """
+        self.__load()
+        encoded_tokens = [token.encode('utf-8') for token in tokens]
+        # Tokens longer than the widest word would be truncated to a false match, so they are ruled out first
+        fits = np.fromiter((len(token) <= self._words.itemsize for token in encoded_tokens), dtype=bool,
+                           count=len(encoded_tokens))
+        queries = np.array(encoded_tokens, dtype=self._words.dtype)
+        indices = np.searchsorted(self._words, queries)
+        clipped = np.minimum(indices, self._words.shape[0] - 1)
+        found = fits & (indices < self._words.shape[0]) & (self._words[clipped] == queries)
+        return np.where(found, clipped, -1)
+
+    def get_lemmas(self, indices):
+        """Gets the lemmas of lexicon entries
+
+        Parameters
+        ----------
+        :param indices: np.array, Required
+            The lexicon indices
+
+        ----------
+        """
+        self.__load()
+        return [lemma.decode('utf-8') for lemma in self._lemmas[indices].tolist()]
+
+    def get_keep_mask(self, additional_stop_words=()):
+        """Gets whether the lemma of each lexicon entry survives the length and stop word filters
+
+        Parameters
+        ----------
+        :param additional_stop_words: Iterable, Optional
+            The stop words removed on top of the sklearn english stop words
+
+        ----------
+        """
+        self.__load()
+        additional = np.array([word.encode('utf-8') for word in additional_stop_words], dtype=np.bytes_)
+        if additional.shape[0] == 0:
+            return np.asarray(self._keep)
+        return np.asarray(self._keep) & ~np.isin(self._lemmas, additional)
+
+    def get_stop_words(self):
+        """Gets the sklearn english stop words stored with the lexicon"""
+        self.__load()
+        stop_words = np.load(f'{self._lexicon_location}stop_words.npy', mmap_mode='r')
+        return {word.decode('utf-8') for word in stop_words.tolist()}
+
+
+if __name__ == '__main__':
+    CustomSearchLexicon().build()
@@ -0,0 +1,115 @@
+import numpy as np
+import joblib
+import glob
+import os
+
+
+class CustomSearchModelStore:
+    """
+    Persists fitted text classification pipelines (normalizer + vectorizer + model) to the local file system.
+
+    Pipelines are written uncompressed with joblib, so the numpy arrays inside the fitted models are memory mapped
+    when a pipeline is loaded rather than copied into every process that uses them.
+    """
+
+    def __init__(self, file_storage, model_data_location='model_data/search_results/'):
+        """ Create a new instance of the CustomSearchModelStore class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param model_data_location: String, Optional
+            The directory where the fitted pipelines are stored
+
+        ----------
+        """
+        self._file_storage = file_storage
+        self._model_data_location = model_data_location
+        self._file_storage.create_directory_if_not_exists(self._model_data_location)
+
+    def save_pipeline(self, name, normalizer, vectorizer, model, dense_input=True, metadata=None):
+        """Saves a fitted pipeline
+
+        Parameters
+        ----------
+        :param name: String, Required
+            The name of the pipeline, used as the file name
+        :param normalizer: CustomSearchTextNormalizer, Required
+            The normalizer applied to the raw text before vectorizing, or None if the text is already processed
+        :param vectorizer: CountVectorizer or TfidfVectorizer, Required
+            The fitted vectorizer
+        :param model: sklearn estimator, Required
+            The fitted model
+        :param dense_input: Boolean, Optional
+            Whether the model was fit on a dense labeled dataframe rather than the sparse matrix
+        :param metadata: Dictionary, Optional
+            Any additional training state to keep with the pipeline
+
+        ----------
+        """
+        # The pruned stop words are only kept for introspection and can be larger than the model itself
+        if hasattr(vectorizer, 'stop_words_'):
+            vectorizer.stop_words_ = None
+        pipeline = {
+            'normalizer': normalizer,
+            'vectorizer': vectorizer,
+            'model': model,
+            # Hashing vectorizers have no vocabulary, so there are no feature names to keep
+            'feature_names': np.asarray(vectorizer.get_feature_names_out()) if hasattr(vectorizer, 'vocabulary_') else None,
+            'dense_input': dense_input,
+            'metadata': metadata if metadata is not None else {}
+        }
+        file_path = self.__pipeline_file(name)
+        joblib.dump(pipeline, file_path)
+        print('Saved fitted pipeline to', file_path)
+
+    def load_pipeline(self, name, mmap_mode='r'):
+        """Loads a fitted pipeline, memory mapping its arrays
+
+        Parameters
+        ----------
+        :param name: String, Required
+            The name of the pipeline
+        :param mmap_mode: String, Optional
+            The joblib memory map mode, None loads writable copies for models that are updated in place
+
+        ----------
+
+        Returns
+        -------
+        :return: Dictionary
+            The normalizer, vectorizer, model, feature names, whether the model expects dense input and metadata
+
+        -------
+        """
+        return joblib.load(self.__pipeline_file(name), mmap_mode=mmap_mode)
+
+    def contains_pipeline(self, name):
+        """Determines whether a pipeline has been stored
+
+        Parameters
+        ----------
+        :param name: String, Required
+            The name of the pipeline
+
+        ----------
+        """
+        return os.path.exists(self.__pipeline_file(name))
+
+    def list_pipelines(self):
+        """Lists the names of every stored pipeline"""
+        return sorted(os.path.basename(file).replace('.joblib', '')
+                      for file in glob.iglob(f'{self._model_data_location}*.joblib'))
+
+    def __pipeline_file(self, name):
+        """Gets the file path of a pipeline
+
+        Parameters
+        ----------
+        :param name: String, Required
+            The name of the pipeline
+
+        ----------
+        """
+        return f'{self._model_data_location}{name}.joblib'
@@ -0,0 +1,160 @@
+import pandas as pd
+import numpy as np
+import zlib
+
+# Constants
+# A mersenne prime small enough that the permuted 32 bit shingle hashes never overflow 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+class CustomSearchNearDuplicateDetector:
+    """
+    Detects near duplicate documents (syndicated stories, mirrored reports) using MinHash signatures over word
+    shingles, with locality sensitive hashing bands so each document is only compared against likely matches.
+
+    Documents are inserted one at a time. The first document of a group is kept as its representative and every
+    later document whose estimated jaccard similarity to it passes the threshold is reported as its duplicate.
+    """
+
+    def __init__(self, threshold=0.8, num_permutations=128, shingle_size=5, seed=123):
+        """ Create a new instance of the CustomSearchNearDuplicateDetector class
+
+        Parameters
+        ----------
+        :param threshold: Number, Optional
+            The estimated jaccard similarity at which two documents are considered duplicates
+        :param num_permutations: Number, Optional
+            The number of hash permutations in each MinHash signature
+        :param shingle_size: Number, Optional
+            The number of words in each shingle
+        :param seed: Number, Optional
+            The seed for the hash permutations, so signatures are reproducible across runs
+
+        ----------
+        """
+        self._threshold = threshold
+        self._shingle_size = shingle_size
+        random_state = np.random.RandomState(seed)
+        self._a = random_state.randint(1, MERSENNE_PRIME, size=num_permutations).astype(np.uint64)
+        self._b = random_state.randint(0, MERSENNE_PRIME, size=num_permutations).astype(np.uint64)
+        self._bands, self._rows = self.__band_parameters(threshold, num_permutations)
+        self._buckets = [dict() for _ in range(self._bands)]
+        self._signatures = {}
+
+    def __band_parameters(self, threshold, num_permutations):
+        """Chooses the number of bands and rows per band whose LSH threshold (1/b)^(1/r) is closest to the threshold
+
+        Parameters
+        ----------
+        :param threshold: Number, Required
+            The estimated jaccard similarity at which two documents are considered duplicates
+        :param num_permutations: Number, Required
+            The number of hash permutations in each MinHash signature
+
+        ----------
+        """
+        parameters = [(bands, num_permutations // bands) for bands in range(1, num_permutations + 1)]
+        return min(parameters, key=lambda p: abs((1 / p[0]) ** (1 / p[1]) - threshold))
+
+    def signature(self, text):
+        """Computes the MinHash signature of a document
+
+        Parameters
+        ----------
+        :param text: String, Required
+            The normalized text of the document
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            The minimum permuted shingle hash for each permutation
+
+        -------
+        """
+        tokens = text.split()
+        shingles = {' '.join(tokens[i:i + self._shingle_size])
+                    for i in range(max(len(tokens) - self._shingle_size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        permuted = (np.outer(hashes, self._a) + self._b) % MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+    def insert(self, key, text):
+        """Adds a document, returning the representative it duplicates if there is one
+
+        Parameters
+        ----------
+        :param key: String, Required
+            The unique key of the document (the link for search results)
+        :param text: String, Required
+            The normalized text of the document
+
+        ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The key of the representative and the estimated jaccard similarity, or (None, None) if the
+            document is not a near duplicate
+
+        -------
+        """
+        if not isinstance(text, str) or len(text.split()) == 0:
+            return None, None
+
+        signature = self.signature(text)
+        band_keys = [signature[band * self._rows:(band + 1) * self._rows].tobytes() for band in range(self._bands)]
+
+        candidates = set()
+        for bucket, band_key in zip(self._buckets, band_keys):
+            candidates.update(bucket.get(band_key, []))
+
+        best_representative, best_similarity = None, None
+        for candidate in candidates:
+            similarity = float(np.mean(self._signatures[candidate] == signature))
+            if similarity >= self._threshold and (best_similarity is None or similarity > best_similarity):
+                best_representative, best_similarity = candidate, similarity
+
+        if best_representative is not None:
+            return best_representative, best_similarity
+
+        # Only representatives are indexed, so every group keeps comparing against its first document
+        self._signatures[key] = signature
+        for bucket, band_key in zip(self._buckets, band_keys):
+            bucket.setdefault(band_key, []).append(key)
+        return None, None
+
+    def deduplicate(self, df, key_column='link', text_column='text'):
+        """Removes the near duplicate documents from a dataframe
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The documents
+        :param key_column: String, Optional
+            The column holding the unique key of each document
+        :param text_column: String, Optional
+            The column holding the normalized text of each document
+
+        ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The dataframe with one representative per group, and a dataframe of every removed duplicate
+            alongside its representative for auditing
+
+        -------
+        """
+        keep = []
+        duplicates = []
+        for key, text in zip(df[key_column], df[text_column]):
+            representative, similarity = self.insert(key, text)
+            keep.append(representative is None)
+            if representative is not None:
+                duplicates.append({'representative': representative, 'duplicate': key, 'similarity': similarity})
+
+        duplicate_groups = pd.DataFrame(duplicates, columns=['representative', 'duplicate', 'similarity'])
+        return df.loc[keep], duplicate_groups
@@ -0,0 +1,216 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+import pandas as pd
+import tempfile
+import requests
+import signal
+import time
+import os
+
+# Constants
+# The number of seconds a single pdf may take to download and extract before it is abandoned
+PDF_TIME_LIMIT = 60
+MAX_PDF_BYTES = 50 * 1024 * 1024
+# Pdfs are spooled in memory up to this size and to a temporary file past it
+PDF_SPOOL_SIZE = 4 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 30
+# The pdf corpus produced separately from the search results, in the processed data directory
+PDF_CORPUS_LOCATION = 'corpus_data/cleaned_corpus_data.csv'
+
+
+def _raise_time_limit(signum, frame):
+    raise TimeoutError('The pdf took longer than its time limit to ingest')
+
+
+def extract_pdf(link, topic, time_limit=PDF_TIME_LIMIT, max_bytes=MAX_PDF_BYTES):
+    """Downloads a pdf and extracts its text page by page. Runs in a worker process
+
+    The deadline is checked between chunks and pages, and an alarm interrupts a single page that hangs the parser.
+    Once the download is done, running out of time keeps the pages extracted so far.
+
+    Parameters
+    ----------
+    :param link: String, Required
+        The link to the pdf
+    :param topic: String, Required
+        The topic of the search
+    :param time_limit: Number, Optional
+        The number of seconds the pdf may take to download and extract
+    :param max_bytes: Number, Optional
+        The largest pdf that is downloaded
+
+    ----------
+
+    Returns
+    -------
+    :return: Dictionary
+        The link, title, topic and text of the pdf
+
+    -------
+    """
+    from pypdf import PdfReader
+    deadline = time.monotonic() + time_limit
+    previous_handler = signal.signal(signal.SIGALRM, _raise_time_limit)
+    # A timer rather than an alarm, since alarms only take whole seconds
+    signal.setitimer(signal.ITIMER_REAL, time_limit)
+    try:
+        with tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_SIZE) as pdf_file:
+            with requests.get(link, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=True) as response:
+                response.raise_for_status()
+                number_of_bytes = 0
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    if number_of_bytes == 0 and not chunk.lstrip().startswith(b'%PDF'):
+                        raise ValueError('The response is not a pdf')
+                    pdf_file.write(chunk)
+                    number_of_bytes += len(chunk)
+                    if number_of_bytes > max_bytes:
+                        raise ValueError(f'The pdf is larger than {max_bytes} bytes')
+                    if time.monotonic() > deadline:
+                        raise TimeoutError('The pdf took longer than its time limit to download')
+
+            pdf_file.seek(0)
+            reader = PdfReader(pdf_file)
+            pages = []
+            try:
+                for page in reader.pages:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError('The pdf took longer than its time limit to extract')
+                    pages.append(page.extract_text() or '')
+            except TimeoutError:
+                # The alarm can also interrupt a page in the middle of parsing it. Either way the pages extracted
+                # so far are kept rather than losing the whole document
+                print('Time limit reached after', len(pages), 'pages of', link)
+            # The metadata is read without the alarm, so it cannot discard the pages that were extracted
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+            metadata_title = reader.metadata.title if reader.metadata is not None else None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+    return {
+        'link': link,
+        'title': metadata_title or os.path.basename(urlparse(link).path),
+        'topic': topic,
+        'text': '\n\n'.join(pages)
+    }
+
+
+class CustomSearchPdfIngestion:
+    """
+    Ingests the pdf search results into the search corpus.
+
+    Pdfs are downloaded and extracted in a process pool with a time limit per document, and each document is
+    appended to the output csv as soon as it is extracted. The output uses the same link/title/topic/text schema
+    as the scraped websites, so the data processor picks the pdfs up with the rest of the raw search results.
+    """
+
+    def __init__(self, file_storage, max_workers=None, time_limit=PDF_TIME_LIMIT, max_bytes=MAX_PDF_BYTES):
+        """ Create a new instance of the CustomSearchPdfIngestion class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param max_workers: Number, Optional
+            The number of pdfs ingested at once (defaults to the number of cpus)
+        :param time_limit: Number, Optional
+            The number of seconds a single pdf may take to download and extract
+        :param max_bytes: Number, Optional
+            The largest pdf that is downloaded
+
+        ----------
+        """
+        self._file_storage = file_storage
+        self._max_workers = max_workers
+        self._time_limit = time_limit
+        self._max_bytes = max_bytes
+
+    @staticmethod
+    def get_pdf_file_path(file_path, topic):
+        """Gets the file path of the pdf results stored alongside the given search results
+
+        Parameters
+        ----------
+        :param file_path: String, Required
+            The file path where the raw search results are stored
+        :param topic: String, Required
+            The topic of the search
+
+        ----------
+        """
+        return os.path.join(os.path.dirname(file_path), f'{topic}-pdf-search-results.csv')
+
+    @staticmethod
+    def combine_with_pdf_corpus(file_storage, df, corpus_location=PDF_CORPUS_LOCATION):
+        """Adds the separately produced pdf corpus to the processed search data, if it exists
+
+        Pdf search results are ingested with the websites, so the separately produced pdf corpus is optional.
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param df: pd.DataFrame, Required
+            The processed search data
+        :param corpus_location: String, Optional
+            The pdf corpus, in the processed data directory
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The processed search data followed by the pdf corpus
+
+        -------
+        """
+        corpus_file = f'{file_storage.get_processed_base_path()}/{corpus_location}'
+        if not os.path.exists(corpus_file):
+            return df
+        print('Adding the pdf corpus', corpus_file)
+        return pd.concat([df, pd.read_csv(corpus_file, index_col=False)], ignore_index=True)
+
+    def ingest(self, search_results, file_path, topic):
+        """Extracts the text of the pdf search results and stores it as a csv in the raw data directory
+
+        Parameters
+        ----------
+        :param search_results: List, Required
+            The pdf search results from the Google Search API
+        :param file_path: String, Required
+            The file path where the raw pdf results are stored
+        :param topic: String, Required
+            The topic of the search
+
+        ----------
+        """
+        output_file = f'{self._file_storage.get_raw_base_path()}/{file_path}'
+        self._file_storage.create_directory_if_not_exists(output_file)
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+        links = list(dict.fromkeys(result['link'] for result in search_results))
+        print('Ingesting', len(links), 'pdfs')
+        number_of_documents = 0
+        with ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {executor.submit(extract_pdf, link, topic, self._time_limit, self._max_bytes): link
+                       for link in links}
+            for future in as_completed(futures):
+                try:
+                    document = future.result()
+                except Exception as error:
+                    print('&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&')
+                    print('An error occurred while processing', futures[future], 'Skipping...')
+                    print(error)
+                    print('&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&')
+                    continue
+
+                print('Extracted', document['title'])
+                pd.DataFrame([document]).to_csv(output_file, mode='a', index=False,
+                                                header=not os.path.exists(output_file))
+                number_of_documents += 1
+
+        print('Ingested', number_of_documents, 'pdfs for information.')
@@ -0,0 +1,308 @@
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.feature_extraction.text import HashingVectorizer
+from scipy import sparse
+from CustomSearchData import CustomSearchData
+from CustomSearchTextNormalizer import lexicon
+import pandas as pd
+import multiprocessing
+import threading
+import queue
+import os
+
+# Constants
+# Marks the end of the stream on every queue
+END_OF_STREAM = None
+# The number of processed documents hashed and written together
+HASH_BATCH_SIZE = 16
+
+# The normalizer of each worker process, set once when the worker starts
+_worker_normalizer = None
+
+
+def initialize_worker(normalizer):
+    """Keeps the normalizer in the worker process so it is not pickled with every document
+
+    Parameters
+    ----------
+    :param normalizer: CustomSearchTextNormalizer, Required
+        The normalizer applied to the extracted article text
+
+    ----------
+    """
+    global _worker_normalizer
+    _worker_normalizer = normalizer
+
+
+def extract_and_normalize(link, html, topic):
+    """Extracts the main article from the html and normalizes its text. Runs in a worker process
+
+    Parameters
+    ----------
+    :param link: String, Required
+        The link to the website
+    :param html: String, Required
+        The html of the website
+    :param topic: String, Required
+        The topic of the search
+
+    ----------
+    """
+    title, text = CustomSearchData.extract_article(html)
+    return {
+        'link': link,
+        'title': title,
+        'topic': topic,
+        'text': text,
+        'normalized_text': _worker_normalizer.filter_non_english_words(text)
+    }
+
+
+class CustomSearchPipeline:
+    """
+    Streams search results through scraping, readability extraction, normalization and feature hashing.
+
+    Each stage runs concurrently and hands documents to the next through a bounded queue, so a slow stage makes
+    the stages before it wait (backpressure) instead of buffering the whole corpus. Downloads run on threads,
+    extraction and normalization run in a process pool, and hashing and writing run on the calling thread.
+    """
+
+    def __init__(self, file_storage, normalizer, number_of_fetchers=8, number_of_processors=None, queue_size=32,
+                 n_features=2 ** 18, pdf_ingestion=None):
+        """ Create a new instance of the CustomSearchPipeline class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param normalizer: CustomSearchTextNormalizer, Required
+            The normalizer applied to the extracted article text
+        :param number_of_fetchers: Number, Optional
+            The number of websites downloaded at once
+        :param number_of_processors: Number, Optional
+            The number of worker processes extracting and normalizing articles (defaults to the number of cpus)
+        :param queue_size: Number, Optional
+            The number of documents each stage may hold before the stage feeding it has to wait
+        :param n_features: Number, Optional
+            The size of the hashed feature space
+        :param pdf_ingestion: CustomSearchPdfIngestion, Optional
+            Extracts the text of the pdf search results once the websites are processed, which are otherwise skipped
+
+        ----------
+        """
+        self._file_storage = file_storage
+        self._normalizer = normalizer
+        self._number_of_fetchers = number_of_fetchers
+        self._number_of_processors = number_of_processors
+        self._queue_size = queue_size
+        self._vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+        self._streamed_data_location = f'{file_storage.get_processed_base_path()}/streamed_search_results'
+        self._pdf_ingestion = pdf_ingestion
+
+    def run(self, search_results, file_path, topic):
+        """Streams the search results through the pipeline
+
+        Parameters
+        ----------
+        :param search_results: Iterable, Required
+            The search results from the Google Search API, which may still be arriving
+        :param file_path: String, Required
+            The file path where the raw search results are stored
+        :param topic: String, Required
+            The topic of the search
+
+        ----------
+        """
+        link_queue = queue.Queue(maxsize=self._queue_size)
+        html_queue = queue.Queue(maxsize=self._queue_size)
+        document_queue = queue.Queue(maxsize=self._queue_size)
+        pdf_results = []
+
+        # The workers share the lexicon of the normalizer, so it is built once here rather than by each worker
+        lexicon.ensure_built()
+        # The workers are started lazily while the download threads run, so they are started by a fork server
+        # rather than forked from this process, which could copy a lock held by one of its threads
+        with ProcessPoolExecutor(max_workers=self._number_of_processors, initializer=initialize_worker,
+                                 initargs=(self._normalizer,),
+                                 mp_context=multiprocessing.get_context('forkserver')) as executor:
+            threads = [threading.Thread(target=self.__feed, args=(search_results, link_queue, pdf_results),
+                                        daemon=True)]
+            threads += [threading.Thread(target=self.__fetch, args=(link_queue, html_queue), daemon=True)
+                        for _ in range(self._number_of_fetchers)]
+            threads.append(threading.Thread(target=self.__dispatch, args=(executor, html_queue, document_queue, topic),
+                                            daemon=True))
+            for thread in threads:
+                thread.start()
+
+            self.__consume(document_queue, file_path)
+            for thread in threads:
+                thread.join()
+
+        if self._pdf_ingestion is not None and len(pdf_results) > 0:
+            self._pdf_ingestion.ingest(pdf_results, self._pdf_ingestion.get_pdf_file_path(file_path, topic), topic)
+
+    def __feed(self, search_results, link_queue, pdf_results):
+        """Feeds the search results into the pipeline as they arrive
+
+        Parameters
+        ----------
+        :param search_results: Iterable, Required
+            The search results from the Google Search API
+        :param link_queue: queue.Queue, Required
+            The queue of search results waiting to be downloaded
+        :param pdf_results: List, Required
+            Collects the pdf search results, which are ingested separately
+
+        ----------
+        """
+        try:
+            for result in search_results:
+                if 'mime' in result and 'application/pdf' in result['mime']:
+                    pdf_results.append(result)
+                    continue
+                link_queue.put(result)
+        except Exception as error:
+            print('An error occurred while retrieving search results')
+            print(error)
+        finally:
+            for _ in range(self._number_of_fetchers):
+                link_queue.put(END_OF_STREAM)
+
+    def __fetch(self, link_queue, html_queue):
+        """Downloads websites until the end of the stream
+
+        Parameters
+        ----------
+        :param link_queue: queue.Queue, Required
+            The queue of search results waiting to be downloaded
+        :param html_queue: queue.Queue, Required
+            The queue of downloaded websites waiting to be processed
+
+        ----------
+        """
+        while True:
+            result = link_queue.get()
+            if result is END_OF_STREAM:
+                html_queue.put(END_OF_STREAM)
+                return
+            print('Scraping results from this link', result['link'])
+            try:
+                html_queue.put((result['link'], CustomSearchData.fetch_article_html(result['link'])))
+            except Exception as error:
+                print('An error occurred while downloading', result['link'], error)
+
+    def __dispatch(self, executor, html_queue, document_queue, topic):
+        """Submits downloaded websites to the process pool
+
+        The futures themselves go through the bounded document queue, which limits the number of documents
+        in flight in the process pool.
+
+        Parameters
+        ----------
+        :param executor: ProcessPoolExecutor, Required
+            The process pool extracting and normalizing articles
+        :param html_queue: queue.Queue, Required
+            The queue of downloaded websites waiting to be processed
+        :param document_queue: queue.Queue, Required
+            The queue of processed documents waiting to be hashed and written
+        :param topic: String, Required
+            The topic of the search
+
+        ----------
+        """
+        finished_fetchers = 0
+        while finished_fetchers < self._number_of_fetchers:
+            item = html_queue.get()
+            if item is END_OF_STREAM:
+                finished_fetchers += 1
+                continue
+            link, html = item
+            document_queue.put(executor.submit(extract_and_normalize, link, html, topic))
+        document_queue.put(END_OF_STREAM)
+
+    def __consume(self, document_queue, file_path):
+        """Hashes and writes the processed documents in small batches as they arrive
+
+        Parameters
+        ----------
+        :param document_queue: queue.Queue, Required
+            The queue of processed documents waiting to be hashed and written
+        :param file_path: String, Required
+            The file path where the raw search results are stored
+
+        ----------
+        """
+        name = os.path.basename(file_path).replace('.csv', '')
+        raw_file = f'{self._file_storage.get_raw_base_path()}/{file_path}'
+        normalized_file = f'{self._streamed_data_location}/{name}-normalized.csv'
+        hashed_file = f'{self._streamed_data_location}/{name}-hashed.npz'
+        for file in [raw_file, normalized_file]:
+            self._file_storage.create_directory_if_not_exists(file)
+            if os.path.exists(file):
+                os.remove(file)
+
+        batch = []
+        hashed_batches = []
+        number_of_documents = 0
+        while True:
+            future = document_queue.get()
+            if future is END_OF_STREAM:
+                break
+            try:
+                batch.append(future.result())
+            except Exception as error:
+                print('&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&')
+                print('An error occurred while processing a document. Skipping...')
+                print(error)
+                print('&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&&')
+                continue
+
+            if len(batch) >= HASH_BATCH_SIZE:
+                hashed_batches.append(self.__write_batch(batch, raw_file, normalized_file))
+                number_of_documents += len(batch)
+                batch = []
+
+        if len(batch) > 0:
+            hashed_batches.append(self.__write_batch(batch, raw_file, normalized_file))
+            number_of_documents += len(batch)
+
+        print('Scraped together', number_of_documents, 'websites for information.')
+        if len(hashed_batches) > 0:
+            sparse.save_npz(hashed_file, sparse.vstack(hashed_batches).tocsr())
+
+    def __write_batch(self, batch, raw_file, normalized_file):
+        """Hashes a batch of processed documents and appends it to the raw and normalized csvs
+
+        Parameters
+        ----------
+        :param batch: List, Required
+            The processed documents
+        :param raw_file: String, Required
+            The csv of raw search results, in the same layout CustomSearchData writes
+        :param normalized_file: String, Required
+            The csv of normalized search results
+
+        ----------
+        """
+        batch_df = pd.DataFrame(batch)
+        batch_df[['link', 'title', 'topic', 'text']].to_csv(raw_file, mode='a', index=False,
+                                                            header=not os.path.exists(raw_file))
+        normalized_df = batch_df[['link', 'title', 'topic', 'normalized_text']].rename(columns={'normalized_text': 'text'})
+        normalized_df.to_csv(normalized_file, mode='a', index=False, header=not os.path.exists(normalized_file))
+        print('Processed', batch_df.shape[0], 'websites')
+        return self._vectorizer.transform(batch_df['normalized_text'])
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from FileStorage import FileStorage
+    import S3Api
+    from CustomSearchDataProcessor import CustomSearchDataProcessor
+    from CustomSearchPdfIngestion import CustomSearchPdfIngestion
+    load_dotenv()
+    fs = FileStorage()
+    pipeline = CustomSearchPipeline(fs, CustomSearchDataProcessor(fs, None).get_normalizer(),
+                                    pdf_ingestion=CustomSearchPdfIngestion(fs))
+    search_data_instance = CustomSearchData(fs, S3Api.S3Api(), pipeline=pipeline)
+
+    print('Streaming the google search api results for covid 19 articles relating to food security')
+    search_data_instance.search(40, 'covid covid19 affect food security hunger', 'search_results/covid-search-results.csv', 'covid')
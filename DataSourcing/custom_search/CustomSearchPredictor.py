@@ -0,0 +1,98 @@
+import pandas as pd
+from CustomSearchData import CustomSearchData
+
+
+class CustomSearchPredictor:
+    """Classifies batches of new articles using fitted pipelines loaded once from the model store"""
+
+    def __init__(self, model_store, pipeline_names=None):
+        """ Create a new instance of the CustomSearchPredictor class
+
+        Parameters
+        ----------
+        :param model_store: CustomSearchModelStore, Required
+            The model store containing the fitted pipelines
+        :param pipeline_names: List, Optional
+            The pipelines used to classify articles (defaults to every stored pipeline)
+
+        ----------
+        """
+        names = pipeline_names if pipeline_names is not None else model_store.list_pipelines()
+        self._pipelines = {name: model_store.load_pipeline(name) for name in names}
+        print('Loaded pipelines', list(self._pipelines.keys()))
+
+    def predict(self, documents):
+        """Classifies a batch of raw article text with every loaded pipeline
+
+        Parameters
+        ----------
+        :param documents: List, Required
+            The raw text of each article
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            One row per article and one column of predicted topics per pipeline
+
+        -------
+        """
+        documents = list(documents)
+        predictions = pd.DataFrame(index=range(len(documents)))
+        if len(documents) == 0:
+            return predictions
+
+        # Pipelines sharing the same stop words share the (comparatively slow) normalization step
+        normalized_documents = {}
+        for name, pipeline in self._pipelines.items():
+            normalizer = pipeline['normalizer']
+            normalizer_key = frozenset(normalizer.get_stop_words())
+            if normalizer_key not in normalized_documents:
+                normalized_documents[normalizer_key] = normalizer.normalize_documents(documents)
+
+            features = pipeline['vectorizer'].transform(normalized_documents[normalizer_key])
+            if pipeline['dense_input']:
+                # The models are fit on labeled dataframes whose columns are the vectorizer vocabulary
+                features = pd.DataFrame(features.toarray(), columns=pipeline['feature_names'])
+            predictions[name] = pipeline['model'].predict(features)
+
+        return predictions
+
+    def predict_urls(self, urls):
+        """Scrapes and classifies a batch of article urls
+
+        Parameters
+        ----------
+        :param urls: List, Required
+            The urls of each article
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The link and title of every article that could be scraped, along with the predicted topics
+
+        -------
+        """
+        articles = []
+        for url in urls:
+            try:
+                title, text = CustomSearchData.scrape_article(url)
+                articles.append({'link': url, 'title': title, 'text': text})
+            except Exception as error:
+                print('An error occurred while scraping', url, error)
+
+        articles_df = pd.DataFrame(articles, columns=['link', 'title', 'text'])
+        predictions = self.predict(articles_df['text'])
+        return pd.concat([articles_df[['link', 'title']], predictions], axis=1)
+
+
+if __name__ == '__main__':
+    import sys
+    from FileStorage import FileStorage
+    from CustomSearchModelStore import CustomSearchModelStore
+
+    predictor = CustomSearchPredictor(CustomSearchModelStore(FileStorage()))
+    print(predictor.predict_urls(sys.argv[1:]))
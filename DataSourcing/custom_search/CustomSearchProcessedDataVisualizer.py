@@ -1,9 +1,7 @@
 import pandas as pd
-from wordcloud import WordCloud, STOPWORDS
-from sklearn.feature_extraction.text import CountVectorizer
-import matplotlib.pyplot as plt
 import S3Api
 import glob
+from CustomSearchWordCloudGenerator import CustomSearchWordCloudGenerator
 
 STORE_DATA = True
 
@@ -26,37 +24,13 @@ class CustomSearchProcessedDataVisualizer:
         self._s3_api = s3_api
         self.__processed_data_location = 'processed_data/search_results/cleaned_search_data.csv'
         self.__processed_visualizations_location = 'processed_data_visualizations/search_results'
+        self._wordcloud_generator = CustomSearchWordCloudGenerator()
 
     def visualize_processed_search_data(self):
         """ Visualizes the processed search data"""
         processed_df = pd.read_csv(self.__processed_data_location)
-        for group in processed_df.groupby(by=['topic']):
-            text_data = " ".join(group[1]['text'].to_list())
-            topic = group[0]
-            print('Generating wordcloud for topic', topic)
-            wordcloud = WordCloud(stopwords=STOPWORDS, background_color="white").generate(text_data)
-            plt.figure()
-            plt.imshow(wordcloud, interpolation="bilinear")
-            plt.axis("off")
-            plt.show()
-            print('Saving image to file')
-            # Save as an svg for scaling purposes
-            wordcloud_svg = wordcloud.to_svg(embed_font=True)
-            f = open(f'{self.__processed_visualizations_location}/{topic}_wordcloud.svg', "w+")
-            f.write(wordcloud_svg)
-            f.close()
-
-            vectorizer = CountVectorizer(stop_words="english")
-            matrix = vectorizer.fit_transform(group[1]['text'])
-            feature_names = vectorizer.get_feature_names()
-            values = matrix.toarray()
-            v_df = pd.DataFrame(values, columns=feature_names)
-            sums = matrix.sum(axis=0).tolist()[0]
-            print(feature_names)
-            print(sums)
-            sorted_frequencies = sorted(zip(feature_names, sums), key=lambda x: -x[1])
-            print(sorted_frequencies[0:10])
-            v_df.to_csv(f'processed_data/search_results/{topic}_vectorized.csv')
+        self._wordcloud_generator.generate(processed_df, f'{self.__processed_visualizations_location}/',
+                                           'processed_data/search_results/')
 
     def store_visualized_data(self):
         """Stores the processed visualization in S3"""
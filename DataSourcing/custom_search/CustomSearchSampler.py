@@ -0,0 +1,103 @@
+import numpy as np
+import pandas as pd
+
+
+class CustomSearchSampler:
+    """
+    Draws a reproducible, topic stratified sample of the search data for fast exploratory runs of the analysis.
+
+    The analysis classes write the results of a sampled run under a separate output prefix, so they never
+    overwrite the artifacts of a full run. Sampled runs are for exploration, so only the results of full runs are
+    stored in S3.
+    """
+
+    def __init__(self, sample_size, random_state=123, output_prefix='sampled_data/'):
+        """ Create a new instance of the CustomSearchSampler class
+
+        Parameters
+        ----------
+        :param sample_size: Number, Required
+            The number of documents in the sample
+        :param random_state: Number, Optional
+            The seed of the sample, so repeated runs use the same documents
+        :param output_prefix: String, Optional
+            The directory (ending in a slash) prepended to every output location of a sampled run
+
+        ----------
+        """
+        self._sample_size = sample_size
+        self._random_state = random_state
+        self._output_prefix = output_prefix
+
+    def get_output_prefix(self):
+        """Gets the directory prepended to every output location of a sampled run"""
+        return self._output_prefix
+
+    def sample(self, df, label_column='topic'):
+        """Samples the documents, keeping the proportion of each topic
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The search data
+        :param label_column: String, Optional
+            The column the sample is stratified by
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The sampled documents, or every document if the sample size is larger than the search data. The sample
+            has at least one document of each topic, even a topic with a single document
+
+        -------
+        """
+        sample_size = self._sample_size
+        number_of_topics = df[label_column].nunique()
+        if sample_size < number_of_topics:
+            print('The sample size is smaller than the number of topics, sampling one document per topic')
+            sample_size = number_of_topics
+        if sample_size >= df.shape[0]:
+            print('The sample size is larger than the search data, using all', df.shape[0], 'documents')
+            return df
+
+        topic_sizes = df[label_column].value_counts().sort_index()
+        topic_sample_sizes = self.__allocate(topic_sizes.to_numpy(), sample_size)
+        random_state = np.random.RandomState(self._random_state)
+        sample_df = pd.concat([df[df[label_column] == topic].sample(n=topic_sample_size, random_state=random_state)
+                               for topic, topic_sample_size in zip(topic_sizes.index, topic_sample_sizes)])
+        print('Sampled', sample_df.shape[0], 'of', df.shape[0], 'documents')
+        print(sample_df[label_column].value_counts())
+        return sample_df.sort_index().reset_index(drop=True)
+
+    @staticmethod
+    def __allocate(topic_sizes, sample_size):
+        """Splits the sample between the topics in proportion to their size, with at least one document each
+
+        Topics with a single document cannot be split by a stratified train test split, so the number of
+        documents of each topic is allocated here instead, giving the remainders to the largest fractions.
+
+        Parameters
+        ----------
+        :param topic_sizes: np.array, Required
+            The number of documents of each topic
+        :param sample_size: Number, Required
+            The number of documents in the sample, at least the number of topics and less than the documents
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            The number of documents sampled from each topic
+
+        -------
+        """
+        # Every topic gets one document, and the rest are shared in proportion to the documents left in each topic
+        remaining_sizes = topic_sizes - 1
+        quotas = remaining_sizes * (sample_size - topic_sizes.shape[0]) / remaining_sizes.sum()
+        allocation = np.floor(quotas).astype(np.int64)
+        shortfall = sample_size - topic_sizes.shape[0] - allocation.sum()
+        allocation[np.argsort(allocation - quotas, kind='stable')[:shortfall]] += 1
+        return allocation + 1
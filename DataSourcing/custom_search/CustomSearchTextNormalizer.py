@@ -0,0 +1,89 @@
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from CustomSearchLexicon import CustomSearchLexicon
+import re
+
+# The pattern of nltk's wordpunct_tokenize, without importing nltk in every process
+TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]+')
+
+# Shared by every normalizer in the process and memory mapped on first use
+lexicon = CustomSearchLexicon()
+# The lexicon keep mask for each set of additional stop words
+_keep_masks = {}
+
+
+class CustomSearchTextNormalizer:
+    """
+    Normalizes search result text into lowercased, lemmatized english words without stop words.
+
+    The normalizer only holds its stop words, so it can be pickled alongside a fitted vectorizer and model. The
+    english words and their lemmas come from the shared, memory mapped lexicon.
+    """
+
+    def __init__(self, additional_stop_words):
+        """ Create a new instance of the CustomSearchTextNormalizer class
+
+        Parameters
+        ----------
+        :param additional_stop_words: List, Required
+            The stop words removed on top of the sklearn english stop words
+
+        ----------
+        """
+        self._additional_stop_words = list(additional_stop_words)
+        self._defined_stop_words = set(ENGLISH_STOP_WORDS.union(self._additional_stop_words))
+
+    def get_stop_words(self):
+        """Gets the stop words removed by the normalizer"""
+        return self._defined_stop_words
+
+    def filter_non_english_words(self, corpus):
+        """ Filters, lowercases, and lemmatizes non english words using the nltk word list.
+        Partial credit goes to this Stackoverflow answer
+        https://stackoverflow.com/questions/41290028/removing-non-english-words-from-text-using-python
+
+
+        Parameters
+        ----------
+        :param corpus: String, Required
+            The corpus of text
+
+        ----------
+
+        Returns
+        -------
+        :return: String
+            A corpus of text without non-english words
+
+        -------
+        """
+
+        indices = lexicon.lookup([w.lower() for w in TOKEN_PATTERN.findall(corpus)])
+        indices = indices[indices >= 0]
+        indices = indices[self.__get_keep_mask()[indices]]
+        return " ".join(lexicon.get_lemmas(indices))
+
+    def __get_keep_mask(self):
+        """Gets whether each lexicon entry survives the length and stop word filters of this normalizer"""
+        key = tuple(sorted(self._additional_stop_words))
+        if key not in _keep_masks:
+            _keep_masks[key] = lexicon.get_keep_mask(self._additional_stop_words)
+        return _keep_masks[key]
+
+    def normalize_documents(self, documents):
+        """Normalizes a batch of documents
+
+        Parameters
+        ----------
+        :param documents: Iterable, Required
+            The raw text of each document
+
+        ----------
+
+        Returns
+        -------
+        :return: List
+            The normalized text of each document
+
+        -------
+        """
+        return [self.filter_non_english_words(document) for document in documents]
@@ -0,0 +1,198 @@
+import pandas as pd
+import S3Api
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer, ENGLISH_STOP_WORDS
+from sklearn.decomposition import LatentDirichletAllocation, MiniBatchNMF
+import numpy as np
+import glob
+from CustomSearchModelStore import CustomSearchModelStore
+from CustomSearchPdfIngestion import CustomSearchPdfIngestion
+
+# Constants
+STORE_DATA = True
+# Whether to update the stored topic models with newly processed documents instead of training them from scratch
+ONLINE_UPDATE = False
+NUMBER_OF_TOPICS = 8
+# The number of documents in each mini batch and the number of passes over the corpus when training
+BATCH_SIZE = 128
+NUMBER_OF_PASSES = 10
+NUMBER_OF_TOP_TERMS = 15
+
+
+class CustomSearchTopicModeling:
+
+    def __init__(self, file_storage, s3_api):
+        """ Create a new instance of the CustomSearchTopicModeling class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param s3_api: S3_API, Required
+            The S3 api wrapper class used to store data in AWS S3
+
+        ----------
+        """
+        self._file_storage = file_storage
+        self._s3_api = s3_api
+        self.__processed_data_location = 'processed_data/search_results/cleaned_search_data.csv'
+
+        self.__topic_model_data_location = 'topic_model_data/search_results'
+        self._file_storage.create_directory_if_not_exists(f'{self.__topic_model_data_location}/document_topics/')
+        self._file_storage.create_directory_if_not_exists(f'{self.__topic_model_data_location}/topic_terms/')
+        # The topic models are not text classifiers, so they are kept apart from the classification pipelines
+        self._model_store = CustomSearchModelStore(file_storage, f'{self.__topic_model_data_location}/models/')
+        self._additional_stop_words = ['title', 'journal', 'volume', 'author', 'scholar', 'article', 'issue']
+        self._stop_words = list(ENGLISH_STOP_WORDS.union(self._additional_stop_words))
+
+    def model_search_data(self):
+        """Trains the topic models on the whole corpus using mini batches"""
+        df = self.__load_search_data()
+
+        print('----------------------------------')
+        print('Training online LDA on the count matrix')
+        print('----------------------------------')
+        vectorizer = CountVectorizer(stop_words=self._stop_words)
+        matrix = vectorizer.fit_transform(df['text'])
+        lda_model = LatentDirichletAllocation(n_components=NUMBER_OF_TOPICS,
+                                              learning_method='online',
+                                              batch_size=BATCH_SIZE,
+                                              total_samples=matrix.shape[0],
+                                              random_state=123)
+        self.__train_in_mini_batches(lda_model, matrix)
+        self.__save_topic_model('lda', vectorizer, lda_model, df)
+
+        print('----------------------------------')
+        print('Training mini batch NMF on the tfidf matrix')
+        print('----------------------------------')
+        vectorizer = TfidfVectorizer(stop_words=self._stop_words)
+        matrix = vectorizer.fit_transform(df['text'])
+        nmf_model = MiniBatchNMF(n_components=NUMBER_OF_TOPICS, batch_size=BATCH_SIZE, random_state=123)
+        self.__train_in_mini_batches(nmf_model, matrix)
+        self.__save_topic_model('nmf', vectorizer, nmf_model, df)
+
+    def update_topic_models(self):
+        """Updates the stored topic models with only the documents they have not been trained on yet
+
+        If a topic model has not been stored yet, the topic models are trained on the whole corpus instead.
+        """
+        if not all(self._model_store.contains_pipeline(model_type) for model_type in ['lda', 'nmf']):
+            print('No stored topic models to update, training them on the whole corpus')
+            self.model_search_data()
+            return
+
+        df = self.__load_search_data()
+        for model_type in ['lda', 'nmf']:
+            # The models are updated in place, so they are loaded as writable copies rather than memory mapped
+            pipeline = self._model_store.load_pipeline(model_type, mmap_mode=None)
+            vectorizer = pipeline['vectorizer']
+            model = pipeline['model']
+            trained_links = pipeline['metadata']['trained_links']
+
+            new_df = df[~df['link'].isin(set(trained_links))]
+            if new_df.shape[0] == 0:
+                print('No new documents to update the', model_type, 'topic model with')
+                continue
+            print('Updating the', model_type, 'topic model with', new_df.shape[0], 'new documents')
+
+            # The vocabulary is fixed by the original fit, so new documents are only transformed
+            self.__train_in_mini_batches(model, vectorizer.transform(new_df['text']), number_of_passes=1)
+            self.__save_topic_model(model_type, vectorizer, model, df, trained_links + new_df['link'].to_list())
+
+    def __load_search_data(self):
+        """Loads the processed search data combined with the processed pdf data"""
+        processed_df = pd.read_csv(self.__processed_data_location, index_col=False)
+        df = CustomSearchPdfIngestion.combine_with_pdf_corpus(self._file_storage, processed_df)
+        return df.drop_duplicates(subset=['link']).reset_index(drop=True)
+
+    def __train_in_mini_batches(self, model, matrix, number_of_passes=NUMBER_OF_PASSES):
+        """Trains a topic model with partial_fit over shuffled mini batches of the sparse matrix
+
+        Parameters
+        ----------
+        :param model: LatentDirichletAllocation or MiniBatchNMF, Required
+            The topic model
+        :param matrix: scipy.sparse.csr_matrix, Required
+            The vectorized documents
+        :param number_of_passes: Number, Optional
+            The number of passes over the documents
+
+        ----------
+        """
+        random_state = np.random.RandomState(123)
+        for number_of_pass in range(number_of_passes):
+            print('Training pass', number_of_pass + 1, 'of', number_of_passes)
+            order = random_state.permutation(matrix.shape[0])
+            for start in range(0, matrix.shape[0], BATCH_SIZE):
+                model.partial_fit(matrix[order[start:start + BATCH_SIZE]])
+
+    def __save_topic_model(self, model_type, vectorizer, model, df, trained_links=None):
+        """Stores the topic model and writes the document topic mixtures and the top terms of each topic
+
+        Parameters
+        ----------
+        :param model_type: String, Required
+            The type of topic model, used in the output file names
+        :param vectorizer: CountVectorizer or TfidfVectorizer, Required
+            The fitted vectorizer
+        :param model: LatentDirichletAllocation or MiniBatchNMF, Required
+            The fitted topic model
+        :param df: pd.DataFrame, Required
+            The search data
+        :param trained_links: List, Optional
+            The links of every document the model has been trained on (defaults to every document in df)
+
+        ----------
+        """
+        trained_links = trained_links if trained_links is not None else df['link'].to_list()
+        self._model_store.save_pipeline(model_type, None, vectorizer, model, dense_input=False,
+                                        metadata={'trained_links': trained_links})
+
+        mixtures = model.transform(vectorizer.transform(df['text']))
+        # NMF weights are unnormalized, so they are scaled into mixtures to match LDA
+        mixtures = mixtures / np.maximum(mixtures.sum(axis=1, keepdims=True), np.finfo(np.float64).tiny)
+        document_topics_df = pd.DataFrame(mixtures, columns=[f'Topic{i}' for i in range(mixtures.shape[1])])
+        document_topics_df.insert(loc=0, column='topic', value=df['topic'])
+        document_topics_df.insert(loc=0, column='link', value=df['link'])
+        document_topics_df['DominantTopic'] = mixtures.argmax(axis=1)
+        document_topics_df.to_csv(f'{self.__topic_model_data_location}/document_topics/{model_type}.csv', index=False)
+
+        feature_names = vectorizer.get_feature_names_out()
+        topic_terms = []
+        for topic_number, weights in enumerate(model.components_):
+            top_terms = np.argsort(weights)[::-1][:NUMBER_OF_TOP_TERMS]
+            for rank, term in enumerate(top_terms):
+                topic_terms.append({'Topic': topic_number, 'Rank': rank + 1, 'Term': feature_names[term],
+                                    'Weight': weights[term]})
+        topic_terms_df = pd.DataFrame(topic_terms)
+        topic_terms_df.to_csv(f'{self.__topic_model_data_location}/topic_terms/{model_type}.csv', index=False)
+        print(topic_terms_df.groupby('Topic')['Term'].apply(lambda terms: ', '.join(terms)))
+
+    def store_topic_model_data(self):
+        print('Store topic model search data in S3')
+
+        topic_model_csv_data = list(glob.iglob(f'{self.__topic_model_data_location}/**/*.csv', recursive=True))
+        for file in topic_model_csv_data:
+            print('Opening file', file)
+            df = pd.read_csv(file)
+            print('Attempting to upload topic model search data to s3')
+            self._s3_api.upload_df(df, file.replace('topic_model_data/', ''), S3Api.S3Location.TOPIC_MODEL_DATA)
+            print('Uploading', file, 'to S3')
+            print('Successfully uploaded')
+
+        print('Uploaded all files')
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from FileStorage import FileStorage
+    load_dotenv()
+    fs = FileStorage()
+
+    search_topic_modeling = CustomSearchTopicModeling(fs, S3Api.S3Api())
+    if ONLINE_UPDATE:
+        search_topic_modeling.update_topic_models()
+    else:
+        search_topic_modeling.model_search_data()
+
+    if STORE_DATA:
+        search_topic_modeling.store_topic_model_data()
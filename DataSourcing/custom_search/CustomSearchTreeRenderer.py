@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from sklearn import tree
+import subprocess
+import hashlib
+import shutil
+import os
+
+# Constants
+RENDER_CACHE_FOLDER = '.render_cache'
+
+
+class CustomSearchTreeRenderer:
+    """
+    Renders fitted decision trees with graphviz on a background worker pool.
+
+    Rendered images are cached by a hash of the exported tree (and the render options), so a tree that has not
+    changed between runs is copied out of the cache rather than rendered again.
+    """
+
+    def __init__(self, output_location, max_workers=None):
+        """ Create a new instance of the CustomSearchTreeRenderer class
+
+        Parameters
+        ----------
+        :param output_location: String, Required
+            The directory where the dot files and rendered trees are written
+        :param max_workers: Number, Optional
+            The number of graphviz processes allowed to run at once (defaults to the number of cpus)
+
+        ----------
+        """
+        self._output_location = output_location
+        self._cache_location = f'{output_location}{RENDER_CACHE_FOLDER}/'
+        os.makedirs(self._cache_location, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or os.cpu_count())
+        self._pending_renders = []
+
+    def submit(self, dt, feature_names, class_names, file_description, image_format='png', dpi=600, max_depth=None):
+        """Exports the tree to a dot file and queues it to be rendered without waiting for graphviz
+
+        Parameters
+        ----------
+        :param dt: DecisionTreeClassifier, Required
+            The fitted decision tree
+        :param feature_names: List, Required
+            The names of each feature used to fit the tree
+        :param class_names: List, Required
+            The names of each class
+        :param file_description: String, Required
+            The description used in the output file names
+        :param image_format: String, Optional
+            The graphviz output format, 'png' or the much cheaper 'svg'
+        :param dpi: Number, Optional
+            The resolution of png renders (ignored for svg)
+        :param max_depth: Number, Optional
+            Truncates the rendered tree to this depth, which keeps overfit trees cheap to render
+
+        ----------
+
+        Returns
+        -------
+        :return: concurrent.futures.Future
+            A future resolving to the path of the rendered image
+
+        -------
+        """
+        dot_source = tree.export_graphviz(dt,
+                                          out_file=None,
+                                          feature_names=feature_names,
+                                          class_names=class_names,
+                                          max_depth=max_depth,
+                                          filled=True,
+                                          rounded=True,
+                                          proportion=False,
+                                          precision=2)
+        dot_file = f'{self._output_location}decision_tree_{file_description}.dot'
+        with open(dot_file, 'w') as f:
+            f.write(dot_source)
+
+        render_options = [f'-T{image_format}']
+        if image_format == 'png':
+            render_options.append(f'-Gdpi={dpi}')
+        render_key = hashlib.sha256('\n'.join([dot_source] + render_options).encode('utf-8')).hexdigest()
+        output_file = f'{self._output_location}decision_tree_{file_description}.{image_format}'
+
+        future = self._executor.submit(self.__render, dot_file, render_options, render_key, image_format, output_file)
+        self._pending_renders.append(future)
+        return future
+
+    def __render(self, dot_file, render_options, render_key, image_format, output_file):
+        """Renders a dot file with graphviz unless the same tree has already been rendered
+
+        Parameters
+        ----------
+        :param dot_file: String, Required
+            The path of the dot file to render
+        :param render_options: List, Required
+            The graphviz command line options
+        :param render_key: String, Required
+            The hash of the tree structure and render options
+        :param image_format: String, Required
+            The graphviz output format
+        :param output_file: String, Required
+            The path where the rendered image is written
+
+        ----------
+        """
+        cached_file = f'{self._cache_location}{render_key}.{image_format}'
+        if os.path.exists(cached_file):
+            print('Tree is unchanged, reusing cached render for', output_file)
+        else:
+            # Render to a temporary file first so an interrupted render never poisons the cache
+            temporary_file = f'{cached_file}.tmp'
+            subprocess.run(['dot', *render_options, dot_file, '-o', temporary_file], check=True)
+            os.replace(temporary_file, cached_file)
+            print('Saved decision tree to image using graphviz', output_file)
+        shutil.copyfile(cached_file, output_file)
+        return output_file
+
+    def wait(self):
+        """Blocks until every queued render has finished, printing any render that failed"""
+        for future in self._pending_renders:
+            try:
+                future.result()
+            except Exception as error:
+                print('An error occurred while rendering a decision tree')
+                print(error)
+        self._pending_renders = []
+
+    def shutdown(self):
+        """Waits for the queued renders and releases the worker pool"""
+        self.wait()
+        self._executor.shutdown()
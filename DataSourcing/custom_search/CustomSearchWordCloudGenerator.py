@@ -0,0 +1,122 @@
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.feature_extraction.text import CountVectorizer
+import pandas as pd
+import numpy as np
+import hashlib
+import shutil
+import json
+import os
+
+# Constants
+WORDCLOUD_CACHE_FOLDER = '.wordcloud_cache'
+
+
+def render_wordcloud_svg(frequencies, wordcloud_options):
+    """Renders a wordcloud from term frequencies as an svg. Kept at the module level so it can run in a worker process
+
+    Parameters
+    ----------
+    :param frequencies: Dictionary, Required
+        The frequency of each term
+    :param wordcloud_options: Dictionary, Required
+        The keyword arguments used to create the WordCloud
+
+    ----------
+    """
+    from wordcloud import WordCloud
+    wordcloud = WordCloud(**wordcloud_options).generate_from_frequencies(frequencies)
+    # Save as an svg for scaling purposes
+    return wordcloud.to_svg(embed_font=True)
+
+
+class CustomSearchWordCloudGenerator:
+    """
+    Generates a wordcloud and a vectorized csv for each topic of the search data.
+
+    The text is vectorized once into a sparse count matrix, the topic frequencies are summed from it, and the
+    wordclouds are rendered in parallel. Rendered svgs are cached by a hash of their frequencies, so a topic
+    whose documents have not changed is never rendered again.
+    """
+
+    def __init__(self, max_workers=None):
+        """ Create a new instance of the CustomSearchWordCloudGenerator class
+
+        Parameters
+        ----------
+        :param max_workers: Number, Optional
+            The number of wordclouds rendered at once (defaults to the number of cpus)
+
+        ----------
+        """
+        self._max_workers = max_workers
+        self._wordcloud_options = {'background_color': 'white'}
+
+    def generate(self, processed_df, visualizations_location, data_location):
+        """Generates the wordclouds and vectorized csvs for each topic
+
+        Parameters
+        ----------
+        :param processed_df: pd.DataFrame, Required
+            The processed search data with a topic and text column
+        :param visualizations_location: String, Required
+            The directory (ending in a slash) where the wordcloud svgs are written
+        :param data_location: String, Required
+            The directory (ending in a slash) where the vectorized csvs are written
+
+        ----------
+        """
+        # wordcloud imports matplotlib, so it is only loaded when wordclouds are generated
+        from wordcloud import STOPWORDS
+        vectorizer = CountVectorizer(stop_words='english')
+        matrix = vectorizer.fit_transform(processed_df['text']).tocsr()
+        feature_names = vectorizer.get_feature_names_out()
+        topics = processed_df['topic'].to_numpy()
+        # The wordcloud stop words are applied to the frequencies, since generate_from_frequencies skips them
+        wordcloud_stop_words = np.array([term in STOPWORDS for term in feature_names])
+
+        cache_location = f'{visualizations_location}{WORDCLOUD_CACHE_FOLDER}/'
+        os.makedirs(cache_location, exist_ok=True)
+
+        renders = {}
+        with ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+            for topic in np.unique(topics):
+                print('Generating wordcloud for topic', topic)
+                topic_matrix = matrix[topics == topic]
+                sums = np.asarray(topic_matrix.sum(axis=0)).ravel()
+                topic_columns = np.flatnonzero(sums)
+
+                # Only the terms used by this topic are written, matching a vectorizer fit on the topic alone
+                v_df = pd.DataFrame(topic_matrix[:, topic_columns].toarray(), columns=feature_names[topic_columns])
+                v_df.to_csv(f'{data_location}{topic}_vectorized.csv')
+
+                cloud_columns = topic_columns[~wordcloud_stop_words[topic_columns]]
+                frequencies = {str(feature_names[i]): int(sums[i]) for i in cloud_columns}
+                frequencies_key = self.__frequencies_key(frequencies)
+                output_file = f'{visualizations_location}{topic}_wordcloud.svg'
+                cached_file = f'{cache_location}{frequencies_key}.svg'
+                if os.path.exists(cached_file):
+                    print('Frequencies are unchanged, reusing cached wordcloud for topic', topic)
+                    shutil.copyfile(cached_file, output_file)
+                else:
+                    future = executor.submit(render_wordcloud_svg, frequencies, self._wordcloud_options)
+                    renders[topic] = (future, cached_file, output_file)
+
+            for topic, (future, cached_file, output_file) in renders.items():
+                wordcloud_svg = future.result()
+                print('Saving wordcloud to file for topic', topic)
+                with open(cached_file, 'w') as f:
+                    f.write(wordcloud_svg)
+                shutil.copyfile(cached_file, output_file)
+
+    def __frequencies_key(self, frequencies):
+        """Hashes the term frequencies and wordcloud options into a cache key
+
+        Parameters
+        ----------
+        :param frequencies: Dictionary, Required
+            The frequency of each term
+
+        ----------
+        """
+        contents = json.dumps([sorted(frequencies.items()), self._wordcloud_options], sort_keys=True)
+        return hashlib.sha256(contents.encode('utf-8')).hexdigest()
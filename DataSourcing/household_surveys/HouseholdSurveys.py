@@ -3,11 +3,17 @@ import requests
 import re
 import S3Api
 from datetime import datetime
+import asyncio
 import json
 import glob
+import os
 
 # Constants
 STORE_DATA = False
+# Whether to explore the census directory and download the workbooks concurrently, skipping unchanged files
+CRAWL = True
+MAX_CONCURRENT_REQUESTS = 8
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
 
 class HouseholdSurveysApi:
@@ -32,6 +38,7 @@ class HouseholdSurveysApi:
         self._household_surveys_data_table_endpoint = 'https://www.census.gov/programs-surveys/household-pulse-survey/data.html'
         self._file_storage = file_storage
         self._s3_api = s3_api
+        self._download_manifest = 'survey_data/download_manifest.json'
 
     def retrieve_survey_data(self):
         """Retrieves the raw weekly survey data and saves it"""
@@ -48,6 +55,188 @@ class HouseholdSurveysApi:
         self.retrieve_household_survey_dates()
         return survey_data
 
+    def crawl_survey_data(self, max_concurrent_requests=MAX_CONCURRENT_REQUESTS):
+        """Retrieves the raw weekly survey data by crawling the census directory concurrently
+
+        Workbooks are streamed to disk in chunks as soon as their week has been listed. A workbook in the download
+        manifest is requested with If-Modified-Since and skipped when the census answers that it has not changed, so
+        a weekly refresh only downloads the new week.
+
+        Parameters
+        ----------
+        :param max_concurrent_requests: Number, Optional
+            The number of requests to the census made at once
+
+        ----------
+        """
+        survey_data = asyncio.run(self.__crawl(max_concurrent_requests))
+        print('Saved all surveys')
+
+        self.retrieve_household_survey_dates()
+        return survey_data
+
+    async def __crawl(self, max_concurrent_requests):
+        """Crawls the census directory, downloading every food survey workbook
+
+        Parameters
+        ----------
+        :param max_concurrent_requests: Number, Required
+            The number of requests to the census made at once
+
+        ----------
+        """
+        import aiohttp
+        manifest = self.__load_manifest()
+        semaphore = asyncio.Semaphore(max_concurrent_requests)
+        connector = aiohttp.TCPConnector(limit=max_concurrent_requests)
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=30, sock_read=60)
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                soup = await self.__fetch_soup(session, semaphore, self._household_surveys_endpoint)
+                survey_years = self.retrieve_survey_years(soup)
+                survey_weeks = await asyncio.gather(*[self.__crawl_year(session, semaphore, manifest, survey_year)
+                                                      for survey_year in survey_years])
+        finally:
+            self.__save_manifest(manifest)
+        return dict(zip(survey_years, survey_weeks))
+
+    async def __crawl_year(self, session, semaphore, manifest, survey_year):
+        """Crawls the weeks of a survey year
+
+        Parameters
+        ----------
+        :param session: aiohttp.ClientSession, Required
+            The http session
+        :param semaphore: asyncio.Semaphore, Required
+            Bounds the number of requests made at once
+        :param manifest: Dictionary, Required
+            The size and last modified date of every downloaded workbook
+        :param survey_year: String, Required
+            The year the surveys were run
+
+        ----------
+        """
+        soup = await self.__fetch_soup(session, semaphore, f'{self._household_surveys_endpoint}{survey_year}/')
+        survey_weeks = self.retrieve_survey_weeks(soup)
+        surveys = await asyncio.gather(*[self.__crawl_week(session, semaphore, manifest, survey_year, survey_week)
+                                         for survey_week in survey_weeks])
+        return dict(zip(survey_weeks, surveys))
+
+    async def __crawl_week(self, session, semaphore, manifest, survey_year, survey_week):
+        """Lists the food surveys of a week and downloads them
+
+        Parameters
+        ----------
+        :param session: aiohttp.ClientSession, Required
+            The http session
+        :param semaphore: asyncio.Semaphore, Required
+            Bounds the number of requests made at once
+        :param manifest: Dictionary, Required
+            The size and last modified date of every downloaded workbook
+        :param survey_year: String, Required
+            The year the surveys were run
+        :param survey_week: String, Required
+            The week the surveys were run
+
+        ----------
+        """
+        soup = await self.__fetch_soup(session, semaphore,
+                                       f'{self._household_surveys_endpoint}{survey_year}/{survey_week}/')
+        surveys = self.retrieve_survey_xlsx(soup)
+        await asyncio.gather(*[self.__download_survey(session, semaphore, manifest, survey_year, survey_week, survey)
+                               for survey in surveys])
+        return surveys
+
+    async def __fetch_soup(self, session, semaphore, endpoint):
+        """Retrieves and parses a census directory listing
+
+        Parameters
+        ----------
+        :param session: aiohttp.ClientSession, Required
+            The http session
+        :param semaphore: asyncio.Semaphore, Required
+            Bounds the number of requests made at once
+        :param endpoint: String, Required
+            The directory listing
+
+        ----------
+        """
+        async with semaphore:
+            async with session.get(endpoint) as response:
+                response.raise_for_status()
+                return BeautifulSoup(await response.text(), 'lxml')
+
+    async def __download_survey(self, session, semaphore, manifest, survey_year, survey_week, survey):
+        """Streams a survey workbook to disk, unless it is unchanged since the last download
+
+        Parameters
+        ----------
+        :param session: aiohttp.ClientSession, Required
+            The http session
+        :param semaphore: asyncio.Semaphore, Required
+            Bounds the number of requests made at once
+        :param manifest: Dictionary, Required
+            The size and last modified date of every downloaded workbook
+        :param survey_year: String, Required
+            The year the surveys were run
+        :param survey_week: String, Required
+            The week the surveys were run
+        :param survey: String, Required
+            The file name of the workbook
+
+        ----------
+        """
+        file_name = f'survey_data/{survey_year}/{survey_week}/{survey}'
+        file_path = f'{self._file_storage.get_raw_base_path()}/{file_name}'
+        survey_endpoint = f'{self._household_surveys_endpoint}{survey_year}/{survey_week}/{survey}'
+        previous_version = manifest.get(file_name)
+        headers = {}
+        if previous_version is not None and previous_version.get('last_modified') and os.path.exists(file_path) and \
+                os.path.getsize(file_path) == previous_version['size']:
+            # The server only sends the workbook back if it changed since the downloaded copy
+            headers['If-Modified-Since'] = previous_version['last_modified']
+        async with semaphore:
+            async with session.get(survey_endpoint, headers=headers) as response:
+                if response.status == 304:
+                    print('Survey', survey, 'from week', survey_week, 'is unchanged, skipping')
+                    return
+                response.raise_for_status()
+                version = {'size': response.content_length, 'last_modified': response.headers.get('Last-Modified')}
+                if headers and previous_version == version:
+                    # Servers ignoring the conditional request still send the same size and last modified date
+                    print('Survey', survey, 'from week', survey_week, 'is unchanged, skipping')
+                    return
+
+                print('Retrieving survey with name', survey, 'from week', survey_week)
+                self._file_storage.create_directory_if_not_exists(file_path)
+                # The workbook is written to a temporary file first so an interrupted download never looks complete
+                temporary_file_path = f'{file_path}.part'
+                with open(temporary_file_path, 'wb') as f:
+                    async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(temporary_file_path, file_path)
+                manifest[file_name] = version
+
+    def __load_manifest(self):
+        """Loads the size and last modified date of every downloaded workbook"""
+        manifest_path = f'{self._file_storage.get_raw_base_path()}/{self._download_manifest}'
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def __save_manifest(self, manifest):
+        """Saves the size and last modified date of every downloaded workbook
+
+        Parameters
+        ----------
+        :param manifest: Dictionary, Required
+            The size and last modified date of every downloaded workbook
+
+        ----------
+        """
+        self._file_storage.store_as_file(self._download_manifest, json.dumps(manifest, indent=4, sort_keys=True))
+
     def retrieve_survey_years(self, soup):
         """Parses the html using BeautifulSoup to determine the years the survey was issued
 
@@ -187,7 +376,10 @@ if __name__ == '__main__':
     household_surveys_instance = HouseholdSurveysApi(FileStorage(), S3Api.S3Api())
 
     print('Retrieving raw household survey data')
-    household_surveys_instance.retrieve_survey_data()
+    if CRAWL:
+        household_surveys_instance.crawl_survey_data()
+    else:
+        household_surveys_instance.retrieve_survey_data()
 
     if STORE_DATA:
         print('Storing raw household survey data')
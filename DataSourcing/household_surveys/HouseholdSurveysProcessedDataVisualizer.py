@@ -1,52 +1,258 @@
-import plotly.express as px
-import pandas as pd
-import os
+from concurrent.futures import ProcessPoolExecutor
 import S3Api
+from household_surveys.HouseholdSurveysStore import HouseholdSurveysStore, QUESTIONS
 import us
 import glob
 import codecs
+import hashlib
+import json
+import os
 
 
 STORE_DATA = False
+# The directory of the dashboards and the assets they share
+SURVEY_DATA_PATH = 'processed_data_visualizations/survey_data/'
+# The number of state charts rendered at once (defaults to the number of cpus)
+MAX_WORKERS = None
+# The dashboard loads the data of a state when it is selected, sharing one copy of plotly.js and the chart template
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>{title}</title>
+    <script src="{plotly_js}"></script>
+</head>
+<body>
+    <select id="state"></select>
+    <div id="chart" style="height: 90vh;"></div>
+    <script>
+        const states = {states};
+        const template = {template};
+        const figures = {{}};
+        const select = document.getElementById('state');
+        states.forEach(([state, name]) => select.add(new Option(name, state)));
+
+        async function showState(state) {{
+            if (!(state in figures)) {{
+                const response = await fetch(`${{state}}.json`);
+                figures[state] = await response.json();
+            }}
+            const figure = figures[state];
+            Plotly.react('chart', figure.data, Object.assign({{}}, figure.layout, {{template: template}}));
+        }}
+
+        select.addEventListener('change', () => showState(select.value));
+        if (states.length > 0) {{
+            showState(states[0][0]);
+        }}
+    </script>
+</body>
+</html>
+"""
+
+
+def render_state_figure(full_state, df):
+    """Renders the survey chart of a state as plotly json. Kept at the module level so it can run in a worker process
+
+    Parameters
+    ----------
+    :param full_state: String, Required
+        The name of the state
+    :param df: pd.DataFrame, Required
+        The survey totals of the state
+
+    ----------
+
+    Returns
+    -------
+    :return: Tuple
+        The chart without its template, and the template, both as dictionaries
+
+    -------
+    """
+    import plotly.express as px
+    fig = px.line(df, x='Date', y=QUESTIONS[1:], title=f'Household Survey Data for {full_state}', labels={
+        'value': 'Total (persons)',
+        'variable': 'Survey Question'
+    })
+    figure = json.loads(fig.to_json(validate=False, remove_uids=True))
+    # The template is the same for every state, so it is written once into the dashboard
+    template = figure['layout'].pop('template', {})
+    return figure, template
+
 
 class HouseholdSurveysProcessedDataVisualizer:
+    """
+    Visualizes the consolidated household survey data as a dashboard of state charts.
+
+    The charts are rendered in parallel and written as compact json, one file per state. A single dashboard page
+    and one shared copy of plotly.js load the chart of a state when it is selected, rather than every state page
+    embedding its own copy of plotly.js.
+    """
 
-    def __init__(self, file_storage, s3_api):
+    def __init__(self, file_storage, s3_api, max_workers=MAX_WORKERS, assets_path=f'{SURVEY_DATA_PATH}assets/',
+                 upload_manifest=f'{SURVEY_DATA_PATH}upload_manifest.json'):
+        """ Create a new instance of the HouseholdSurveysProcessedDataVisualizer class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param s3_api: S3_API, Required
+            The S3 api wrapper class used to store data in AWS S3
+        :param max_workers: Number, Optional
+            The number of state charts rendered at once (defaults to the number of cpus)
+        :param assets_path: String, Optional
+            The directory of the plotly.js shared by the dashboards
+        :param upload_manifest: String, Optional
+            The file keeping the content hash of every asset uploaded to S3
+
+        ----------
+        """
         self._file_storage = file_storage
         self._s3_api = s3_api
+        self._max_workers = max_workers
+        self._assets_path = assets_path
+        self._upload_manifest = upload_manifest
+        self._survey_store = HouseholdSurveysStore(file_storage)
+
+    def visualize_processed_data(self, audience, output_file_path):
+        """Renders the chart of every state and the dashboard showing them
 
-    def visualize_processed_data(self, input_file_path, output_file_path):
+        Parameters
+        ----------
+        :param audience: String, Required
+            Whether to visualize the data of every household ('all') or households with children ('children')
+        :param output_file_path: String, Required
+            The directory of the state charts and dashboard
+
+        ----------
+        """
         self._file_storage.create_directory_if_not_exists(output_file_path)
-        for f in [file for file in os.listdir(input_file_path) if 'normalized' not in file]:
-            state = f.replace('.csv', '')
-            input_file = f'{input_file_path}/{state}.csv'
-            df = pd.read_csv(input_file)
-            df = df[df['Topic'] == 'total']
-            df['Date'] = pd.to_datetime(df['Date'])
-            df = df.sort_values(by='Date')
-            full_state = us.states.lookup(state).name
-            fig = px.line(df, x='Date', y=df.columns[4:-2], title=f'Household Survey Data for {full_state}', labels={
-                'value': 'Total (persons)',
-                'variable': 'Survey Question'
-            })
-
-            output_file = f'{output_file_path}{state}.html'
-            print('Saving visualizations to folder', output_file)
-            fig.write_html(output_file)
+        plotly_js = self.__write_plotly_js()
+        # Only the totals of the answers are plotted, so only those rows and columns are read from the store
+        survey_df = self._survey_store.query(kind='standard', audience=audience, topics=['total'],
+                                             questions=QUESTIONS[1:])
+
+        states = []
+        template = {}
+        with ProcessPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {}
+            for state, df in survey_df.groupby('State', observed=True):
+                full_state = us.states.lookup(state).name
+                states.append([state, full_state])
+                futures[state] = executor.submit(render_state_figure, full_state, df)
+
+            for state, future in futures.items():
+                figure, template = future.result()
+                output_file = f'{output_file_path}{state}.json'
+                print('Saving visualization data to file', output_file)
+                with open(output_file, 'w') as f:
+                    json.dump(figure, f, separators=(',', ':'))
+
+        dashboard_file = f'{output_file_path}dashboard.html'
+        # The dashboard replaces the page each state used to have
+        for legacy_file in glob.glob(f'{output_file_path}*.html'):
+            if legacy_file != dashboard_file:
+                print('Removing legacy state page', legacy_file)
+                os.remove(legacy_file)
+        print('Saving dashboard to file', dashboard_file)
+        with open(dashboard_file, 'w') as f:
+            f.write(DASHBOARD_HTML.format(
+                title=f'Household Survey Data ({audience})',
+                plotly_js=os.path.relpath(plotly_js, output_file_path),
+                states=json.dumps(states),
+                template=json.dumps(template, separators=(',', ':'))))
+
+    def __write_plotly_js(self):
+        """Writes the plotly.js shared by the dashboards, unless it is already up to date
+
+        Returns
+        -------
+        :return: String
+            The path of plotly.js
+
+        -------
+        """
+        from plotly.offline import get_plotlyjs
+        plotly_js = get_plotlyjs()
+        output_file = f'{self._assets_path}plotly.min.js'
+        self._file_storage.create_directory_if_not_exists(output_file)
+        if not os.path.exists(output_file) or os.path.getsize(output_file) != len(plotly_js.encode('utf-8')):
+            print('Saving plotly.js to file', output_file)
+            with open(output_file, 'w', encoding='utf-8') as f:
+                f.write(plotly_js)
+        return output_file
 
     def store_survey_data(self):
+        """Uploads the dashboards and state charts to S3, with only the assets that changed since the last upload"""
         print('Store processed survey data in S3')
+        upload_manifest = self.__load_upload_manifest()
+
+        processed_files = sorted(glob.glob(f'{SURVEY_DATA_PATH}*/dashboard.html') +
+                                 glob.glob(f'{SURVEY_DATA_PATH}*/*.json'))
+        for file in sorted(glob.glob(f'{self._assets_path}*.*')):
+            asset_hash = self.__hash_file(file)
+            if upload_manifest.get(file) == asset_hash:
+                print('Asset', file, 'is unchanged, skipping')
+                continue
+            processed_files.append(file)
+            upload_manifest[file] = asset_hash
 
-        processed_files = list(glob.iglob('processed_data_visualizations/survey_data/**/*.html', recursive=True))
         for file in processed_files:
             print('Opening file', file)
-            contents = codecs.open(file, 'r')
+            contents = codecs.open(file, 'r', encoding='utf-8')
             print('Uploading', file, 'to S3')
-            self._s3_api.upload_html(contents.read(), file.replace('processed_data_visualizations/', ''), S3Api.S3Location.PROCESSED_DATA_VISUALIZATIONS)
+            file_name = file.replace('processed_data_visualizations/', '')
+            if file.endswith('.html'):
+                self._s3_api.upload_html(contents.read(), file_name, S3Api.S3Location.PROCESSED_DATA_VISUALIZATIONS)
+            elif file.endswith('.js'):
+                self._s3_api.upload_javascript(contents.read(), file_name,
+                                               S3Api.S3Location.PROCESSED_DATA_VISUALIZATIONS)
+            elif file.endswith('.json'):
+                self._s3_api.upload_json(json.load(contents), file_name,
+                                         S3Api.S3Location.PROCESSED_DATA_VISUALIZATIONS)
             contents.close()
 
+        # Saved only once every file is uploaded, so a failed upload is retried on the next run
+        self.__save_upload_manifest(upload_manifest)
         print('Uploaded all files')
 
+    @staticmethod
+    def __hash_file(file):
+        """Gets the content hash of a file
+
+        Parameters
+        ----------
+        :param file: String, Required
+            The path of the file
+
+        ----------
+        """
+        with open(file, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def __load_upload_manifest(self):
+        """Loads the content hash of every asset uploaded to S3"""
+        if not os.path.exists(self._upload_manifest):
+            return {}
+        with open(self._upload_manifest, 'r') as f:
+            return json.load(f)
+
+    def __save_upload_manifest(self, upload_manifest):
+        """Saves the content hash of every asset uploaded to S3
+
+        Parameters
+        ----------
+        :param upload_manifest: Dictionary, Required
+            The content hash of every asset uploaded to S3
+
+        ----------
+        """
+        self._file_storage.create_directory_if_not_exists(self._upload_manifest)
+        with open(self._upload_manifest, 'w') as f:
+            json.dump(upload_manifest, f, indent=4, sort_keys=True)
+
 
 if __name__ == '__main__':
     from dotenv import load_dotenv
@@ -56,12 +262,12 @@ if __name__ == '__main__':
 
     print('Visualizing standard household survey data')
     data_visualizer.visualize_processed_data(
-        input_file_path='processed_data/consolidated_survey_data/standard/all',
+        audience='all',
         output_file_path='processed_data_visualizations/survey_data/all/')
 
     print('Visualizing household survey data when families have children')
     data_visualizer.visualize_processed_data(
-        input_file_path='processed_data/consolidated_survey_data/standard/children',
+        audience='children',
         output_file_path='processed_data_visualizations/survey_data/children/')
 
     if STORE_DATA:
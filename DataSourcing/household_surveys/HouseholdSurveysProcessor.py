@@ -1,14 +1,38 @@
 import os
 import glob
+import hashlib
 import re
+from concurrent.futures import ProcessPoolExecutor
 from openpyxl import load_workbook
 import pandas as pd
 import numpy
 import json
 import S3Api
+from household_surveys.HouseholdSurveysStore import HouseholdSurveysStore
 
 # Constants
 STORE_DATA = True
+# The number of workbooks processed at once (defaults to the number of cpus)
+MAX_WORKERS = None
+# The size of the chunks read when hashing a workbook
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _process_survey_file(file_storage, survey_file):
+    """Processes a single survey file. Kept at the module level so it can run in a worker process
+
+    Parameters
+    ----------
+    :param file_storage: FileStorage, Required
+        The file storage class used to store raw/processed data
+    :param survey_file: String, Required
+        The path of the survey file
+
+    ----------
+    """
+    # The workers only write to the local file system, so they do not need the S3 api
+    return HouseholdSurveysProcessor(file_storage, None).process_survey_file(survey_file)
+
 
 class HouseholdSurveysProcessor:
     """Processes household survey data in csv files"""
@@ -57,99 +81,372 @@ class HouseholdSurveysProcessor:
         # The map of processed data folders
         self._processed_survey_data = [
             {'input_folder': '/survey_data/standard/all/', 'output_folder': '/consolidated_survey_data/standard/all/',
-             'normalized_data': True},
+             'normalized_data': True, 'kind': 'standard', 'audience': 'all'},
             {'input_folder': '/survey_data/standard/children/',
-             'output_folder': '/consolidated_survey_data/standard/children/', 'normalized_data': True},
+             'output_folder': '/consolidated_survey_data/standard/children/', 'normalized_data': True,
+             'kind': 'standard', 'audience': 'children'},
             {'input_folder': '/survey_data/errors/all/', 'output_folder': '/consolidated_survey_data/errors/all/',
-             'normalized_data': False},
+             'normalized_data': False, 'kind': 'errors', 'audience': 'all'},
             {'input_folder': '/survey_data/errors/children/',
-             'output_folder': '/consolidated_survey_data/errors/children/', 'normalized_data': False}
+             'output_folder': '/consolidated_survey_data/errors/children/', 'normalized_data': False,
+             'kind': 'errors', 'audience': 'children'}
         ]
         self._file_storage = file_storage
+        # The consolidated data is also kept as a partitioned parquet dataset for querying
+        self._survey_store = HouseholdSurveysStore(file_storage)
         self._s3_api = s3_api
+        # The classification, content hash and output of every workbook seen, in the processed data directory
+        self._workbook_manifest = 'survey_data/workbook_manifest.json'
+        # The weekly outputs written or removed that have not been consolidated yet, in the processed data directory
+        self._pending_outputs = 'survey_data/pending_outputs.json'
+        # The weekly outputs written or removed by the last call to process_survey_data
+        self._changed_outputs = None
+
+    def process_survey_data(self, max_workers=MAX_WORKERS):
+        """Processes each new or changed survey file, fanning the workbooks out across a process pool
+
+        Workbooks are compared to the workbook manifest by their content hash, so unchanged workbooks are not opened
+        again. The weekly outputs that were written or removed are saved as pending before the manifest, and stay
+        pending until consolidate_survey_data succeeds, so a failed or separate consolidation still picks them up.
 
-    def process_survey_data(self):
-        """Processes each survey file"""
+        Parameters
+        ----------
+        :param max_workers: Number, Optional
+            The number of workbooks processed at once (defaults to the number of cpus)
+
+        ----------
+
+        Returns
+        -------
+        :return: Set
+            The weekly outputs that were written or removed, along with those still pending from earlier runs
+
+        -------
+        """
         survey_files = self.retrieve_survey_files()
         print('Survey Files', survey_files)
+        manifest = self.__load_manifest()
+        previous_outputs = {entry['output'] for entry in manifest.values() if entry.get('output')}
+
+        changed_files = {}
         for survey_file in survey_files:
-            wb = load_workbook(survey_file)
-            print('Reading the workbook and processing into a csv', survey_file)
-            # If the file contains information on food sufficiency and does not contain data prior to Covid19,
-            # continue processing the file
-            if self.__workbook_contains_food_sufficiency(wb) and not self.__workbook_contains_prior_to_covid_19(wb):
-                print('Contains food sufficiency information', survey_file)
+            fingerprint = self.__fingerprint_workbook(survey_file, manifest.get(survey_file))
+            if survey_file in manifest and manifest[survey_file]['sha256'] == fingerprint['sha256']:
+                manifest[survey_file].update(fingerprint)
+            else:
+                changed_files[survey_file] = fingerprint
+        for survey_file in set(manifest) - set(survey_files):
+            print('Survey file was removed', survey_file)
+            del manifest[survey_file]
+        print('New or changed survey files', list(changed_files))
+
+        changed_outputs = self.__load_pending_outputs()
+        if len(changed_files) > 0:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = {survey_file: executor.submit(_process_survey_file, self._file_storage, survey_file)
+                           for survey_file in changed_files}
+                for survey_file, future in futures.items():
+                    try:
+                        classification = future.result()
+                    except Exception as error:
+                        # The workbook keeps its previous entry, so it is processed again on the next run
+                        print('An error occurred while processing', survey_file, error)
+                        continue
+                    manifest[survey_file] = {**changed_files[survey_file], **classification}
+                    if classification['output']:
+                        changed_outputs.add(classification['output'])
+
+        # Outputs no workbook produces anymore would otherwise still be consolidated
+        current_outputs = {entry['output'] for entry in manifest.values() if entry.get('output')}
+        for output in previous_outputs - current_outputs:
+            output_file = self.__get_output_file(output)
+            print('Removing stale output', output_file)
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            changed_outputs.add(output)
+
+        # The outputs are saved before the manifest, so the workbooks marked as processed always have their
+        # outputs waiting to be consolidated
+        self.__save_pending_outputs(changed_outputs)
+        self.__save_manifest(manifest)
+        self._changed_outputs = changed_outputs
+        return changed_outputs
+
+    def __fingerprint_workbook(self, survey_file, entry):
+        """Gets the size, modification time and content hash of a workbook
+
+        The hash of the manifest entry is reused when the size and modification time are unchanged.
 
-                # Survey files sometimes contain information on standard errors
-                contains_errors = self.__file_contains_standard_errors(survey_file)
-                print('Does it contain standard errors?', contains_errors)
-                # Survey files sometimes contain information on families with children versus without
-                contains_child_info = self.workbook_includes_information_on_children(wb)
-                print('Does it include information on children?', contains_child_info)
+        Parameters
+        ----------
+        :param survey_file: String, Required
+            The path of the survey file
+        :param entry: Dictionary, Optional
+            The manifest entry of the survey file
+
+        ----------
+        """
+        stat = os.stat(survey_file)
+        fingerprint = {'size': stat.st_size, 'modified': stat.st_mtime_ns}
+        if entry is not None and entry.get('size') == stat.st_size and entry.get('modified') == stat.st_mtime_ns:
+            fingerprint['sha256'] = entry['sha256']
+            return fingerprint
+
+        file_hash = hashlib.sha256()
+        with open(survey_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                file_hash.update(chunk)
+        fingerprint['sha256'] = file_hash.hexdigest()
+        return fingerprint
+
+    def __load_manifest(self):
+        """Loads the classification, content hash and output of every workbook seen"""
+        manifest_path = f'{self._file_storage.get_processed_base_path()}/{self._workbook_manifest}'
+        if not os.path.exists(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+
+    def __save_manifest(self, manifest):
+        """Saves the classification, content hash and output of every workbook seen
+
+        Parameters
+        ----------
+        :param manifest: Dictionary, Required
+            The classification, content hash and output of every workbook seen
+
+        ----------
+        """
+        self._file_storage.store_as_processed_file(self._workbook_manifest,
+                                                   json.dumps(manifest, indent=4, sort_keys=True))
+
+    def __load_pending_outputs(self):
+        """Loads the weekly outputs written or removed that have not been consolidated yet"""
+        pending_outputs_path = f'{self._file_storage.get_processed_base_path()}/{self._pending_outputs}'
+        if not os.path.exists(pending_outputs_path):
+            return set()
+        with open(pending_outputs_path, 'r') as f:
+            return set(json.load(f))
+
+    def __save_pending_outputs(self, pending_outputs):
+        """Saves the weekly outputs written or removed that have not been consolidated yet
+
+        Parameters
+        ----------
+        :param pending_outputs: Set, Required
+            The weekly outputs, relative to the processed data directory
 
-                self.__process_workbook(wb, contains_errors=contains_errors, contains_child_info=contains_child_info)
+        ----------
+        """
+        self._file_storage.store_as_processed_file(self._pending_outputs,
+                                                   json.dumps(sorted(pending_outputs), indent=4))
 
-        wb.close()
+    def __get_output_file(self, output):
+        """Gets the path of a weekly output in the processed data directory
+
+        Parameters
+        ----------
+        :param output: String, Required
+            The weekly output, relative to the processed data directory
 
-    def consolidate_survey_data(self):
+        ----------
+        """
+        return os.path.normpath(f'{self._file_storage.get_processed_base_path()}/{output}')
+
+    def process_survey_file(self, survey_file):
+        """Processes a single survey file into a csv
+
+        The workbook is opened in read only mode, which streams the rows of each sheet rather than building every
+        cell up front.
+
+        Parameters
+        ----------
+        :param survey_file: String, Required
+            The path of the survey file
+
+        ----------
+
+        Returns
+        -------
+        :return: Dictionary
+            The classification of the survey file, with the week and output it was processed into if it contained
+            food sufficiency information
+
+        -------
+        """
+        wb = load_workbook(survey_file, read_only=True, data_only=True)
+        try:
+            print('Reading the workbook and processing into a csv', survey_file)
+            classification = {
+                'food_sufficiency': self.__workbook_contains_food_sufficiency(wb),
+                'prior_to_covid_19': self.__workbook_contains_prior_to_covid_19(wb),
+                # Survey files sometimes contain information on standard errors
+                'contains_errors': self.__file_contains_standard_errors(survey_file),
+                # Survey files sometimes contain information on families with children versus without
+                'contains_child_info': self.workbook_includes_information_on_children(wb),
+                'week': None,
+                'output': None
+            }
+            # If the file contains information on food sufficiency and does not contain data prior to Covid19,
+            # continue processing the file
+            if not classification['food_sufficiency'] or classification['prior_to_covid_19']:
+                return classification
+            print('Contains food sufficiency information', survey_file)
+            print('Does it contain standard errors?', classification['contains_errors'])
+            print('Does it include information on children?', classification['contains_child_info'])
+
+            classification['week'], classification['output'] = self.__process_workbook(
+                wb, contains_errors=classification['contains_errors'],
+                contains_child_info=classification['contains_child_info'])
+            return classification
+        finally:
+            # Read only workbooks keep their file open until closed
+            wb.close()
+
+    def consolidate_survey_data(self, changed_outputs=None):
         """
         Consolidate the survey data by grouped the initially processed survey files by state and
         normalizing the population answering the survey questions
+
+        Only the folders and states with changed weekly outputs are consolidated again. Without changed outputs,
+        from the argument, the last call to process_survey_data or the outputs still pending from an earlier run,
+        every folder is consolidated. The pending outputs are cleared once every folder is consolidated.
+
+        Parameters
+        ----------
+        :param changed_outputs: Set, Optional
+            The weekly outputs that were written or removed, relative to the processed data directory
+
+        ----------
         """
-        survey_metadata = json.load(open('raw_data/survey_data/survey_metadata.json', 'r'))
+        if changed_outputs is None:
+            changed_outputs = self._changed_outputs
+        if changed_outputs is None:
+            changed_outputs = self.__load_pending_outputs() or None
+        with open('raw_data/survey_data/survey_metadata.json', 'r') as f:
+            survey_metadata = json.load(f)
         for survey_data in self._processed_survey_data:
             processed_data_folder = self._file_storage.get_processed_base_path() + survey_data['input_folder']
-            # In some cases, we are not normalizing the data (for standard errors)
-            normalized_data = survey_data['normalized_data']
+            changed_files = None
+            if changed_outputs is not None:
+                changed_files = {self.__get_output_file(output) for output in changed_outputs
+                                 if os.path.normpath(processed_data_folder) == os.path.dirname(
+                                     self.__get_output_file(output))}
+                if len(changed_files) == 0:
+                    print('No changes in folder', processed_data_folder)
+                    continue
             processed_files = list(glob.iglob(processed_data_folder + '*.csv'))
-            consolidated_data = {}
-            consolidated_normalized_data = {}
             print('Processing files in folder', processed_data_folder)
             print('Processing files', processed_files)
+            if len(processed_files) == 0:
+                continue
+
+            # All weeks are loaded into one frame so they are cleaned and normalized with column operations
+            weekly_frames = []
+            states = set() if changed_files is not None else None
             for file in processed_files:
                 print('Processing', file)
                 extracted_week = os.path.basename(file).replace('Week', '').replace('.csv', '').strip()
                 weekly_data = pd.read_csv(file, index_col=False)
-                for group in weekly_data.groupby(['State']):
-                    state = group[0]
-                    frame = group[1]
-                    frame['Week'] = extracted_week
-                    frame['Date'] = survey_metadata[extracted_week]
-                    for column in self._columns[3:]:
-                        frame[column] = frame[column].apply(lambda x: 0 if str(x).strip() == '-' else numpy.float32(x))
-
-                    if normalized_data:
-                        normalized_frame = frame.copy(deep=True)
-                        total_row = frame[frame['Characteristic'] == 'total']
-                        total = numpy.float32(total_row['Total'].values[0])
-                        # Normalize the totals
-                        for column in self._columns[3:]:
-                            normalized_frame[column] = normalized_frame[column].apply(lambda x: x / total)
-
-                    if state in consolidated_data:
-                        consolidated_data[state] = consolidated_data[state].append(frame)
-                    else:
-                        consolidated_data[state] = frame
-
-                    if normalized_data and state in consolidated_normalized_data:
-                        consolidated_normalized_data[state] = consolidated_normalized_data[state].append(
-                            normalized_frame)
-                    elif normalized_data:
-                        consolidated_normalized_data[state] = normalized_frame
-
-            print('Formatting consolidated data into json')
+                weekly_data['Week'] = extracted_week
+                weekly_data['Date'] = survey_metadata[extracted_week]
+                weekly_frames.append(weekly_data)
+                if states is not None and os.path.normpath(file) in changed_files:
+                    states.update(weekly_data['State'])
+            # A removed week changes the files of every state
+            if changed_files is not None and not all(os.path.exists(file) for file in changed_files):
+                states = None
+            consolidated_df = self.__clean_statistics(pd.concat(weekly_frames, ignore_index=True))
+
             consolidated_output_path = self._file_storage.get_processed_base_path() + survey_data['output_folder']
             self._file_storage.create_directory_if_not_exists(consolidated_output_path)
-            for key in consolidated_data.keys():
-                consolidated_data[key].reset_index(drop=True, inplace=True)
-                output_file = f'{consolidated_output_path}{key}.csv'
-                print('Formatting and saving data to files for state', key)
-                print('Output file', output_file)
-                consolidated_data[key].to_csv(output_file, index=False)
-                if normalized_data:
-                    consolidated_output_file = f'{consolidated_output_path}{key}-normalized.csv'
-                    consolidated_normalized_data[key].reset_index(drop=True, inplace=True)
-                    consolidated_normalized_data[key].to_csv(consolidated_output_file, index=False)
+            # In some cases, we are not normalizing the data (for standard errors)
+            normalized_df = self.__normalize_statistics(consolidated_df) if survey_data['normalized_data'] else None
+            self.__write_state_files(consolidated_df, consolidated_output_path, normalized_df, states)
+            self.__store_consolidated_data(survey_data, consolidated_df, normalized_df, states)
+
+        self.__save_pending_outputs(set())
+        self._changed_outputs = set()
+
+    def __clean_statistics(self, df):
+        """Converts the statistic columns to float32, where a '-' means zero
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The survey data
+
+        ----------
+        """
+        for column in self._columns[3:]:
+            values = df[column].astype(str).str.strip()
+            df[column] = pd.to_numeric(values.mask(values == '-', '0')).astype(numpy.float32)
+        return df
+
+    def __normalize_statistics(self, df):
+        """Divides the statistics by the total population of the state in the same week
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The cleaned survey data
+
+        ----------
+        """
+        totals = df['Total'].where(df['Characteristic'] == 'total')
+        state_totals = totals.groupby([df['State'], df['Week']]).transform('first')
+        normalized_df = df.copy(deep=True)
+        normalized_df[self._columns[3:]] = df[self._columns[3:]].div(state_totals, axis=0)
+        return normalized_df
+
+    def __write_state_files(self, df, output_path, normalized_df=None, states=None):
+        """Writes the consolidated survey data of each state
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The cleaned survey data
+        :param output_path: String, Required
+            The folder the state files are written to
+        :param normalized_df: pd.DataFrame, Optional
+            The normalized survey data, written alongside the survey data of each state
+        :param states: Set, Optional
+            The states whose files are written (defaults to every state)
+
+        ----------
+        """
+        print('Formatting consolidated data into csvs')
+        for state, state_df in df.groupby('State', sort=False):
+            if states is not None and state not in states:
+                continue
+            output_file = f'{output_path}{state}.csv'
+            print('Formatting and saving data to files for state', state)
+            print('Output file', output_file)
+            state_df.to_csv(output_file, index=False)
+            if normalized_df is not None:
+                normalized_df.loc[state_df.index].to_csv(f'{output_path}{state}-normalized.csv', index=False)
+
+    def __store_consolidated_data(self, survey_data, df, normalized_df=None, states=None):
+        """Writes the consolidated survey data to the partitioned survey store
+
+        Parameters
+        ----------
+        :param survey_data: Dictionary, Required
+            The processed data folder the survey data was consolidated from
+        :param df: pd.DataFrame, Required
+            The cleaned survey data
+        :param normalized_df: pd.DataFrame, Optional
+            The normalized survey data
+        :param states: Set, Optional
+            The states whose partitions are written (defaults to every state)
+
+        ----------
+        """
+        rows = df['State'].isin(states) if states is not None else slice(None)
+        self._survey_store.write(df.loc[rows], survey_data['kind'], survey_data['audience'])
+        if normalized_df is not None:
+            self._survey_store.write(normalized_df.loc[rows], survey_data['kind'], survey_data['audience'],
+                                     normalized=True)
 
     def retrieve_survey_files(self):
         """Retrieve all raw survey files"""
@@ -219,6 +516,13 @@ class HouseholdSurveysProcessor:
             Whether the workbook contains informatin on families with children
 
         ----------
+
+        Returns
+        -------
+        :return: Tuple
+            The week of the survey and the output it was processed into
+
+        -------
         """
         sheet_names = wb.sheetnames
         r = re.compile(r'[A-Z]{2}')
@@ -227,22 +531,16 @@ class HouseholdSurveysProcessor:
         week_regex = re.compile(r'Week [0-9]{1,2}')
         week = week_regex.search(week_information).group(0)
 
-        output = ','.join(self._columns) + '\n'
+        records = {column: [] for column in self._columns}
         for sheet_name in filtered_sheet_names:
             if sheet_name != 'US':
-                for c in self._characteristics:
-                    sheet = wb[sheet_name]
-                    characteristic = c['characteristic']
-                    topic = c['topic']
-                    exact_match = c['exact_match']
-                    output += f'{sheet_name},{topic},{characteristic},'
-                    for row in sheet.iter_rows():
-                        if row[0].value is not None:
-                            row_title = row[0].value.lower().strip()
-                            if row_title == characteristic or (
-                                    not exact_match and row_title.startswith(characteristic)):
-                                output += ','.join([str(statistic.value) for statistic in row[1:]]) + '\n'
-                                break
+                statistics = self.__index_sheet(wb[sheet_name])
+                for c, values in zip(self._characteristics, statistics):
+                    records['State'].append(sheet_name)
+                    records['Topic'].append(c['topic'])
+                    records['Characteristic'].append(c['characteristic'])
+                    for column, value in zip(self._columns[3:], values):
+                        records[column].append(value)
 
         output_path = '/'.join([
             self._survey_data_folder,
@@ -251,7 +549,53 @@ class HouseholdSurveysProcessor:
             f'{week}.csv'])
 
         print(output_path)
-        self._file_storage.store_as_processed_file(output_path, output)
+        self._file_storage.store_processed_df_as_file(output_path, pd.DataFrame(records, columns=self._columns))
+        return week, output_path
+
+    def __index_sheet(self, sheet):
+        """Finds the statistics of every characteristic in a single pass over the rows of a sheet
+
+        The first row whose title matches a characteristic is used, where the non exact characteristics match any
+        title they prefix.
+
+        Parameters
+        ----------
+        :param sheet: openpyxl.worksheet.ReadOnlyWorksheet, Required
+            The sheet of a state
+
+        ----------
+
+        Returns
+        -------
+        :return: List
+            The statistics of each characteristic, in the order of the characteristics, with missing values as None
+
+        -------
+        """
+        number_of_statistics = len(self._columns) - 3
+        exact_characteristics = {c['characteristic']: i for i, c in enumerate(self._characteristics)
+                                 if c['exact_match']}
+        prefix_characteristics = [(i, c['characteristic']) for i, c in enumerate(self._characteristics)
+                                  if not c['exact_match']]
+
+        statistics = [None] * len(self._characteristics)
+        number_found = 0
+        for row in sheet.iter_rows(values_only=True):
+            if len(row) == 0 or row[0] is None:
+                continue
+            row_title = str(row[0]).lower().strip()
+            matches = [i for i, characteristic in prefix_characteristics if row_title.startswith(characteristic)]
+            if row_title in exact_characteristics:
+                matches.append(exact_characteristics[row_title])
+            for i in matches:
+                if statistics[i] is None:
+                    values = list(row[1:number_of_statistics + 1])
+                    statistics[i] = values + [None] * (number_of_statistics - len(values))
+                    number_found += 1
+            if number_found == len(statistics):
+                break
+
+        return [values if values is not None else [None] * number_of_statistics for values in statistics]
 
     def store_survey_data(self):
         print('Store processed survey data in S3')
@@ -0,0 +1,143 @@
+import pandas as pd
+
+# Constants
+# The columns describing each row of the survey data
+DIMENSIONS = ['State', 'Topic', 'Characteristic', 'Week', 'Date']
+# The statistics of each row, the population and the answers to the food sufficiency question
+QUESTIONS = ['Total',
+             'Enough of the kinds of food wanted',
+             'Enough food but not always the kinds wanted',
+             'Sometimes not enough to eat',
+             'Often not enough to eat',
+             'Did not report']
+CATEGORICAL_COLUMNS = ['State', 'Topic', 'Characteristic']
+
+
+class HouseholdSurveysStore:
+    """
+    Stores the consolidated household survey data as a single parquet dataset.
+
+    The dataset is partitioned by kind (standard or errors), audience (all or children), whether the data is
+    normalized and state, so a query only reads the files of the partitions it asks for. Topic and characteristic
+    are dictionary encoded within each file, and the topic and date filters are checked against the row group
+    statistics before any rows are read.
+
+    Dataset Structure
+
+    consolidated_survey_dataset/kind=standard/audience=all/normalized=false/State=AL/part-0.parquet
+    """
+
+    def __init__(self, file_storage, dataset_location='consolidated_survey_dataset/'):
+        """ Create a new instance of the HouseholdSurveysStore class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param dataset_location: String, Optional
+            The directory of the dataset, in the processed data directory
+
+        ----------
+        """
+        self._dataset_path = f'{file_storage.get_processed_base_path()}/{dataset_location}'
+
+    def get_dataset_path(self):
+        """Gets the directory of the dataset"""
+        return self._dataset_path
+
+    def write(self, df, kind, audience, normalized=False):
+        """Writes consolidated survey data, replacing the partitions of the states it contains
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The consolidated survey data of one or more states
+        :param kind: String, Required
+            Whether the data contains the standard survey values ('standard') or their standard errors ('errors')
+        :param audience: String, Required
+            Whether the data covers every household ('all') or households with children ('children')
+        :param normalized: Boolean, Optional
+            Whether the statistics are divided by the total population of the state
+
+        ----------
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        partition_df = df[DIMENSIONS + QUESTIONS].copy()
+        partition_df['kind'] = kind
+        partition_df['audience'] = audience
+        partition_df['normalized'] = normalized
+        partition_df['Topic'] = partition_df['Topic'].astype('category')
+        partition_df['Characteristic'] = partition_df['Characteristic'].astype('category')
+        partition_df['Week'] = pd.to_numeric(partition_df['Week']).astype('int16')
+        partition_df['Date'] = pd.to_datetime(partition_df['Date'])
+        table = pa.Table.from_pandas(partition_df, preserve_index=False)
+
+        # Only the directories of the written partitions are cleared, so the other states are kept
+        ds.write_dataset(table, self._dataset_path, format='parquet', partitioning=self.__partitioning(),
+                         basename_template='part-{i}.parquet', existing_data_behavior='delete_matching')
+        print('Stored', partition_df.shape[0], 'rows of', kind, audience, 'survey data in', self._dataset_path)
+
+    def query(self, kind='standard', audience='all', normalized=False, states=None, topics=None, start_date=None,
+              end_date=None, questions=None):
+        """Reads the survey data matching the filters
+
+        Parameters
+        ----------
+        :param kind: String, Optional
+            Whether to read the standard survey values ('standard') or their standard errors ('errors')
+        :param audience: String, Optional
+            Whether to read the data of every household ('all') or households with children ('children')
+        :param normalized: Boolean, Optional
+            Whether to read the statistics divided by the total population of the state
+        :param states: List, Optional
+            The state abbreviations to read (defaults to every state)
+        :param topics: List, Optional
+            The topics to read, such as 'total' or 'age' (defaults to every topic)
+        :param start_date: String, Optional
+            The first survey date to read, inclusive
+        :param end_date: String, Optional
+            The last survey date to read, inclusive
+        :param questions: List, Optional
+            The statistics to read (defaults to every statistic in QUESTIONS)
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The matching survey data sorted by state and date, with categorical state, topic and characteristic
+
+        -------
+        """
+        import pyarrow.dataset as ds
+
+        columns = DIMENSIONS + (QUESTIONS if questions is None else list(questions))
+        dataset = ds.dataset(self._dataset_path, format='parquet', partitioning=self.__partitioning())
+        # The partition fields prune whole directories, the others are checked against the row group statistics
+        expression = ((ds.field('kind') == kind) & (ds.field('audience') == audience) &
+                      (ds.field('normalized') == normalized))
+        if states is not None:
+            expression = expression & ds.field('State').isin(list(states))
+        if topics is not None:
+            expression = expression & ds.field('Topic').isin(list(topics))
+        if start_date is not None:
+            expression = expression & (ds.field('Date') >= pd.Timestamp(start_date))
+        if end_date is not None:
+            expression = expression & (ds.field('Date') <= pd.Timestamp(end_date))
+
+        df = dataset.to_table(columns=columns, filter=expression).to_pandas()
+        for column in CATEGORICAL_COLUMNS:
+            df[column] = df[column].astype('category')
+        return df.sort_values(by=['State', 'Date'], kind='stable').reset_index(drop=True)
+
+    def __partitioning(self):
+        """Gets the hive partitioning of the dataset"""
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        return ds.partitioning(pa.schema([('kind', pa.string()),
+                                          ('audience', pa.string()),
+                                          ('normalized', pa.bool_()),
+                                          ('State', pa.string())]), flavor='hive')
@@ -0,0 +1,277 @@
+import numpy as np
+import pandas as pd
+import os
+
+# Constants
+# The arrays of the interval tree saved with the index
+TREE_ARRAYS = ['centers', 'children', 'offsets', 'by_start', 'start_keys', 'by_end', 'end_keys']
+
+
+class GlobalCovidLockdownIntervalIndex:
+    """
+    An index of the lockdown intervals of every place, answering date queries without reading the raw lockdown data.
+
+    Overlapping lockdowns of a place are merged when the index is built, and the merged intervals are kept sorted by
+    their start date as day numbers in a .npz file, along with a centered interval tree over them. Each node of the
+    tree holds the intervals containing its center day, sorted by start and by end, so a date query walks one path
+    down the tree and binary searches each node, reading only the intervals it returns.
+
+    Country wide lockdowns have no place, and are indexed under an empty place name. Open ended lockdowns, which
+    have no end date yet, are dropped along with lockdowns missing their start date.
+    """
+
+    def __init__(self, file_storage, index_location='lockdown_data/lockdown_interval_index.npz'):
+        """ Create a new instance of the GlobalCovidLockdownIntervalIndex class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param index_location: String, Optional
+            The file of the index, in the processed data directory
+
+        ----------
+        """
+        self._file_storage = file_storage
+        self._index_file = f'{file_storage.get_processed_base_path()}/{index_location}'
+        self._countries = None
+        self._places = None
+        self._interval_places = None
+        self._starts = None
+        self._ends = None
+        self._tree = None
+
+    @staticmethod
+    def merge_intervals(df):
+        """Merges the overlapping lockdowns of each place
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The lockdowns, with the Country, Place, StartDate and EndDate of each
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The merged lockdowns sorted by country, place and start date, where country wide lockdowns have an empty
+            place. Lockdowns missing a date, including open ended lockdowns without an end date, are dropped
+
+        -------
+        """
+        intervals = df.loc[df['StartDate'].notna() & df['EndDate'].notna(),
+                           ['Country', 'Place', 'StartDate', 'EndDate']]
+        # Country wide lockdowns have no place, which would otherwise be dropped by the grouping
+        intervals = intervals.fillna({'Place': ''})
+        intervals = intervals.sort_values(by=['Country', 'Place', 'StartDate'], kind='stable')
+        places = intervals.groupby(['Country', 'Place'], sort=False)
+        # A lockdown starts a new interval when it begins after every earlier lockdown of the place has ended
+        previous_end = places['EndDate'].cummax().groupby([intervals['Country'], intervals['Place']]).shift()
+        new_interval = ~(intervals['StartDate'] <= previous_end)
+        intervals = intervals.assign(Interval=new_interval.cumsum())
+        return (intervals.groupby('Interval', sort=True)
+                .agg(Country=('Country', 'first'), Place=('Place', 'first'),
+                     StartDate=('StartDate', 'min'), EndDate=('EndDate', 'max'))
+                .reset_index(drop=True))
+
+    def build(self, df):
+        """Builds the index from the lockdowns and saves it
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The lockdowns, with the Country, Place, StartDate and EndDate of each
+
+        ----------
+        """
+        intervals = self.merge_intervals(df)
+        place_codes, places = pd.MultiIndex.from_frame(intervals[['Country', 'Place']]).factorize()
+        starts = intervals['StartDate'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+        ends = intervals['EndDate'].to_numpy(dtype='datetime64[D]').astype(np.int64)
+        order = np.argsort(starts, kind='stable')
+        starts = starts[order]
+        ends = ends[order]
+
+        self._file_storage.create_directory_if_not_exists(self._index_file)
+        temporary_file = self._index_file.replace('.npz', '.tmp.npz')
+        np.savez(temporary_file,
+                 countries=np.array(places.get_level_values(0), dtype=str),
+                 places=np.array(places.get_level_values(1), dtype=str),
+                 interval_places=place_codes[order].astype(np.int32),
+                 starts=starts,
+                 ends=ends,
+                 **self.__build_tree(starts, ends))
+        # Replaced atomically so readers never see a partial index
+        os.replace(temporary_file, self._index_file)
+        self._countries = None
+        print('Built the lockdown interval index with', len(intervals), 'intervals for', len(places), 'places')
+
+    def __load(self):
+        """Loads the index"""
+        if self._countries is not None:
+            return
+        with np.load(self._index_file) as index:
+            self._countries = index['countries']
+            self._places = index['places']
+            self._interval_places = index['interval_places']
+            self._starts = index['starts']
+            self._ends = index['ends']
+            self._tree = {key: index[key] for key in TREE_ARRAYS}
+
+    def places_in_lockdown(self, date):
+        """Finds the places in lockdown on a date
+
+        Parameters
+        ----------
+        :param date: String, Required
+            The date
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The Country and Place of every place in lockdown on the date
+
+        -------
+        """
+        self.__load()
+        place_codes = np.unique(self._interval_places[self.__stab(self.__to_day(date))])
+        return pd.DataFrame({'Country': self._countries[place_codes], 'Place': self._places[place_codes]})
+
+    def lockdown_days(self, start_date, end_date):
+        """Counts the days each place was in lockdown within a date range
+
+        Parameters
+        ----------
+        :param start_date: String, Required
+            The first date of the range, inclusive
+        :param end_date: String, Required
+            The last date of the range, inclusive
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The Country, Place and number of LockdownDays of every place in lockdown within the range
+
+        -------
+        """
+        self.__load()
+        first_day = self.__to_day(start_date)
+        last_day = self.__to_day(end_date)
+        # The intervals overlapping the range either contain its first day or start later within it, and the latter
+        # are a slice of the intervals sorted by start
+        later_starts = np.arange(np.searchsorted(self._starts, first_day, side='right'),
+                                 np.searchsorted(self._starts, last_day, side='right'))
+        overlapping = np.concatenate([self.__stab(first_day), later_starts]) if first_day <= last_day else later_starts
+        overlap = (np.minimum(self._ends[overlapping], last_day) -
+                   np.maximum(self._starts[overlapping], first_day) + 1)
+        place_codes, inverse = np.unique(self._interval_places[overlapping], return_inverse=True)
+        days = np.bincount(inverse, weights=overlap, minlength=place_codes.shape[0]).astype(np.int64)
+        return pd.DataFrame({'Country': self._countries[place_codes],
+                             'Place': self._places[place_codes],
+                             'LockdownDays': days})
+
+    def __stab(self, day):
+        """Finds the intervals containing a day by walking the interval tree
+
+        Parameters
+        ----------
+        :param day: Number, Required
+            The day number
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            The positions of the intervals containing the day, in the arrays sorted by start
+
+        -------
+        """
+        tree = self._tree
+        found = []
+        node = 0 if tree['centers'].shape[0] > 0 else -1
+        while node != -1:
+            first, last = tree['offsets'][node], tree['offsets'][node + 1]
+            center = tree['centers'][node]
+            if day < center:
+                # Every interval of the node ends on or after the center, so those starting by the day contain it
+                count = np.searchsorted(tree['start_keys'][first:last], day, side='right')
+                found.append(tree['by_start'][first:first + count])
+                node = tree['children'][node, 0]
+            else:
+                # Every interval of the node starts on or before the center, so those ending by the day contain it
+                count = np.searchsorted(tree['end_keys'][first:last], -day, side='right')
+                found.append(tree['by_end'][first:first + count])
+                node = tree['children'][node, 1] if day > center else -1
+        return np.concatenate(found) if len(found) > 0 else np.array([], dtype=np.int64)
+
+    @staticmethod
+    def __build_tree(starts, ends):
+        """Builds a centered interval tree over the intervals
+
+        Parameters
+        ----------
+        :param starts: np.array, Required
+            The first day of each interval, sorted
+        :param ends: np.array, Required
+            The last day of each interval
+
+        ----------
+
+        Returns
+        -------
+        :return: Dictionary
+            The arrays of the tree. Node i holds the intervals by_start[offsets[i]:offsets[i + 1]] sorted by start,
+            the same intervals in by_end sorted by end from the latest, its center day and its left and right child.
+            The start days and negated end days are kept alongside as the keys the nodes are searched by
+
+        -------
+        """
+        centers, children, offsets, by_start, by_end = [], [], [0], [], []
+        # Each entry is the intervals of a node still to be built and the slot of its parent pointing to it
+        pending = [(np.arange(starts.shape[0]), None)]
+        while len(pending) > 0:
+            intervals, parent_slot = pending.pop()
+            if intervals.shape[0] == 0:
+                continue
+            node = len(centers)
+            if parent_slot is not None:
+                children[parent_slot[0]][parent_slot[1]] = node
+            center = np.median(np.concatenate([starts[intervals], ends[intervals]]))
+            contains_center = (starts[intervals] <= center) & (ends[intervals] >= center)
+            node_intervals = intervals[contains_center]
+            centers.append(center)
+            children.append([-1, -1])
+            by_start.append(node_intervals)
+            by_end.append(node_intervals[np.argsort(-ends[node_intervals], kind='stable')])
+            offsets.append(offsets[-1] + node_intervals.shape[0])
+            pending.append((intervals[ends[intervals] < center], (node, 0)))
+            pending.append((intervals[starts[intervals] > center], (node, 1)))
+
+        by_start = np.concatenate(by_start) if len(by_start) > 0 else np.array([], dtype=np.int64)
+        by_end = np.concatenate(by_end) if len(by_end) > 0 else np.array([], dtype=np.int64)
+        return {'centers': np.array(centers, dtype=np.float64),
+                'children': np.array(children, dtype=np.int64).reshape(-1, 2),
+                'offsets': np.array(offsets, dtype=np.int64),
+                'by_start': by_start,
+                'start_keys': starts[by_start],
+                'by_end': by_end,
+                'end_keys': -ends[by_end]}
+
+    @staticmethod
+    def __to_day(date):
+        """Converts a date into a day number
+
+        Parameters
+        ----------
+        :param date: String, Required
+            The date
+
+        ----------
+        """
+        return np.datetime64(pd.Timestamp(date).date(), 'D').astype(np.int64)
@@ -1,11 +1,15 @@
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import glob
 import os
 import S3Api
+from lockdown_data.GlobalCovidLockdownIntervalIndex import GlobalCovidLockdownIntervalIndex
 
 # Constants
 STORE_DATA = False
+# Whether the lockdowns are expanded against the first day of each month ('month') or every day ('day')
+GRANULARITY = 'month'
 
 class GlobalCovidLockdownProcessor:
     """Processes the lockdown data and saves it"""
@@ -26,43 +30,115 @@ class GlobalCovidLockdownProcessor:
         self._lockdown_file_path = f'{self._file_storage.get_raw_base_path()}/lockdown_data/lockdown_data.csv'
         self._start_of_covid = pd.to_datetime('2019-12-01') # Per wikipedia
         self._covid_date_range = pd.date_range(start='2019-12-01', end=datetime.today())
-        self._covid_date_range = self._covid_date_range[self._covid_date_range.day == 1]
         self._s3 = s3_api
+        self._interval_index = GlobalCovidLockdownIntervalIndex(file_storage)
 
-    def process_global_lockdown_data(self):
-        """Process the global lockdown data and stores it in a dataframe"""
+    def get_interval_index(self):
+        """Gets the index of the lockdown intervals built by process_global_lockdown_data"""
+        return self._interval_index
+
+    def process_global_lockdown_data(self, granularity=GRANULARITY):
+        """Process the global lockdown data and stores it in a dataframe
+
+        The confirmed lockdowns of every place in every country are expanded against the date grid at once, and the
+        lockdown intervals are saved to an index for date queries.
+
+        Parameters
+        ----------
+        :param granularity: String, Optional
+            Whether to expand the lockdowns against the first day of each month ('month') or every day ('day')
+
+        ----------
+        """
         df = pd.read_csv(self._lockdown_file_path)
 
         # Clean up data types
         df[['StartDate', 'EndDate']] = df[['StartDate', 'EndDate']].apply(pd.to_datetime)
-        # Filter down lockdown data to only the United States and only Confirmed lockdowns
-        united_states = df[(df['Country'] == 'United States') & (df['Confirmed'])]
-        print(len(united_states))
-
-        for state in united_states.groupby(by='Place'):
-            extracted_state = state[0]
-            print('Processing lockdown data for state', extracted_state)
-            start_date = state[1]['StartDate'].values[0]
-            end_date = state[1]['EndDate'].values[0]
-            rows = list()
-            for month in self._covid_date_range:
-                lockdown_exists = start_date <= pd.to_datetime(month) <= end_date
-                rows.append({
-                    'Date': month.strftime('%Y-%m-%d'),
-                    'InLockdown': lockdown_exists,
-                    'State': extracted_state
-                })
-
-            df = pd.DataFrame(rows)
+        # Filter down lockdown data to only Confirmed lockdowns
+        confirmed = df[df['Confirmed'].fillna(False).astype(bool)]
+        print(len(confirmed))
+        self._interval_index.build(confirmed)
+
+        dates = self.__get_date_grid(granularity)
+        lockdown_df = self.expand_lockdowns(confirmed, dates)
+        print('Storing lockdown data as a dataframe for', lockdown_df['Place'].nunique(), 'places')
+        self._file_storage.store_processed_df_as_file(f'lockdown_data/global/lockdown_data_by_{granularity}.csv',
+                                                      lockdown_df)
+
+        # The United States lockdowns are also kept as one file per state, without the country wide lockdowns
+        united_states = lockdown_df[(lockdown_df['Country'] == 'United States') & (lockdown_df['Place'] != '')]
+        for extracted_state, state_df in united_states.groupby(by='Place'):
             print('Storing lockdown data as a dataframe for', extracted_state)
-            self._file_storage.store_processed_df_as_file(f'lockdown_data/{extracted_state}.csv', df)
+            state_df = state_df[['Date', 'InLockdown']].assign(State=extracted_state)
+            self._file_storage.store_processed_df_as_file(f'lockdown_data/{extracted_state}.csv', state_df)
+
+    def __get_date_grid(self, granularity):
+        """Gets the dates the lockdowns are expanded against
+
+        Parameters
+        ----------
+        :param granularity: String, Required
+            Whether to use the first day of each month ('month') or every day ('day')
+
+        ----------
+        """
+        if granularity == 'day':
+            return self._covid_date_range
+        if granularity == 'month':
+            return self._covid_date_range[self._covid_date_range.day == 1]
+        raise ValueError(f'Unknown granularity {granularity}, expected month or day')
+
+    def expand_lockdowns(self, df, dates):
+        """Determines whether each place was in lockdown on each date
+
+        Every lockdown is compared to every date in one broadcast, and the lockdowns of a place are combined with
+        a reduction over its rows.
+
+        Parameters
+        ----------
+        :param df: pd.DataFrame, Required
+            The lockdowns, with the Country, Place, StartDate and EndDate of each
+        :param dates: pd.DatetimeIndex, Required
+            The dates the lockdowns are expanded against
+
+        ----------
+
+        Returns
+        -------
+        :return: pd.DataFrame
+            The Date, InLockdown, Country and Place of every place and date, sorted by country, place and date,
+            where country wide lockdowns have an empty place, as in the lockdown interval index
+
+        -------
+        """
+        intervals = df[['Country', 'Place', 'StartDate', 'EndDate']].fillna({'Place': ''})
+        intervals = intervals.sort_values(by=['Country', 'Place'], kind='stable')
+        if len(intervals) == 0:
+            return pd.DataFrame(columns=['Date', 'InLockdown', 'Country', 'Place'])
+
+        grid = dates.to_numpy()
+        # Lockdowns missing a date never match, since comparisons with NaT are false, so open ended lockdowns are
+        # never in lockdown
+        in_lockdown = ((intervals['StartDate'].to_numpy()[:, None] <= grid[None, :]) &
+                       (grid[None, :] <= intervals['EndDate'].to_numpy()[:, None]))
+        place_codes, places = pd.MultiIndex.from_frame(intervals[['Country', 'Place']]).factorize()
+        first_rows = np.flatnonzero(np.r_[True, place_codes[1:] != place_codes[:-1]])
+        place_in_lockdown = np.logical_or.reduceat(in_lockdown, first_rows, axis=0)
+
+        return pd.DataFrame({
+            'Date': np.tile(dates.strftime('%Y-%m-%d'), len(places)),
+            'InLockdown': place_in_lockdown.ravel(),
+            'Country': np.repeat(places.get_level_values(0), len(grid)),
+            'Place': np.repeat(places.get_level_values(1), len(grid))
+        })
 
     def store_processed_data(self):
         """Stores the processed data in S3"""
-        processed_files = list(glob.iglob(f'{self._file_storage.get_processed_base_path()}/lockdown_data/*.csv'))
+        processed_data_folder = f'{self._file_storage.get_processed_base_path()}/lockdown_data/'
+        processed_files = list(glob.iglob(f'{processed_data_folder}**/*.csv', recursive=True))
         for file in processed_files:
             print('Processing and storing in s3', file)
-            filename = os.path.basename(file).strip()
+            filename = os.path.relpath(file, processed_data_folder).strip()
             lockdown_data = pd.read_csv(file, index_col=False)
             print('Attempting to upload processed lockdown data to s3')
             self._s3.upload_df(lockdown_data, f'lockdown_data/{filename}', S3Api.S3Location.PROCESSED_DATA)
@@ -1,6 +1,6 @@
 from dotenv import load_dotenv
 from DataSourcingFactory import DataSourcingFactory
-from CustomSearchData import CustomSearch
+import sys
 
 load_dotenv()
 factory = DataSourcingFactory()
@@ -26,14 +26,14 @@ def print_menu():
     print('[4] Retrieve raw household food security survey data for the global countries.')
     print('[5] Process raw household food security survey data for the global countries.')
     print('[6] Retrieve raw world development indicator data.')
+    print('[7] Retrieve raw global covid lockdown data.')
     print('[q] Quit the program.')
     print('----------------')
 
 
 if __name__ == '__main__':
-    # print('Welcome to the data sourcing program. What would you like to do?')
-    # main()
-    CustomSearch().search()
-
-
-
+    if '--import-times' in sys.argv:
+        # Measures the cold import time of each command against its budget, failing if any is over
+        sys.exit(0 if factory.report_import_times() else 1)
+    print('Welcome to the data sourcing program. What would you like to do?')
+    main()
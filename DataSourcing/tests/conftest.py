@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules import each other from the DataSourcing directory, and the custom search modules from their own
+# directory, as when they are run from them
+DATA_SOURCING_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [DATA_SOURCING_PATH, os.path.join(DATA_SOURCING_PATH, 'custom_search')]
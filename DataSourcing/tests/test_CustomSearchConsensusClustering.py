@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN, AgglomerativeClustering, KMeans
+from sklearn.datasets import make_blobs
+from sklearn.metrics import adjusted_rand_score
+from CustomSearchConsensusClustering import CustomSearchConsensusClustering
+
+CENTERS = [(-10, -10), (-10, 10), (10, -10), (10, 10)]
+
+
+@pytest.mark.parametrize('centers, cluster_std, random_state', [(CENTERS, 1.5, 0), (4, 1.0, 1), (4, 1.0, 2)])
+def test_cluster_recovers_separable_blobs(centers, cluster_std, random_state):
+    documents, blobs = make_blobs(n_samples=3000, centers=centers, cluster_std=cluster_std,
+                                  random_state=random_state)
+    # Most labelings split or join the blobs, as when k is searched over a range
+    labelings = [KMeans(n_clusters=k, n_init=1, random_state=0).fit_predict(documents) for k in range(3, 11)]
+    labelings += [AgglomerativeClustering(n_clusters=k).fit_predict(documents) for k in range(3, 11)]
+    labelings.append(DBSCAN(eps=0.5).fit_predict(documents))
+
+    consensus_labels = CustomSearchConsensusClustering().cluster(documents, labelings)
+
+    assert adjusted_rand_score(blobs, consensus_labels) > 0.9
+    assert np.unique(consensus_labels[consensus_labels >= 0]).shape[0] == 4
+
+
+def test_cluster_labels_tiny_clusters_as_noise():
+    groups = np.repeat([0, 1], 100)
+    # The last document is rarely clustered with either group, so it only joins one below most thresholds
+    stray_labels = [0, 0, 0, 1, 1, -1, -1, -1, -1, -1]
+    labelings = [np.append(groups, stray_label) for stray_label in stray_labels]
+
+    consensus_labels = CustomSearchConsensusClustering(number_of_restarts=0).cluster(None, labelings)
+
+    assert consensus_labels[-1] == -1
+    assert adjusted_rand_score(groups, consensus_labels[:-1]) == 1.0
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+from FileStorage import FileStorage
+from wdi_indicators.WDIIndicators import WDIIndicators
+
+COUNTRIES = 6
+# More indicators than the 1024 partitions pyarrow writes by default, as in the real wdi csv
+INDICATORS = 1100
+YEARS = [str(year) for year in range(2000, 2006)]
+
+
+def make_wdi_csv(path):
+    """Writes a wdi csv ordered by country then indicator, ending each row with a comma like the real file"""
+    rng = np.random.default_rng(0)
+    rows = []
+    for country in range(COUNTRIES):
+        for indicator in range(INDICATORS):
+            values = rng.normal(size=len(YEARS))
+            # The last country has every year, so the melt of the last chunk has no missing values to drop
+            if country < COUNTRIES - 1:
+                values[rng.random(len(YEARS)) < 0.3] = np.nan
+            rows.append([f'Country {country}', f'C{country:02d}', f'Indicator {indicator}', f'IND.{indicator:04d}',
+                         *values])
+    df = pd.DataFrame(rows, columns=['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code', *YEARS])
+    df['Unnamed: 10'] = np.nan
+    df.to_csv(path, index=False)
+    return df.drop(columns=['Unnamed: 10'])
+
+
+def test_convert_wdi_data_writes_every_indicator_partition(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    wdi_df = make_wdi_csv(tmp_path / 'WDIData.csv')
+    wdi_indicators = WDIIndicators(FileStorage(), None)
+
+    # Every chunk covers more indicators than pyarrow writes by default
+    wdi_indicators.convert_wdi_data(pd.read_csv(tmp_path / 'WDIData.csv', chunksize=2000))
+
+    wide_df = pd.read_csv(tmp_path / 'raw_data/wdi_data/wdi_data.csv')
+    pd.testing.assert_frame_equal(wide_df, wdi_df)
+
+    dataset_path = tmp_path / 'raw_data/wdi_data/wdi_dataset'
+    # Each indicator stays in one file, rather than one file per chunk
+    assert sorted(file.name for file in dataset_path.glob('*/*')) == ['part-0.parquet'] * INDICATORS
+    long_df = ds.dataset(dataset_path, format='parquet', partitioning='hive').to_table().to_pandas()
+    expected = (wdi_df.melt(id_vars=['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code'],
+                            var_name='Year', value_name='Value')
+                .dropna(subset=['Value'])
+                .astype({'Year': 'int16'}))
+    columns = ['Country Code', 'Indicator Code', 'Year', 'Value']
+    actual = long_df.astype({'Country Code': str, 'Indicator Code': str})[columns]
+    actual = actual.sort_values(by=columns[:3]).reset_index(drop=True)
+    expected = expected[columns].sort_values(by=columns[:3]).reset_index(drop=True)
+    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    assert long_df['Year'].dtype == np.int16
+
+
+def test_convert_wdi_data_removes_the_partitions_of_dropped_indicators(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    wdi_df = make_wdi_csv(tmp_path / 'WDIData.csv')
+    wdi_indicators = WDIIndicators(FileStorage(), None)
+    wdi_indicators.convert_wdi_data([wdi_df])
+
+    kept_df = wdi_df[wdi_df['Indicator Code'] != 'IND.0000']
+    wdi_indicators.convert_wdi_data([kept_df.iloc[:3000], kept_df.iloc[3000:]])
+
+    dataset_path = tmp_path / 'raw_data/wdi_data/wdi_dataset'
+    partitions = sorted(partition.name for partition in dataset_path.iterdir())
+    assert partitions == sorted(f'Indicator Code={code}' for code in kept_df['Indicator Code'].unique())
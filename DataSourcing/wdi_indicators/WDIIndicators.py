@@ -1,11 +1,30 @@
 from zipfile import ZipFile
 from urllib.request import urlopen
-from io import BytesIO
 import pandas as pd
+import shutil
+import glob
+import os
+from wdi_indicators.WDIIndicatorsStore import WDIIndicatorsStore
+
+# Constants
+# The number of bytes of the zip downloaded at a time
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# The number of rows of the wdi csv parsed at a time
+CSV_CHUNK_SIZE = 20000
+# The columns identifying each row of the wdi csv, every other column is a year
+ID_COLUMNS = ['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code']
+# The most indicators the parquet dataset is partitioned into, the wdi data has about 1,450
+MAX_INDICATORS = 4096
 
 
 class WDIIndicators:
-    """Retrieve WDI Indicators from the World Bank"""
+    """
+    Retrieve WDI Indicators from the World Bank
+
+    The zip is spooled to disk and the csv inside it is parsed in chunks, so the zip, csv and data frame are never
+    held in memory at once. Each chunk is appended to the wide csv and melted into long (country, indicator, year,
+    value) records for a parquet dataset partitioned by indicator.
+    """
 
     def __init__(self, file_storage, s3_api):
         """ Create a new instance of the WDIIndicators class
@@ -23,17 +42,118 @@ class WDIIndicators:
         self._s3_api = s3_api
         self._base_url = 'https://databank.worldbank.org/data/download/WDI_csv.zip'
         self._wdi_data = 'WDIData.csv'
+        self._wdi_folder = f'{file_storage.get_raw_base_path()}/wdi_data/'
+        self._zip_file = f'{self._wdi_folder}WDI_csv.zip'
+        self._wide_output_file = f'{self._wdi_folder}wdi_data.csv'
+        self._dataset_path = f'{self._wdi_folder}wdi_dataset/'
 
     def retrieve_wdi_indicator_data(self):
         """Retrieves the raw wdi indicator data"""
+        self.download_zip()
+        with ZipFile(self._zip_file, 'r') as zip:
+            with zip.open(self._wdi_data) as wdi_csv:
+                self.convert_wdi_data(pd.read_csv(wdi_csv, chunksize=CSV_CHUNK_SIZE))
+        # The series lookups are served from the store, so it is rebuilt from the new wide csv
+        WDIIndicatorsStore(self._file_storage).build()
+
+    def download_zip(self):
+        """Streams the wdi zip to disk in chunks"""
         print('Getting zip file from url', self._base_url)
-        with urlopen(self._base_url) as zip_response:
-            with ZipFile(BytesIO(zip_response.read()), 'r') as zip:
-                try:
-                    df = pd.read_csv(zip.open(self._wdi_data))
-                    print(df.head())
-                    output_file_name = '../raw_data/wdi_data/wdi_data.csv'
-                    self._file_storage.create_directory_if_not_exists(output_file_name)
-                    df.to_csv(output_file_name)
-                except Exception as error:
-                    print('An error occurred reading', self._wdi_data, error)
\ No newline at end of file
+        self._file_storage.create_directory_if_not_exists(self._zip_file)
+        partial_file = f'{self._zip_file}.part'
+        with urlopen(self._base_url) as zip_response, open(partial_file, 'wb') as f:
+            shutil.copyfileobj(zip_response, f, DOWNLOAD_CHUNK_SIZE)
+        # Only a complete download replaces the previous zip
+        os.replace(partial_file, self._zip_file)
+        print('Saved zip file to', self._zip_file)
+
+    def convert_wdi_data(self, chunks):
+        """Writes the chunks of the wdi csv to the wide csv and the long parquet dataset
+
+        Parameters
+        ----------
+        :param chunks: Iterable, Required
+            The chunks of the wdi csv, as data frames
+
+        ----------
+        """
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+
+        schema = pa.schema([('Country Name', pa.dictionary(pa.int32(), pa.string())),
+                            ('Country Code', pa.dictionary(pa.int32(), pa.string())),
+                            ('Indicator Name', pa.dictionary(pa.int32(), pa.string())),
+                            ('Indicator Code', pa.string()),
+                            ('Year', pa.int16()),
+                            ('Value', pa.float64())])
+        partitioning = ds.partitioning(pa.schema([('Indicator Code', pa.string())]), flavor='hive')
+        # Every chunk covers every indicator, so the file of each indicator is kept open until the last chunk
+        self.__raise_open_file_limit(MAX_INDICATORS)
+        written_partitions = set()
+        ds.write_dataset(self.__iterate_long_records(chunks, schema), self._dataset_path, schema=schema,
+                         format='parquet', partitioning=partitioning, basename_template='part-{i}.parquet',
+                         existing_data_behavior='delete_matching', max_partitions=MAX_INDICATORS,
+                         max_open_files=MAX_INDICATORS,
+                         file_visitor=lambda written_file: written_partitions.add(
+                             os.path.normpath(os.path.dirname(written_file.path))))
+        # Only the partitions written now are replaced, so those of indicators dropped from the wdi are removed
+        for partition in glob.glob(f'{self._dataset_path}*/'):
+            if os.path.normpath(partition) not in written_partitions:
+                print('Removing the partition of a dropped indicator', partition)
+                shutil.rmtree(partition)
+        print('Saved the wide wdi data to', self._wide_output_file, 'and the long wdi data to', self._dataset_path)
+
+    def __iterate_long_records(self, chunks, schema):
+        """Appends each chunk to the wide csv and melts it into long records
+
+        Parameters
+        ----------
+        :param chunks: Iterable, Required
+            The chunks of the wdi csv, as data frames
+        :param schema: pa.Schema, Required
+            The schema of the long records
+
+        ----------
+        """
+        import pyarrow as pa
+
+        self._file_storage.create_directory_if_not_exists(self._wide_output_file)
+        number_of_rows = 0
+        for chunk_number, chunk in enumerate(chunks):
+            # The csv ends every row with a comma, which pandas reads as an unnamed empty column
+            chunk = chunk.loc[:, ~chunk.columns.str.startswith('Unnamed')]
+            if chunk_number == 0:
+                print(chunk.head())
+            chunk.to_csv(self._wide_output_file, mode='w' if chunk_number == 0 else 'a', header=chunk_number == 0,
+                         index=False)
+
+            long_chunk = chunk.melt(id_vars=ID_COLUMNS, var_name='Year', value_name='Value').dropna(subset=['Value'])
+            long_chunk['Year'] = long_chunk['Year'].astype('int16')
+            # Grouped by indicator, so each partition receives one contiguous slice of the chunk
+            long_chunk = long_chunk.sort_values(by='Indicator Code', kind='stable')
+            number_of_rows += chunk.shape[0]
+            print('Converted', number_of_rows, 'rows of the wdi data')
+            # The string columns of a data frame can be chunked, which only a table accepts
+            long_table = pa.Table.from_pandas(long_chunk, schema=schema, preserve_index=False)
+            yield from long_table.combine_chunks().to_batches()
+
+    @staticmethod
+    def __raise_open_file_limit(open_files):
+        """Raises the limit of open files of the process, as far as the hard limit allows
+
+        Parameters
+        ----------
+        :param open_files: Number, Required
+            The number of files the dataset keeps open, besides the files already open
+
+        ----------
+        """
+        import resource
+
+        soft_limit, hard_limit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        # The csv, zip and python itself hold some files open too
+        wanted_limit = open_files + 64
+        if hard_limit != resource.RLIM_INFINITY:
+            wanted_limit = min(wanted_limit, hard_limit)
+        if soft_limit != resource.RLIM_INFINITY and soft_limit < wanted_limit:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (wanted_limit, hard_limit))
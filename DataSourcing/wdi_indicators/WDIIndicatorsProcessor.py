@@ -1,14 +1,23 @@
-import pandas as pd
-import re
-import matplotlib.pyplot as plt
+from wdi_indicators.WDIIndicatorsStore import WDIIndicatorsStore
 
 
 class WDIIndicatorsProcessor:
     """Retrieve WDI Indicators from the World Bank"""
 
-    def __init__(self):
-        """Creates a new instance of the WDIIndicatorsProcessor class"""
-        self._wdi_data = 'raw_data/wdi_data/wdi_data.csv'
+    def __init__(self, wdi_store=None):
+        """Creates a new instance of the WDIIndicatorsProcessor class
+
+        Parameters
+        ----------
+        :param wdi_store: WDIIndicatorsStore, Optional
+            The store the wdi series are read from (defaults to the store in the raw data directory)
+
+        ----------
+        """
+        if wdi_store is None:
+            from FileStorage import FileStorage
+            wdi_store = WDIIndicatorsStore(FileStorage())
+        self._wdi_store = wdi_store
 
     def visualize_wdi_data(self, statistic, country_code):
         """Simple visualization of wdi indicator data.
@@ -16,11 +25,9 @@ class WDIIndicatorsProcessor:
         For example, to see a chart of world population over time, the statistic would be SP.POP.TOTL and
         the country_code would be WLD
         """
-        df = pd.read_csv(self._wdi_data)
-        row = df.loc[(df['Country Code'] == country_code) & (df['Indicator Code'] == statistic)]
-        year_re = re.compile(r'[0-9]{4}')
-        x_values = [year for year in row.columns if bool(year_re.match(year))]
-        y_values = [row[year].values[0] for year in x_values]
+        import matplotlib.pyplot as plt
+        x_values = [str(year) for year in self._wdi_store.get_years()]
+        y_values = self._wdi_store.get_series(country_code, statistic)
 
         plt.plot(x_values, y_values)
         plt.tick_params(axis='x', labelbottom=False)
@@ -31,4 +38,4 @@ class WDIIndicatorsProcessor:
 
 
 if __name__ == '__main__':
-    WDIIndicatorsProcessor().visualize_wdi_data('SP.POP.TOTL', 'WLD')
\ No newline at end of file
+    WDIIndicatorsProcessor().visualize_wdi_data('SP.POP.TOTL', 'WLD')
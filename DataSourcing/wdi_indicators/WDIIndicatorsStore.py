@@ -0,0 +1,233 @@
+from numpy.lib.format import open_memmap
+import numpy as np
+import pandas as pd
+import json
+import os
+
+# Constants
+# The number of rows of the wide wdi csv read at a time when building the store
+CSV_CHUNK_SIZE = 20000
+# The columns identifying each row of the wide wdi csv, every other column is a year
+ID_COLUMNS = ['Country Name', 'Country Code', 'Indicator Name', 'Indicator Code']
+
+
+class WDIIndicatorsStore:
+    """
+    A memory mapped cube of the wdi data, indexed by country code, indicator code and year.
+
+    The values are kept in a countries x indicators x years .npy file that is memory mapped when first used, so a
+    query only reads the pages of the series it asks for. The codes and names of the countries and indicators are
+    kept in a metadata file and loaded into dictionaries mapping each code to its position in the cube. The store
+    is rebuilt from the wide wdi csv whenever the csv changes.
+    """
+
+    def __init__(self, file_storage, store_location='wdi_data/wdi_store/', wdi_data='wdi_data/wdi_data.csv'):
+        """ Create a new instance of the WDIIndicatorsStore class
+
+        Parameters
+        ----------
+        :param file_storage: FileStorage, Required
+            The file storage class used to store raw/processed data
+        :param store_location: String, Optional
+            The directory of the store, in the raw data directory
+        :param wdi_data: String, Optional
+            The wide wdi csv the store is built from, in the raw data directory
+
+        ----------
+        """
+        self._file_storage = file_storage
+        self._store_path = f'{file_storage.get_raw_base_path()}/{store_location}'
+        self._wdi_data = f'{file_storage.get_raw_base_path()}/{wdi_data}'
+        self._cube_file = f'{self._store_path}values.npy'
+        self._metadata_file = f'{self._store_path}metadata.json'
+        self._values = None
+        self._metadata = None
+        self._country_index = None
+        self._indicator_index = None
+
+    def build(self):
+        """Builds the cube from the wide wdi csv in two passes, first finding the countries and indicators"""
+        print('Building the wdi store from', self._wdi_data)
+        ids = pd.read_csv(self._wdi_data, usecols=ID_COLUMNS)
+        countries = ids.drop_duplicates('Country Code').sort_values(by='Country Code')
+        indicators = ids.drop_duplicates('Indicator Code').sort_values(by='Indicator Code')
+        country_index = pd.Index(countries['Country Code'])
+        indicator_index = pd.Index(indicators['Indicator Code'])
+        header = pd.read_csv(self._wdi_data, nrows=0).columns
+        # Csvs written with an index or a trailing comma have unnamed columns, which are not years
+        years = [column for column in header if column.isdigit()]
+
+        self._file_storage.create_directory_if_not_exists(self._cube_file)
+        temporary_file = f'{self._store_path}values.tmp.npy'
+        values = open_memmap(temporary_file, mode='w+', dtype=np.float64,
+                             shape=(len(country_index), len(indicator_index), len(years)))
+        values[:] = np.nan
+        for chunk in pd.read_csv(self._wdi_data, chunksize=CSV_CHUNK_SIZE):
+            values[country_index.get_indexer(chunk['Country Code']),
+                   indicator_index.get_indexer(chunk['Indicator Code'])] = chunk[years].to_numpy(dtype=np.float64)
+        values.flush()
+        del values
+        os.replace(temporary_file, self._cube_file)
+
+        stat = os.stat(self._wdi_data)
+        metadata = {
+            'source': {'size': stat.st_size, 'modified': stat.st_mtime_ns},
+            'countries': countries[['Country Code', 'Country Name']].values.tolist(),
+            'indicators': indicators[['Indicator Code', 'Indicator Name']].values.tolist(),
+            'years': [int(year) for year in years]
+        }
+        # The metadata is written last, so a store with metadata always has a complete cube
+        with open(f'{self._metadata_file}.tmp', 'w') as f:
+            json.dump(metadata, f)
+        os.replace(f'{self._metadata_file}.tmp', self._metadata_file)
+        self._values = None
+        print('Built the wdi store with', len(country_index), 'countries,', len(indicator_index), 'indicators and',
+              len(years), 'years')
+
+    def __load(self):
+        """Memory maps the cube, building the store first if it is missing or older than the wide wdi csv"""
+        if self._values is not None:
+            return
+        if not self.__is_up_to_date():
+            self.build()
+        with open(self._metadata_file, 'r') as f:
+            self._metadata = json.load(f)
+        self._country_index = {code: i for i, (code, _) in enumerate(self._metadata['countries'])}
+        self._indicator_index = {code: i for i, (code, _) in enumerate(self._metadata['indicators'])}
+        self._values = np.load(self._cube_file, mmap_mode='r')
+
+    def __is_up_to_date(self):
+        """Determines whether the store was built from the current wide wdi csv"""
+        if not os.path.exists(self._metadata_file):
+            return False
+        if not os.path.exists(self._wdi_data):
+            return True
+        with open(self._metadata_file, 'r') as f:
+            source = json.load(f)['source']
+        stat = os.stat(self._wdi_data)
+        return source['size'] == stat.st_size and source['modified'] == stat.st_mtime_ns
+
+    def get_years(self):
+        """Gets the years of the series"""
+        self.__load()
+        return np.array(self._metadata['years'])
+
+    def get_countries(self):
+        """Gets the code and name of every country, in the order of the cube"""
+        self.__load()
+        return self._metadata['countries']
+
+    def get_indicators(self):
+        """Gets the code and name of every indicator, in the order of the cube"""
+        self.__load()
+        return self._metadata['indicators']
+
+    def get_series(self, country_code, indicator_code):
+        """Gets the values of an indicator for a country
+
+        Parameters
+        ----------
+        :param country_code: String, Required
+            The country code, such as WLD
+        :param indicator_code: String, Required
+            The indicator code, such as SP.POP.TOTL
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            The value of each year, aligned with get_years, where missing values are NaN
+
+        -------
+        """
+        self.__load()
+        return np.array(self._values[self.__position(self._country_index, country_code),
+                                     self.__position(self._indicator_index, indicator_code)])
+
+    def get_indicator(self, indicator_code, country_codes=None):
+        """Gets the values of an indicator for many countries
+
+        Parameters
+        ----------
+        :param indicator_code: String, Required
+            The indicator code
+        :param country_codes: List, Optional
+            The country codes (defaults to every country)
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            A countries x years array, aligned with the country codes and get_years
+
+        -------
+        """
+        return self.query(country_codes=country_codes, indicator_codes=[indicator_code])[:, 0, :]
+
+    def get_country(self, country_code, indicator_codes=None):
+        """Gets the values of many indicators for a country
+
+        Parameters
+        ----------
+        :param country_code: String, Required
+            The country code
+        :param indicator_codes: List, Optional
+            The indicator codes (defaults to every indicator)
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            An indicators x years array, aligned with the indicator codes and get_years
+
+        -------
+        """
+        return self.query(country_codes=[country_code], indicator_codes=indicator_codes)[0]
+
+    def query(self, country_codes=None, indicator_codes=None):
+        """Gets the values of many indicators for many countries
+
+        Parameters
+        ----------
+        :param country_codes: List, Optional
+            The country codes (defaults to every country)
+        :param indicator_codes: List, Optional
+            The indicator codes (defaults to every indicator)
+
+        ----------
+
+        Returns
+        -------
+        :return: np.array
+            A countries x indicators x years array, aligned with the codes and get_years
+
+        -------
+        """
+        self.__load()
+        countries = slice(None) if country_codes is None else \
+            [self.__position(self._country_index, code) for code in country_codes]
+        indicators = slice(None) if indicator_codes is None else \
+            [self.__position(self._indicator_index, code) for code in indicator_codes]
+        if isinstance(countries, list) and isinstance(indicators, list):
+            return np.array(self._values[np.ix_(countries, indicators)])
+        return np.array(self._values[countries][:, indicators])
+
+    @staticmethod
+    def __position(index, code):
+        """Gets the position of a code in the cube
+
+        Parameters
+        ----------
+        :param index: Dictionary, Required
+            The position of each code
+        :param code: String, Required
+            The country or indicator code
+
+        ----------
+        """
+        if code not in index:
+            raise KeyError(f'{code} is not in the wdi store')
+        return index[code]